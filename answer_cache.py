@@ -0,0 +1,178 @@
+"""
+Cache of assistant answers for repeated questions.
+
+During registration week hundreds of students ask the same handful of
+questions ("what's the AP limit", "how do I request courses in IC"), and
+each one used to cost a full assistant run. Answers are cached per grade
+under a normalized form of the question (lowercased, punctuation and
+stopwords dropped, plurals folded); a new question is a hit when its word
+set is close enough (Jaccard >= SIMILARITY_THRESHOLD) to a cached one for
+the same grade.
+
+A normal run carries the student's [User Context: ...] and the assistant
+greets them by name and draws on their bio, so its answer can't be shown to
+anyone else. Questions the cache accepts are instead asked with only the
+grade as context plus SHARED_ANSWER_INSTRUCTIONS, and only those answers are
+stored; main.py adds the student's greeting when it shows one.
+
+Entries expire after TTL_SECONDS and the least recently used are dropped
+past MAX_ENTRIES. The whole cache is cleared when the ingest scripts
+rewrite file_id_mapping.json or search_index.bin, so answers never outlive
+the documents they were based on. The cache is per process, like
+DocumentIndex.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import NamedTuple
+
+from doc_index import MAPPING_PATH
+from search_index import INDEX_PATH, tokenize
+
+MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_SIZE', '500'))
+TTL_SECONDS = int(os.getenv('ANSWER_CACHE_TTL', str(6 * 60 * 60)))
+SIMILARITY_THRESHOLD = float(os.getenv('ANSWER_CACHE_SIMILARITY', '0.8'))
+# Longer messages are specific to one student and not worth caching
+MAX_QUESTION_CHARS = 300
+MIN_TERMS = 2
+
+SHARED_ANSWER_INSTRUCTIONS = (
+    "This answer will also be shown to other students in the same grade. Don't greet or address "
+    "the student by name and don't refer to a bio or interests; answer for any student in this grade.")
+
+# Questions that lean on earlier turns ("what about for juniors?") can't be answered from cache
+FOLLOW_UP_PREFIXES = ('what about', 'how about', 'and ', 'also ', 'but ', 'so ', 'then ', 'why')
+FOLLOW_UP_WORDS = frozenset('it that this those these they them he she above else'.split())
+
+
+class CachedAnswer(NamedTuple):
+    text: str          # raw assistant text, replayed into the thread
+    html: str          # rendered response shown in the chat window
+    created: float
+
+
+def normalize(question):
+    """Set of content words; plurals folded so "classes" matches "class"."""
+    terms = set()
+    for term in tokenize(question):
+        if len(term) > 3 and term.endswith('es') and term[:-2].endswith(('ss', 'sh', 'ch', 'x')):
+            term = term[:-2]
+        elif len(term) > 3 and term.endswith('s') and not term.endswith('ss'):
+            term = term[:-1]
+        terms.add(term)
+    return frozenset(terms)
+
+
+def is_cacheable(question):
+    text = ' '.join(question.lower().split())
+    if not text or len(text) > MAX_QUESTION_CHARS or text.startswith(FOLLOW_UP_PREFIXES):
+        return False
+    words = set(text.replace('?', ' ').replace(',', ' ').split())
+    return not (words & FOLLOW_UP_WORDS) and len(normalize(text)) >= MIN_TERMS
+
+
+def grade_key(current_grade=None, class_of=None, today=None):
+    """The student's grade, from the profile or else from the graduation year."""
+    if current_grade:
+        return str(current_grade)
+    if not class_of:
+        return ''
+    today = today or date.today()
+    # A class graduates in June of its senior year
+    school_year_end = today.year + (1 if today.month >= 7 else 0)
+    return str(12 - (int(class_of) - school_year_end))
+
+
+def _numbers(terms):
+    return {term for term in terms if term[0].isdigit()}
+
+
+def _similarity(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+class AnswerCache:
+    """LRU + TTL cache of unpersonalized answers keyed by (grade, normalized question)."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS, threshold=SIMILARITY_THRESHOLD,
+                 watch_paths=(MAPPING_PATH, INDEX_PATH)):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.watch_paths = watch_paths
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # (grade, terms) -> CachedAnswer, oldest use first
+        self._generation = self._current_generation()
+        self.hits = 0
+        self.misses = 0
+
+    def _current_generation(self):
+        stamps = []
+        for path in self.watch_paths:
+            try:
+                stamps.append(os.stat(path).st_mtime_ns)
+            except FileNotFoundError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    def _check_generation_locked(self):
+        generation = self._current_generation()
+        if generation != self._generation:
+            if self._entries:
+                print(f"School documents changed; dropping {len(self._entries)} cached answers")
+            self._entries.clear()
+            self._generation = generation
+
+    def accepts(self, question):
+        """Whether an answer to this question would be stored, i.e. the run should be unpersonalized."""
+        return self.max_entries > 0 and is_cacheable(question)
+
+    def get(self, question, grade):
+        """Cached answer for this question (or a near-duplicate) and grade, else None."""
+        if not is_cacheable(question):
+            return None
+        terms = normalize(question)
+        now = time.time()
+        with self._lock:
+            self._check_generation_locked()
+            key = (grade, terms)
+            if key not in self._entries:
+                best, best_score = None, self.threshold
+                numbers = _numbers(terms)
+                for candidate in self._entries:
+                    # "Algebra 1" and "Algebra 2" are different questions however similar the rest is
+                    if candidate[0] == grade and _numbers(candidate[1]) == numbers:
+                        score = _similarity(terms, candidate[1])
+                        if score >= best_score:
+                            best, best_score = candidate, score
+                key = best
+            entry = self._entries.get(key) if key else None
+            if entry is not None and now - entry.created > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, question, grade, text, html):
+        if not is_cacheable(question) or not text:
+            return
+        with self._lock:
+            self._check_generation_locked()
+            key = (grade, normalize(question))
+            self._entries[key] = CachedAnswer(text, html, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
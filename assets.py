@@ -0,0 +1,185 @@
+"""
+Fingerprinted, precompressed copies of static/ for long-lived caching.
+
+School Chromebooks load the chat page over slow shared Wi-Fi, and the
+scripts and stylesheets were sent raw with no way to cache them safely.
+`python assets.py build` minifies each JS and CSS file, writes it to
+static/dist/ under a name containing a hash of its contents
+("script.3f9a1c0b2e.js"), next to .gz (and, when the brotli package is
+installed, .br) copies, and records logical -> hashed names in
+static/dist/manifest.json. Templates refer to assets through
+asset_url('script.js'), which resolves through the manifest, so a changed
+file gets a new URL and /assets/ can serve everything with a one-year
+immutable Cache-Control. Without a build, asset_url falls back to the
+plain /static/ file.
+
+The minifiers are deliberately conservative: CSS loses comments and
+redundant whitespace; JS only loses indentation, blank lines and
+whole-line // comments, so no statement boundaries change.
+
+Usage:
+    python assets.py build
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import threading
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+
+ASSET_EXTENSIONS = ('.js', '.css', '.png', '.svg', '.ico')
+COMPRESSIBLE_EXTENSIONS = ('.js', '.css', '.svg')
+HASH_CHARS = 10
+
+_CSS_COMMENT_OR_STRING = re.compile(r'/\*.*?\*/|("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')', re.S)
+_CSS_SPACE_AROUND = re.compile(r'\s*([{};,>])\s*')
+
+
+def minify_css(text):
+    strings = []
+
+    def keep(match):
+        # Comments go; strings are set aside so their contents are never touched
+        if match.group(1) is None:
+            return ' '
+        strings.append(match.group(1))
+        return f'\0{len(strings) - 1}\0'
+
+    text = _CSS_COMMENT_OR_STRING.sub(keep, text)
+    text = ' '.join(text.split())
+    text = _CSS_SPACE_AROUND.sub(r'\1', text)
+    text = re.sub(r':\s+', ':', text)
+    text = text.replace(';}', '}')
+    return re.sub(r'\0(\d+)\0', lambda m: strings[int(m.group(1))], text).strip()
+
+
+def minify_js(text):
+    lines, in_template = [], False
+    for line in text.splitlines():
+        if in_template:
+            # Whitespace inside a multi-line template literal is part of the string
+            lines.append(line)
+        else:
+            stripped = line.strip()
+            if stripped and not stripped.startswith('//'):
+                lines.append(stripped)
+        if line.count('`') % 2:
+            in_template = not in_template
+    return '\n'.join(lines) + '\n'
+
+
+def optimize_png(data):
+    """Losslessly recompressed PNG when Pillow is installed (it usually is, for reportlab)."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return data
+    out = io.BytesIO()
+    Image.open(io.BytesIO(data)).save(out, 'PNG', optimize=True)
+    return out.getvalue() if out.tell() < len(data) else data
+
+
+def _minify(name, data):
+    ext = os.path.splitext(name)[1]
+    if ext == '.css':
+        return minify_css(data.decode('utf-8')).encode('utf-8')
+    if ext == '.js':
+        return minify_js(data.decode('utf-8')).encode('utf-8')
+    if ext == '.png':
+        return optimize_png(data)
+    return data
+
+
+def _write(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def build(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    """Write fingerprinted assets and the manifest; remove outputs of older builds. Returns the manifest."""
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        print("brotli not installed; writing gzip variants only")
+    os.makedirs(dist_dir, exist_ok=True)
+    manifest, written, before, after = {}, set(), 0, 0
+    for name in sorted(os.listdir(static_dir)):
+        path = os.path.join(static_dir, name)
+        if not os.path.isfile(path) or not name.endswith(ASSET_EXTENSIONS):
+            continue
+        with open(path, 'rb') as f:
+            source = f.read()
+        data = _minify(name, source)
+        stem, ext = os.path.splitext(name)
+        hashed = f"{stem}.{hashlib.sha256(data).hexdigest()[:HASH_CHARS]}{ext}"
+        variants = {hashed: data}
+        if ext in COMPRESSIBLE_EXTENSIONS:
+            variants[hashed + '.gz'] = gzip.compress(data, compresslevel=9, mtime=0)
+            if brotli is not None:
+                variants[hashed + '.br'] = brotli.compress(data)
+        for variant, content in variants.items():
+            if not os.path.exists(os.path.join(dist_dir, variant)):
+                _write(os.path.join(dist_dir, variant), content)
+            written.add(variant)
+        manifest[name] = hashed
+        smallest = min(len(content) for content in variants.values())
+        before += len(source)
+        after += smallest
+        print(f"{name}: {len(source) / 1024:.1f} KB -> {smallest / 1024:.1f} KB ({hashed})")
+
+    _write(os.path.join(dist_dir, 'manifest.json'), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    for name in os.listdir(dist_dir):
+        if name != 'manifest.json' and name not in written:
+            os.remove(os.path.join(dist_dir, name))
+    print(f"{len(manifest)} assets, {before / 1024:.0f} KB -> {after / 1024:.0f} KB over the wire -> {dist_dir}")
+    return manifest
+
+
+_manifest = {}
+_manifest_mtime = None
+_lock = threading.Lock()
+
+
+def get_manifest(path=MANIFEST_PATH):
+    """logical name -> fingerprinted name, reloaded when a build rewrites it; {} without a build."""
+    global _manifest, _manifest_mtime
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return {}
+    with _lock:
+        if mtime != _manifest_mtime:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    _manifest = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error loading asset manifest: {e}")
+                _manifest = {}
+            _manifest_mtime = mtime
+        return _manifest
+
+
+def hashed_name(name):
+    """The fingerprinted file for a static asset, or None when it hasn't been built."""
+    return get_manifest().get(name)
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != 'build':
+        print('Usage: python assets.py build')
+        sys.exit(1)
+    build()
+
+
+if __name__ == '__main__':
+    main()
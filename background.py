@@ -0,0 +1,39 @@
+"""
+Small shared thread pool for work that should not hold up a response.
+
+Used for history backfill and other after-the-response bookkeeping. The
+pool is created lazily per process because gunicorn forks workers after
+main.py is imported.
+"""
+import os
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = int(os.getenv('BACKGROUND_WORKERS', '4'))
+
+_lock = threading.Lock()
+_executor = None
+_pid = None
+
+
+def _get_executor():
+    global _executor, _pid
+    with _lock:
+        if _executor is None or _pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='background')
+            _pid = os.getpid()
+        return _executor
+
+
+def _run(fn, args, kwargs):
+    try:
+        return fn(*args, **kwargs)
+    except Exception as e:
+        print(f"Background task {getattr(fn, '__name__', fn)} failed: {e}")
+        traceback.print_exc()
+
+
+def submit(fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) on the background pool and return the Future."""
+    return _get_executor().submit(_run, fn, args, kwargs)
@@ -0,0 +1,71 @@
+"""
+Micro-benchmark: renders per second for assistant Markdown.
+
+Compares the old per-call markdown.markdown() + regex citation strip with
+rendering.py's reused per-thread Markdown instance, both uncached and with
+the HTML cache warm (the /get_history reload case).
+
+Usage: python bench_markdown.py [seconds_per_case]
+"""
+import os
+import re
+import sys
+import time
+
+import markdown
+
+import rendering
+
+DOCS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'school_documents')
+SAMPLE_SOURCE = os.path.join(DOCS_DIR, 'DUSD Grades 9-12 Course Catalog 2026-27.md')
+OLD_EXTENSIONS = ['fenced_code', 'codehilite', 'nl2br', 'tables', 'sane_lists']
+
+
+def sample_replies(count=100, size=1500):
+    """Assistant-sized slices of real catalog Markdown, with citation markers mixed in."""
+    with open(SAMPLE_SOURCE, 'r', encoding='utf-8') as f:
+        text = f.read()
+    replies = []
+    step = max(len(text) // count, size)
+    for idx in range(count):
+        chunk = text[idx * step: idx * step + size]
+        replies.append(f"## Answer {idx}\n\n{chunk}【4:{idx}†source】\n\n- **Tip**: ask your counselor【4:0†source】")
+    return replies
+
+
+def old_render(text):
+    text = re.sub(r'【\d+:\d+†[^】]+】', '', text)
+    return markdown.markdown(text, extensions=OLD_EXTENSIONS)
+
+
+def run_case(name, fn, replies, seconds):
+    renders = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for reply in replies:
+            fn(reply)
+        renders += len(replies)
+    elapsed = time.perf_counter() - start
+    rate = renders / elapsed
+    print(f"{name:<32} {rate:>10.0f} renders/s")
+    return rate
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+
+    for size in (300, 1500):
+        replies = sample_replies(size=size)
+        mismatches = sum(old_render(r) != rendering.render_uncached(r) for r in replies)
+        print(f"{len(replies)} replies of ~{size} chars, {mismatches} output differences vs. old renderer")
+
+        baseline = run_case("markdown.markdown (before)", old_render, replies, seconds)
+        reused = run_case("reused instance, no cache", rendering.render_uncached, replies, seconds)
+        rendering.html_cache.clear()
+        cached = run_case("reused instance + LRU cache", rendering.render_markdown, replies, seconds)
+
+        print(f"reuse speedup: {reused / baseline:.1f}x, with warm cache: {cached / baseline:.0f}x\n")
+
+
+if __name__ == '__main__':
+    main()
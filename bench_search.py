@@ -0,0 +1,84 @@
+"""
+Calibration: local BM25 scores for typical and off-topic questions.
+
+main.py only adds local passages to a run when the best one scores at least
+LOCAL_CONTEXT_MIN_SCORE, and skips file_search when it scores at least
+LOCAL_ANSWER_MIN_SCORE. Both depend on the documents, so re-run this after
+the documents change much and set the two env vars from its output: the
+context floor just above the best off-topic score, the answer threshold
+where the best passage answers the question by itself. A "?" marks an
+on-topic question whose best passage isn't from the expected document.
+
+Usage: python bench_search.py
+"""
+import sys
+
+import search_index
+
+# Question -> start of the document that answers it
+ON_TOPIC = {
+    "What math class should I take after Algebra 1?": "DUSD Grades 9-12 Course Catalog",
+    "How do I register for courses in Infinite Campus?": "2026 - 2027 EHS How to Register",
+    "Can I take AP Computer Science as a sophomore?": "Emerald High School_ Sophomore",
+    "How many AP classes can I take at once?": "AP_Rule_Change",
+    "What are the prerequisites for AP Calculus AB?": "DUSD Grades 9-12 Course Catalog",
+    "What science classes can a freshman take?": "",
+    "How do I take a course outside of school like community college?": "",
+    "What is the difference between Physics and AP Physics 1?": "DUSD Grades 9-12 Course Catalog",
+    "Is Chemistry or Biology better for 10th grade?": "",
+    "What classes do seniors need to graduate?": "",
+    "How many credits do I need to graduate?": "",
+    "Can I drop a class after the semester starts?": "DUSD Grades 9-12 Course Catalog",
+    "What world languages are offered?": "DUSD Grades 9-12 Course Catalog",
+    "What is ROP?": "",
+}
+OFF_TOPIC = [
+    "hi",
+    "thanks!",
+    "What's the weather like today?",
+    "Can you help me write an essay about my summer?",
+    "I'm stressed about school",
+    "What should I do with my life?",
+    "tell me a joke",
+    "How do I get into Stanford?",
+    "What's a good college major for robotics?",
+]
+
+
+def top_passage(index, question):
+    passages = index.search(question, k=1)
+    return passages[0] if passages else None
+
+
+def main():
+    index = search_index.get_index()
+    if index is None:
+        print("No search index; run: python search_index.py build")
+        sys.exit(1)
+
+    print(f"{'score':>6}  question -> best passage")
+    on_scores = []
+    for question, expected in ON_TOPIC.items():
+        passage = top_passage(index, question)
+        score = passage.score if passage else 0.0
+        right = passage is not None and passage.source.startswith(expected)
+        on_scores.append((score, right))
+        print(f"{score:6.2f}  {'  ' if right else '? '}{question} -> {passage.label() if passage else '-'}")
+    print()
+    off_scores = []
+    for question in OFF_TOPIC:
+        passage = top_passage(index, question)
+        off_scores.append(passage.score if passage else 0.0)
+        print(f"{off_scores[-1]:6.2f}  (off-topic) {question} -> {passage.label() if passage else '-'}")
+
+    floor = max(off_scores)
+    attached = sum(score >= search_index.CONTEXT_MIN_SCORE for score, _ in on_scores)
+    answered = sum(score >= search_index.ANSWER_MIN_SCORE for score, _ in on_scores)
+    print(f"\nBest off-topic score {floor:.2f}; a context floor just above it, e.g. {floor + 0.1:.1f}")
+    print(f"Defaults: passages attached for {attached} of {len(on_scores)} on-topic questions "
+          f"(>= {search_index.CONTEXT_MIN_SCORE}), file_search skipped for {answered} "
+          f"(>= {search_index.ANSWER_MIN_SCORE}; read those passages to check they answer the question)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Local mirror of each student's conversation.
+
+/chat writes every user and assistant turn here, already rendered to HTML,
+so /get_history can page through the conversation from SQLite instead of
+calling messages.list and re-rendering Markdown on every page load. A
+background sync backfills anything missing, e.g. threads created before
+this table existed or turns written while the database was busy.
+"""
+import sqlite3
+import threading
+import time
+
+import background
+import db
+
+PAGE_SIZE = 50
+# How often (per worker) a thread's history is re-checked against OpenAI
+SYNC_INTERVAL_SECONDS = 15 * 60
+SYNC_FETCH_LIMIT = 100
+
+_last_sync = {}
+_sync_lock = threading.Lock()
+
+
+def record_message(user_id, thread_id, role, content_html, openai_message_id=None, created_at=None):
+    """Store one rendered turn. Duplicate OpenAI message IDs are ignored."""
+    try:
+        db.execute(
+            'INSERT OR IGNORE INTO chat_messages (user_id, thread_id, openai_message_id, role, content_html, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (user_id, thread_id, openai_message_id, role, content_html, int(created_at or time.time()))
+        )
+    except sqlite3.OperationalError as e:
+        # Table missing (migration not run) or database busy; the background sync fills the gap
+        print(f"Error recording chat message: {e}")
+
+
+def encode_cursor(created_at, row_id):
+    return f"{created_at}:{row_id}"
+
+
+def decode_cursor(cursor):
+    created_at, row_id = cursor.split(':', 1)
+    return int(created_at), int(row_id)
+
+
+def get_page(thread_id, before=None, limit=PAGE_SIZE):
+    """Newest `limit` messages older than the `before` cursor, returned oldest first.
+
+    Returns (messages, next_cursor); next_cursor is None when there is nothing older.
+    """
+    if before:
+        created_at, row_id = decode_cursor(before)
+        rows = db.query_all(
+            '''SELECT id, role, content_html, created_at FROM chat_messages
+               WHERE thread_id = ? AND (created_at < ? OR (created_at = ? AND id < ?))
+               ORDER BY created_at DESC, id DESC LIMIT ?''',
+            (thread_id, created_at, created_at, row_id, limit + 1)
+        )
+    else:
+        rows = db.query_all(
+            '''SELECT id, role, content_html, created_at FROM chat_messages
+               WHERE thread_id = ? ORDER BY created_at DESC, id DESC LIMIT ?''',
+            (thread_id, limit + 1)
+        )
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1][3], rows[-1][0]) if has_more else None
+    messages = [{'role': role, 'content': content} for _, role, content, _ in reversed(rows)]
+    return messages, next_cursor
+
+
+def has_messages(thread_id):
+    return db.query_one('SELECT 1 FROM chat_messages WHERE thread_id = ? LIMIT 1', (thread_id,)) is not None
+
+
+def delete_thread(thread_id):
+    """Drop the local copy of an expired conversation."""
+    try:
+        db.execute('DELETE FROM chat_messages WHERE thread_id = ?', (thread_id,))
+    except sqlite3.OperationalError as e:
+        print(f"Error deleting chat history for {thread_id}: {e}")
+
+
+def sync_thread(client, user_id, thread_id, render_message):
+    """Copy any turns missing locally from the OpenAI thread.
+
+    render_message(role, text) -> HTML is supplied by the app so history is
+    rendered exactly like live replies.
+    """
+    known = {row[0] for row in db.query_all(
+        'SELECT openai_message_id FROM chat_messages WHERE thread_id = ? AND openai_message_id IS NOT NULL',
+        (thread_id,)
+    )}
+
+    # Page through the whole thread; a single page would never reach the newest turns of a long one
+    missing, after = [], None
+    while True:
+        page = client.beta.threads.messages.list(
+            thread_id=thread_id,
+            order='asc',  # Oldest first
+            limit=SYNC_FETCH_LIMIT,
+            **({'after': after} if after else {})
+        )
+        missing.extend(msg for msg in page.data if msg.id not in known)
+        if not page.data or not getattr(page, 'has_more', False):
+            break
+        after = page.data[-1].id
+
+    added = 0
+    for msg in missing:
+        content = render_message(msg.role, msg.content[0].text.value)
+        record_message(user_id, thread_id, msg.role, content, msg.id, getattr(msg, 'created_at', None))
+        added += 1
+
+    with _sync_lock:
+        _last_sync[thread_id] = time.monotonic()
+    if added:
+        print(f"Synced {added} missing messages for thread {thread_id}")
+    return added
+
+
+def sync_due(thread_id):
+    with _sync_lock:
+        last = _last_sync.get(thread_id)
+    return last is None or time.monotonic() - last > SYNC_INTERVAL_SECONDS
+
+
+def schedule_sync(client, user_id, thread_id, render_message):
+    """Backfill in the background at most once per SYNC_INTERVAL_SECONDS per thread."""
+    if not sync_due(thread_id):
+        return
+    with _sync_lock:
+        # Mark now so concurrent page loads don't queue duplicate syncs
+        _last_sync[thread_id] = time.monotonic()
+    background.submit(sync_thread, client, user_id, thread_id, render_message)
@@ -0,0 +1,238 @@
+"""
+Structured course catalog: the DUSD catalog Markdown parsed into SQLite.
+
+Questions like "what's the course number for AP Statistics" or "which
+F-area courses can a 10th grader take" have exact answers in the catalog,
+but it was only reachable through an assistant run. At build time every
+course entry (the same entries doc_chunker.py splits on) is parsed into the
+courses table: number, title, department, grade range, prerequisites
+("Essential Skills"), UC/CSU a-g area and AP/Honors level. /courses then
+answers lookups with an indexed query.
+
+Usage:
+    python migration_add_courses.py     # once
+    python course_catalog.py build      # after the catalog changes (update_assistant_documents.py runs it)
+    python course_catalog.py search "calculus"
+"""
+import os
+import re
+import sys
+
+import db
+import doc_chunker
+from doc_index import DOCS_DIR
+
+CATALOG_NAME_PATTERN = re.compile(r'course catalog.*\.md$', re.IGNORECASE)
+
+# Field labels as they are spelled across the catalog -> column
+FIELD_ALIASES = {
+    'course number': 'course_number',
+    'course numbers': 'course_number',
+    'grade level': 'grades',
+    'grade': 'grades',
+    'length': 'length',
+    'course length': 'length',
+    'essential skills': 'prerequisites',
+    'graduation': 'graduation',
+    'college prep': 'college_prep',
+    'fulfills a-g': 'college_prep',
+    'college credit': 'college_prep',
+    'school site': 'school_site',
+}
+# "Grade Level(s):", and sometimes no colon at all ("Grade level \t11-12")
+_FIELD_LINE = re.compile(r'^([A-Za-z][A-Za-z /-]*?)(?:\(s\))?\s*(?::|\t|\s{2,})\s*(.*)$')
+_AREA_LETTER = re.compile(r'[“”"‘’\']\s*([A-Ga-g])\s*[“”"‘’\']')
+# College Prep text without an explicit "X" area letter
+_AREA_KEYWORDS = (
+    ('history', 'A'), ('english', 'B'), ('math', 'C'), ('science', 'D'),
+    ('world language', 'E'), ('visual/performing', 'F'), ('elective', 'G'),
+)
+
+COLUMNS = ('course_number', 'title', 'department', 'grade_min', 'grade_max', 'length', 'prerequisites',
+           'graduation', 'college_prep', 'uc_csu_area', 'level', 'weighted', 'school_site', 'note',
+           'description', 'source')
+SUMMARY_COLUMNS = tuple(c for c in COLUMNS if c not in ('description', 'source'))
+LEVELS = ('AP', 'Honors')
+MAX_RESULTS = 200
+
+
+def _clean(value):
+    return ' '.join(value.replace('\\', '').replace('**', '').split()).strip(' .') if value else ''
+
+
+def parse_grades(value):
+    """(min, max) grade from "9-12", "10-l2", "11,12", "9 \\- 12", "12"; (None, None) if absent."""
+    # The catalog often types a lowercase L for 1 ("10-l2")
+    numbers = [int(n) for n in re.findall(r'\d+', value.replace('l', '1')) if 6 <= int(n) <= 12]
+    if not numbers:
+        return None, None
+    return min(numbers), max(numbers)
+
+
+def uc_csu_area(college_prep):
+    """The a-g area letter named in a College Prep line, e.g. 'UC/CSU "F" area' -> 'F'."""
+    if not college_prep or not re.search(r'\b(UC|CSU|a-g)\b', college_prep, re.IGNORECASE):
+        return None
+    match = _AREA_LETTER.search(college_prep)
+    if match:
+        return match.group(1).upper()
+    lowered = college_prep.lower()
+    for keyword, area in _AREA_KEYWORDS:
+        if keyword in lowered:
+            return area
+    return None
+
+
+def course_level(title):
+    if re.match(r'^AP\b', title) or 'advanced placement' in title.lower():
+        return 'AP'
+    if re.search(r'\bHonors\b|\(HP\)', title):
+        return 'Honors'
+    return ''
+
+
+def is_weighted(college_prep):
+    text = (college_prep or '').lower()
+    return 'weighted' in text and 'not a weighted' not in text
+
+
+def parse_entry(chunk):
+    """Course dict for one doc_chunker course Chunk."""
+    lines = chunk.text.splitlines()
+    fields, body_start = {}, len(lines)
+    for idx, line in enumerate(lines[1:], start=1):
+        cleaned = line.replace('\\', '').replace('**', '').strip()
+        if not cleaned:
+            if fields:
+                body_start = idx
+                break
+            continue
+        match = _FIELD_LINE.match(cleaned)
+        column = FIELD_ALIASES.get(match.group(1).lower()) if match else None
+        if column:
+            fields.setdefault(column, _clean(match.group(2)))
+
+    title, _, note = chunk.course.partition('*')
+    grade_min, grade_max = parse_grades(fields.get('grades', ''))
+    college_prep = fields.get('college_prep', '')
+    number = re.findall(r'\d{4,}', fields.get('course_number', ''))
+    return {
+        'course_number': ', '.join(number) or None,
+        'title': _clean(title),
+        'department': chunk.section,
+        'grade_min': grade_min,
+        'grade_max': grade_max,
+        'length': fields.get('length') or None,
+        'prerequisites': fields.get('prerequisites') or None,
+        'graduation': fields.get('graduation') or None,
+        'college_prep': college_prep or None,
+        'uc_csu_area': uc_csu_area(college_prep),
+        'level': course_level(title),
+        'weighted': int(is_weighted(college_prep)),
+        'school_site': fields.get('school_site') or None,
+        'note': _clean(note.replace('*', '')) or None,
+        'description': '\n'.join(lines[body_start:]).strip() or None,
+        'source': chunk.source,
+    }
+
+
+def parse_catalog(path):
+    source = os.path.basename(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        chunks = doc_chunker.chunk_markdown(f.read(), source)
+    return [parse_entry(chunk) for chunk in chunks
+            if chunk.department and chunk.course and chunk.course != 'Overview']
+
+
+def find_catalog(docs_dir=DOCS_DIR):
+    names = sorted(name for name in os.listdir(docs_dir) if CATALOG_NAME_PATTERN.search(name))
+    return os.path.join(docs_dir, names[-1]) if names else None
+
+
+def build(docs_dir=DOCS_DIR):
+    """Replace the courses table with a fresh parse of the catalog. Returns the number of courses."""
+    path = find_catalog(docs_dir)
+    if path is None:
+        print(f"No course catalog found in {docs_dir}")
+        return 0
+    courses = parse_catalog(path)
+    placeholders = ', '.join('?' for _ in COLUMNS)
+    with db.transaction() as conn:
+        conn.execute('DELETE FROM courses')
+        conn.executemany(f'INSERT INTO courses ({", ".join(COLUMNS)}) VALUES ({placeholders})',
+                         [tuple(course[c] for c in COLUMNS) for course in courses])
+    print(f"Loaded {len(courses)} courses from {os.path.basename(path)}")
+    return len(courses)
+
+
+def _row_dict(columns, row):
+    course = dict(zip(columns, row))
+    if 'weighted' in course:
+        course['weighted'] = bool(course['weighted'])
+    return course
+
+
+def lookup(course_number):
+    """Every catalog entry with this course number (a course can be listed in two departments)."""
+    # A few entries list several numbers ("710454, 710450")
+    rows = db.query_all(f'''SELECT {", ".join(COLUMNS)} FROM courses
+                            WHERE course_number = ? OR instr(', ' || course_number || ',', ?) > 0 ORDER BY id''',
+                        (course_number, f', {course_number},'))
+    return [_row_dict(COLUMNS, row) for row in rows]
+
+
+def _escape_like(text):
+    """Make %, _ and \\ in a title query match literally in LIKE ... ESCAPE '\\'."""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search(q=None, department=None, grade=None, area=None, level=None, limit=50, full=False):
+    """Courses matching every given filter, ordered by department and title.
+
+    q matches a course number exactly or a title substring; grade is the
+    grade the student will be in; area is an a-g letter; level is AP/Honors.
+    """
+    where, params = [], []
+    if q:
+        where.append("(course_number = ? OR instr(', ' || course_number || ',', ?) > 0 OR title LIKE ? ESCAPE '\\')")
+        params += [q.strip(), f', {q.strip()},', f'%{_escape_like(q.strip())}%']
+    if department:
+        where.append('department = ?')
+        params.append(department)
+    if grade is not None:
+        where.append('grade_min <= ? AND grade_max >= ?')
+        params += [grade, grade]
+    if area:
+        where.append('uc_csu_area = ?')
+        params.append(area.upper())
+    if level:
+        where.append('level = ?')
+        params.append(level)
+    columns = COLUMNS if full else SUMMARY_COLUMNS
+    sql = f'SELECT {", ".join(columns)} FROM courses'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY department, title LIMIT ?'
+    params.append(max(1, min(int(limit), MAX_RESULTS)))
+    return [_row_dict(columns, row) for row in db.query_all(sql, params)]
+
+
+def departments():
+    return [row[0] for row in db.query_all('SELECT DISTINCT department FROM courses ORDER BY department')]
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('build', 'search'):
+        print('Usage: python course_catalog.py build | search "title or number"')
+        sys.exit(1)
+    if sys.argv[1] == 'build':
+        build()
+        return
+    for course in search(' '.join(sys.argv[2:])):
+        grades = f"{course['grade_min']}-{course['grade_max']}" if course['grade_min'] else '?'
+        print(f"{course['course_number'] or '-':>14}  {course['title']} ({course['department']}, grades {grades}, "
+              f"area {course['uc_csu_area'] or '-'}{', ' + course['level'] if course['level'] else ''})")
+
+
+if __name__ == '__main__':
+    main()
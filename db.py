@@ -0,0 +1,161 @@
+"""
+SQLite data-access layer for the counselor app.
+
+Each thread (and each gunicorn worker process) keeps one long-lived
+connection to users.db instead of connecting for every query. The WAL,
+busy_timeout and synchronous pragmas are applied once when that connection
+is opened, and sqlite3's statement cache keeps the prepared statements for
+our fixed set of queries alive between requests.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if os.path.exists('/home/VihaanAgrawal'):
+    DB_PATH = '/home/VihaanAgrawal/emerald-counselor-ai/users.db'
+else:
+    DB_PATH = os.path.join(BASE_DIR, 'users.db')
+
+BUSY_TIMEOUT_MS = 30000
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+
+
+def _open_connection():
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        isolation_level=None,  # autocommit; use transaction() for multi-statement writes
+    )
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def get_connection():
+    """Return this thread's connection, opening it on first use."""
+    conn = getattr(_local, 'conn', None)
+    # A forked worker must not reuse the parent's connection
+    if conn is None or _local.pid != os.getpid() or _local.path != DB_PATH:
+        conn = _open_connection()
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.path = DB_PATH
+    return conn
+
+
+def close_connection():
+    """Close this thread's connection (used by scripts and tests)."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    _local.conn = None
+
+
+def query_one(sql, params=()):
+    return get_connection().execute(sql, params).fetchone()
+
+
+def query_all(sql, params=()):
+    return get_connection().execute(sql, params).fetchall()
+
+
+def execute(sql, params=()):
+    """Run a single write statement and return the cursor."""
+    return get_connection().execute(sql, params)
+
+
+@contextmanager
+def transaction():
+    """BEGIN IMMEDIATE ... COMMIT, so concurrent writers queue on busy_timeout instead of failing."""
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+def user_columns():
+    """Columns present on the users table (older databases may be missing migrations)."""
+    columns = getattr(_local, 'user_columns', None)
+    if columns is None or _local.pid != os.getpid() or _local.path != DB_PATH:
+        get_connection()
+        columns = {row[1] for row in query_all('PRAGMA table_info(users)')}
+        _local.user_columns = columns
+    return columns
+
+
+class UserRow(NamedTuple):
+    id: int
+    username: str
+    class_of: int
+    thread_id: Optional[str] = None
+    thread_created_at: Optional[str] = None
+    messages_today: int = 0
+    last_message_date: Optional[str] = None
+    tutorial_completed: int = 0
+    display_name: Optional[str] = None
+    current_grade: Optional[int] = None
+    bio: Optional[str] = None
+
+
+def _user_select():
+    available = user_columns()
+    parts = []
+    for field in UserRow._fields:
+        if field in available:
+            parts.append(field)
+        else:
+            # Missing migration: select the default so the row still lines up
+            parts.append(f'NULL AS {field}')
+    return 'SELECT ' + ', '.join(parts) + ' FROM users'
+
+
+def _to_user_row(row):
+    if row is None:
+        return None
+    user = UserRow(*row)
+    return user._replace(
+        messages_today=user.messages_today or 0,
+        tutorial_completed=user.tutorial_completed or 0,
+    )
+
+
+def get_user(user_id) -> Optional[UserRow]:
+    """Load the full users row for an id."""
+    return _to_user_row(query_one(_user_select() + ' WHERE id = ?', (user_id,)))
+
+
+def get_user_by_username(username) -> Optional[UserRow]:
+    return _to_user_row(query_one(_user_select() + ' WHERE username = ?', (username,)))
+
+
+def get_password_hash(username):
+    """Return (id, password_hash) for a username, or None."""
+    return query_one('SELECT id, password_hash FROM users WHERE username = ?', (username,))
+
+
+def create_user(username, password_hash, class_of, last_message_date, ip_address) -> int:
+    cursor = execute(
+        'INSERT INTO users (username, password_hash, class_of, messages_today, last_message_date, ip_address) VALUES (?, ?, ?, 0, ?, ?)',
+        (username, password_hash, class_of, last_message_date, ip_address)
+    )
+    return cursor.lastrowid
+
+
+def update_user_fields(user_id, **fields):
+    """UPDATE users SET <fields> WHERE id = ? for a fixed set of column names."""
+    unknown = set(fields) - set(UserRow._fields)
+    if unknown:
+        raise ValueError(f"Unknown users columns: {sorted(unknown)}")
+    assignments = ', '.join(f'{name} = ?' for name in fields)
+    execute(f'UPDATE users SET {assignments} WHERE id = ?', (*fields.values(), user_id))
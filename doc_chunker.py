@@ -0,0 +1,212 @@
+"""
+Split large Markdown documents into section-sized files before upload.
+
+The course catalog is one 1.1 MB Markdown file, so every file_search hit
+on it cites "the catalog" and drags large neighbouring passages into the
+prompt. This splits it along its own structure: the single-cell table rows
+the catalog uses as section/department headers, then one chunk per course
+entry (a **Title** line followed by "Course Number:"). Each chunk starts
+with a short metadata block (source, department, course, grade level) so
+the metadata is searchable too. Embedded base64 images are dropped, which
+alone shrinks the registration resources page from 0.5 MB to ~12 KB.
+
+Chunk filenames encode where they came from:
+    "<source stem> -- <section> -- <course>.md"
+so citation links can be mapped back to the source document and labelled
+with the section without any extra lookup file (see doc_index.py).
+"""
+import os
+import re
+import shutil
+from typing import NamedTuple, Optional
+
+# Markdown files bigger than this are pre-processed instead of uploaded as-is
+CHUNK_THRESHOLD_BYTES = 100 * 1024
+# Sections without course entries are split at bold sub-headings past this size
+MAX_CHUNK_CHARS = 12000
+SEPARATOR = ' -- '
+
+_HEADER_CELL = re.compile(r'^\|\s*([^|]*?\S[^|]*?)\s*\|\s*$')
+_HEADER_RULE = re.compile(r'^\|\s*:?-{3,}:?\s*\|\s*$')
+_BOLD_LINE = re.compile(r'^\*\*(.+?)\*\*\s*$')
+_IMAGE_DEF = re.compile(r'^\[[^\]]+\]:\s*<?data:image/')
+_INLINE_IMAGE = re.compile(r'!\[[^\]]*\]\((?:data:[^)]*)\)|!\[\]\[[^\]]+\]')
+_FIELD = re.compile(r'^(Course Number|Grade Level|Length|Essential Skills|Graduation|College Prep):\s*(.*?)\s*$',
+                    re.IGNORECASE)
+_UNSAFE_FILENAME = re.compile(r'[\\/:*?"<>|\s]+')
+
+
+class Chunk(NamedTuple):
+    source: str
+    section: str
+    course: Optional[str]
+    fields: dict
+    text: str
+    department: bool = False
+
+    def filename(self):
+        stem = os.path.splitext(self.source)[0]
+        parts = [stem, self.section] + ([self.course] if self.course else [])
+        return SEPARATOR.join(_safe(part) for part in parts) + '.md'
+
+    def render(self):
+        meta = [f'Source: {self.source}', f"{'Department' if self.department else 'Section'}: {self.section}"]
+        if self.course:
+            meta.append(f'Course: {self.course}')
+        for key in ('Course Number', 'Grade Level', 'Length', 'Essential Skills', 'Graduation', 'College Prep'):
+            if self.fields.get(key):
+                meta.append(f'{key}: {self.fields[key]}')
+        return '\n'.join(meta) + '\n\n---\n\n' + self.text.strip() + '\n'
+
+
+def _safe(part, limit=80):
+    cleaned = _UNSAFE_FILENAME.sub(' ', part.replace('*', '')).strip(' .-')
+    return cleaned[:limit].rstrip() or 'Untitled'
+
+
+def strip_images(text):
+    """Drop base64 image definitions and the ![][imageN] references to them."""
+    lines = [line for line in text.splitlines() if not _IMAGE_DEF.match(line)]
+    return _INLINE_IMAGE.sub('', '\n'.join(lines))
+
+
+def _split_sections(lines):
+    """[(title, [lines])] split at single-cell table headers ("|  Mathematics |" + "| :---: |")."""
+    sections = [('Overview', [])]
+    idx = 0
+    while idx < len(lines):
+        line = lines[idx]
+        header = _HEADER_CELL.match(line)
+        if header and idx + 1 < len(lines) and _HEADER_RULE.match(lines[idx + 1]):
+            sections.append((header.group(1).strip(), []))
+            idx += 2
+            continue
+        sections[-1][1].append(line)
+        idx += 1
+    return [(title, body) for title, body in sections if any(l.strip() for l in body)]
+
+
+def _course_starts(lines):
+    """Indexes of **Title** lines that open a course entry (Course Number: within 3 lines)."""
+    starts = []
+    for idx, line in enumerate(lines):
+        if line.strip().lower().startswith('course number:'):
+            for back in range(idx - 1, max(idx - 4, -1), -1):
+                if _BOLD_LINE.match(lines[back].strip()):
+                    starts.append(back)
+                    break
+    return sorted(set(starts))
+
+
+def _course_fields(lines):
+    fields = {}
+    for line in lines[:12]:
+        match = _FIELD.match(line.strip().replace('\t', ' '))
+        if match:
+            key = match.group(1).title()
+            fields.setdefault(key, ' '.join(match.group(2).split()).rstrip('\\ '))
+    return fields
+
+
+def _split_by_size(title, lines):
+    """Split a long course-free section at bold sub-headings, keeping pieces under MAX_CHUNK_CHARS."""
+    pieces, current, size = [], [], 0
+    for line in lines:
+        if _BOLD_LINE.match(line.strip()) and size > MAX_CHUNK_CHARS:
+            pieces.append(current)
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    pieces.append(current)
+    if len(pieces) == 1:
+        return [(title, None, pieces[0])]
+    return [(title, f'Part {n}', piece) for n, piece in enumerate(pieces, start=1)]
+
+
+def chunk_markdown(text, source):
+    """Split one Markdown document into Chunks."""
+    lines = strip_images(text).splitlines()
+    chunks = []
+    for title, body in _split_sections(lines):
+        starts = _course_starts(body)
+        if not starts:
+            for section, part, piece in _split_by_size(title, body):
+                chunks.append(Chunk(source, section, part, {}, '\n'.join(piece)))
+            continue
+
+        # Department introduction (pathways, acceleration rules, ...) before the first course
+        intro = body[:starts[0]]
+        if any(l.strip() for l in intro):
+            chunks.append(Chunk(source, title, 'Overview', {}, '\n'.join(intro), True))
+        for n, start in enumerate(starts):
+            end = starts[n + 1] if n + 1 < len(starts) else len(body)
+            entry = body[start:end]
+            course = _BOLD_LINE.match(entry[0].strip()).group(1).strip()
+            chunks.append(Chunk(source, title, course, _course_fields(entry[1:]), '\n'.join(entry), True))
+    return chunks
+
+
+def needs_chunking(path):
+    return path.lower().endswith('.md') and os.path.getsize(path) > CHUNK_THRESHOLD_BYTES
+
+
+def write_chunks(path, out_dir):
+    """Write the chunks of one document into out_dir/<source stem>/ and return their paths.
+
+    Files are only rewritten when their content changed, so unchanged
+    chunks keep their mtime and are not re-hashed by the ingest manifest.
+    """
+    source = os.path.basename(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        chunks = chunk_markdown(f.read(), source)
+
+    target_dir = os.path.join(out_dir, chunk_dir_name(source))
+    os.makedirs(target_dir, exist_ok=True)
+
+    paths, seen = [], {}
+    for chunk in chunks:
+        filename = chunk.filename()
+        # Same course listed twice in a section: number the repeats
+        seen[filename] = seen.get(filename, 0) + 1
+        if seen[filename] > 1:
+            filename = f"{filename[:-3]} ({seen[filename]}).md"
+        chunk_path = os.path.join(target_dir, filename)
+        content = chunk.render()
+        existing = None
+        if os.path.exists(chunk_path):
+            with open(chunk_path, 'r', encoding='utf-8') as f:
+                existing = f.read()
+        if existing != content:
+            with open(chunk_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+        paths.append(chunk_path)
+
+    # Remove chunks for sections/courses that no longer exist
+    keep = {os.path.basename(p) for p in paths}
+    for name in os.listdir(target_dir):
+        if name not in keep:
+            os.remove(os.path.join(target_dir, name))
+    return sorted(paths)
+
+
+def chunk_dir_name(source):
+    return _safe(os.path.splitext(source)[0])
+
+
+def prune_chunk_dirs(out_dir, sources):
+    """Remove generated chunks for documents that are no longer chunked (or no longer exist)."""
+    if not os.path.isdir(out_dir):
+        return
+    keep = {chunk_dir_name(source) for source in sources}
+    for name in os.listdir(out_dir):
+        if name not in keep:
+            shutil.rmtree(os.path.join(out_dir, name), ignore_errors=True)
+
+
+def parse_chunk_filename(filename):
+    """(source filename, section label) for a chunk filename, or None for ordinary files."""
+    stem, ext = os.path.splitext(filename)
+    parts = stem.split(SEPARATOR)
+    if len(parts) < 2:
+        return None
+    return parts[0] + ext, ' › '.join(parts[1:])
@@ -0,0 +1,204 @@
+"""
+Persistent index of OpenAI file IDs -> local school_documents filenames.
+
+Citation links used to cost a files.retrieve call plus a directory scan per
+cited file. The index lives in file_id_mapping.json. It is written at
+ingest time (update_assistant_documents.py / map_file_ids.py), loaded once
+per worker, and only falls back to the API for a file ID it has never seen.
+When the contents of school_documents change, the local filenames are
+re-resolved from the stored OpenAI filenames without any network calls.
+Section files produced by doc_chunker.py resolve to their source document
+and also carry a section label ("Mathematics › Algebra I") for the link.
+"""
+import json
+import os
+import threading
+
+from doc_chunker import parse_chunk_filename
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DOCS_DIR = os.path.join(BASE_DIR, 'school_documents')
+MAPPING_PATH = os.path.join(BASE_DIR, 'file_id_mapping.json')
+
+
+def match_local_filename(openai_filename, local_files):
+    """Map an uploaded filename to the matching local PDF (same rules the app always used)."""
+    for local_file in local_files:
+        if local_file.endswith('.pdf'):
+            # Simple matching - check if OpenAI filename matches or is similar
+            if openai_filename.lower() in local_file.lower() or local_file.lower() in openai_filename.lower():
+                return local_file
+    # If no match found, return OpenAI filename
+    return openai_filename
+
+
+def resolve_entry(openai_filename, local_files):
+    """Index entry for an uploaded file: local filename plus section label for chunked sources."""
+    chunk = parse_chunk_filename(openai_filename)
+    if chunk:
+        source, section = chunk
+        return {'openai_filename': openai_filename, 'local_filename': source, 'section': section}
+    return {'openai_filename': openai_filename,
+            'local_filename': match_local_filename(openai_filename, local_files),
+            'section': None}
+
+
+def documents_fingerprint(docs_dir=DOCS_DIR):
+    """Cheap fingerprint of the document folder: names, sizes and mtimes."""
+    try:
+        entries = sorted(
+            (entry.name, entry.stat().st_size, int(entry.stat().st_mtime))
+            for entry in os.scandir(docs_dir) if entry.is_file()
+        )
+    except FileNotFoundError:
+        return ''
+    return json.dumps(entries)
+
+
+class DocumentIndex:
+    """file_id -> local filename lookups backed by file_id_mapping.json."""
+
+    def __init__(self, path=MAPPING_PATH, docs_dir=DOCS_DIR):
+        self.path = path
+        self.docs_dir = docs_dir
+        self._lock = threading.Lock()
+        self._files = {}
+        self._file_mtime = None
+        self._dir_mtime = None
+        self._loaded = False
+
+    # --- persistence -------------------------------------------------------
+
+    def load(self):
+        """Read the mapping from disk and re-resolve names if the documents changed."""
+        with self._lock:
+            self._load_locked()
+
+    def _load_locked(self):
+        data = {}
+        self._file_mtime = self._current_file_mtime()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error reading {self.path}: {e}")
+
+        if 'files' in data:
+            self._files = data['files']
+            stored_fingerprint = data.get('documents_fingerprint')
+        else:
+            # Older map_file_ids.py output: {file_id: openai_filename}
+            self._files = {file_id: {'openai_filename': name, 'local_filename': None}
+                           for file_id, name in data.items()}
+            stored_fingerprint = None
+
+        self._loaded = True
+        self._dir_mtime = self._current_dir_mtime()
+        if self._files and stored_fingerprint != documents_fingerprint(self.docs_dir):
+            self._resolve_all_locked()
+            self._save_locked()
+
+    def _save_locked(self):
+        data = {
+            'documents_fingerprint': documents_fingerprint(self.docs_dir),
+            'files': self._files,
+        }
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error writing {self.path}: {e}")
+        self._file_mtime = self._current_file_mtime()
+
+    def _current_file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _current_dir_mtime(self):
+        try:
+            return os.stat(self.docs_dir).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _resolve_all_locked(self):
+        local_files = os.listdir(self.docs_dir) if os.path.isdir(self.docs_dir) else []
+        for file_id, entry in self._files.items():
+            self._files[file_id] = resolve_entry(entry['openai_filename'], local_files)
+
+    # --- lookups -----------------------------------------------------------
+
+    def lookup(self, file_id, client=None):
+        """Local filename for a file ID. Calls the API only for IDs not in the index."""
+        with self._lock:
+            if not self._loaded:
+                self._load_locked()
+            elif self._current_dir_mtime() != self._dir_mtime:
+                # A document was added, removed or renamed since we last resolved names
+                self._dir_mtime = self._current_dir_mtime()
+                self._resolve_all_locked()
+                self._save_locked()
+
+            entry = self._files.get(file_id)
+            if entry is None and self._current_file_mtime() != self._file_mtime:
+                # Another worker or an ingest run rewrote the mapping; pick up its entries
+                self._load_locked()
+                entry = self._files.get(file_id)
+            if entry:
+                return entry['local_filename']
+
+        if client is None:
+            return None
+
+        # Miss: fetch once, then remember it for every worker via the JSON file
+        try:
+            openai_filename = client.files.retrieve(file_id).filename
+        except Exception as e:
+            print(f"Error getting filename for file_id {file_id}: {e}")
+            return None
+        self.add(file_id, openai_filename)
+        return self.lookup(file_id)
+
+    def section(self, file_id):
+        """Section label for a chunked source ("Mathematics › Algebra I"), else None. Never calls the API."""
+        with self._lock:
+            entry = self._files.get(file_id)
+            return entry.get('section') if entry else None
+
+    def add(self, file_id, openai_filename, save=True):
+        with self._lock:
+            local_files = os.listdir(self.docs_dir) if os.path.isdir(self.docs_dir) else []
+            self._files[file_id] = resolve_entry(openai_filename, local_files)
+            if save:
+                self._save_locked()
+
+    def replace_all(self, file_id_to_openai_filename):
+        """Rebuild the whole index (used at ingest time)."""
+        with self._lock:
+            self._files = {file_id: {'openai_filename': name, 'local_filename': None}
+                           for file_id, name in file_id_to_openai_filename.items()}
+            self._resolve_all_locked()
+            self._save_locked()
+            self._loaded = True
+            self._dir_mtime = self._current_dir_mtime()
+
+    def items(self):
+        with self._lock:
+            return {file_id: dict(entry) for file_id, entry in self._files.items()}
+
+
+def build_from_vector_store(client, vector_store_id, index=None):
+    """List every file in a vector store and write the full mapping."""
+    vector_stores_client = getattr(client, "vector_stores", None) or getattr(client.beta, "vector_stores", None)
+    file_id_to_filename = {}
+    for file_obj in vector_stores_client.files.list(vector_store_id=vector_store_id, limit=100):
+        file_detail = client.files.retrieve(file_obj.id)
+        file_id_to_filename[file_obj.id] = file_detail.filename
+
+    index = index or DocumentIndex()
+    index.replace_all(file_id_to_filename)
+    return index
@@ -0,0 +1,141 @@
+"""
+Index of the PDFs /download may serve, with validators for HTTP caching.
+
+The same planning sheets are downloaded again and again. Each allowed file
+gets a strong ETag from the SHA-256 of its contents (taken from the
+pdf_text.py store when it is current, so startup doesn't re-read every
+PDF), its size and mtime, so /download can answer If-None-Match and
+If-Modified-Since with 304 and serve byte ranges for resumed downloads
+without touching the filesystem first. The index is rebuilt when the
+documents fingerprint changes, checked at most every CHECK_SECONDS.
+
+PDFs are mostly compressed already, but some (the planning sheets) still
+shrink by ~20% with gzip. `build()` writes a .gz copy of each PDF where it
+saves at least MIN_SAVINGS, under download_cache/; /download sends it to
+clients that accept gzip and aren't asking for a byte range.
+
+Usage:
+    python downloads.py build
+"""
+import gzip
+import os
+import sys
+import threading
+import time
+from typing import NamedTuple, Optional
+
+import pdf_text
+from doc_index import DOCS_DIR, documents_fingerprint
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+COMPRESSED_DIR = os.path.join(BASE_DIR, 'download_cache')
+
+CHECK_SECONDS = 5
+MIN_SAVINGS = 0.1
+# Browsers may reuse a download this long before revalidating with the ETag
+MAX_AGE = 300
+
+
+class DownloadFile(NamedTuple):
+    path: str
+    size: int
+    mtime: float
+    etag: str
+    gzip_path: Optional[str] = None
+    gzip_size: int = 0
+
+
+def _gzip_path(sha256, compressed_dir=COMPRESSED_DIR):
+    return os.path.join(compressed_dir, f'{sha256[:32]}.pdf.gz')
+
+
+def _content_hash(path):
+    store = pdf_text.get_store()
+    return store.sha256_for(path) if store is not None else pdf_text.file_sha256(path)
+
+
+def scan(docs_dir=DOCS_DIR, compressed_dir=COMPRESSED_DIR):
+    """{filename: DownloadFile} for every PDF in docs_dir."""
+    files = {}
+    for entry in os.scandir(docs_dir):
+        if not entry.is_file() or not entry.name.endswith('.pdf'):
+            continue
+        stat = entry.stat()
+        sha256 = _content_hash(entry.path)
+        gzip_path = _gzip_path(sha256, compressed_dir)
+        try:
+            gzip_size = os.path.getsize(gzip_path)
+        except FileNotFoundError:
+            gzip_path, gzip_size = None, 0
+        files[entry.name] = DownloadFile(entry.path, stat.st_size, stat.st_mtime, sha256[:32], gzip_path, gzip_size)
+    return files
+
+
+class DownloadIndex:
+    """filename -> DownloadFile for one documents folder, kept in step with the folder."""
+
+    def __init__(self, docs_dir=DOCS_DIR, compressed_dir=COMPRESSED_DIR):
+        self.docs_dir = docs_dir
+        self.compressed_dir = compressed_dir
+        self._lock = threading.Lock()
+        self._files = {}
+        self._fingerprint = None
+        self._checked = 0.0
+
+    def load(self):
+        with self._lock:
+            self._reload_locked()
+
+    def _reload_locked(self):
+        self._fingerprint = documents_fingerprint(self.docs_dir)
+        try:
+            self._files = scan(self.docs_dir, self.compressed_dir)
+        except FileNotFoundError:
+            self._files = {}
+        self._checked = time.monotonic()
+
+    def get(self, filename):
+        """The DownloadFile for an allowed filename, or None."""
+        with self._lock:
+            if time.monotonic() - self._checked > CHECK_SECONDS:
+                self._checked = time.monotonic()
+                if documents_fingerprint(self.docs_dir) != self._fingerprint:
+                    self._reload_locked()
+            return self._files.get(filename)
+
+
+def build(docs_dir=DOCS_DIR, compressed_dir=COMPRESSED_DIR):
+    """Write gzip variants of the PDFs worth compressing; drop variants of old versions. Returns the count."""
+    os.makedirs(compressed_dir, exist_ok=True)
+    files = scan(docs_dir, compressed_dir)
+    wanted, saved = set(), 0
+    for name, entry in sorted(files.items()):
+        gzip_path = _gzip_path(entry.etag, compressed_dir)
+        if entry.gzip_path is None:
+            with open(entry.path, 'rb') as f:
+                compressed = gzip.compress(f.read(), compresslevel=9, mtime=0)
+            if len(compressed) > entry.size * (1 - MIN_SAVINGS):
+                continue
+            tmp_path = f"{gzip_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(compressed)
+            os.replace(tmp_path, gzip_path)
+            print(f"Compressed {name}: {entry.size // 1024} KB -> {len(compressed) // 1024} KB")
+        wanted.add(os.path.basename(gzip_path))
+        saved += entry.size - os.path.getsize(gzip_path)
+    for name in os.listdir(compressed_dir):
+        if name not in wanted:
+            os.remove(os.path.join(compressed_dir, name))
+    print(f"{len(wanted)} of {len(files)} PDFs have gzip variants ({saved / 1024:.0f} KB saved) -> {compressed_dir}")
+    return len(wanted)
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != 'build':
+        print('Usage: python downloads.py build')
+        sys.exit(1)
+    build()
+
+
+if __name__ == '__main__':
+    main()
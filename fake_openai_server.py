@@ -0,0 +1,375 @@
+"""
+Local stand-in for the OpenAI Assistants API, for load testing without API spend.
+
+Implements the endpoints the app uses: threads (create/delete), messages
+(create/list), runs (create with or without stream=True, retrieve), run
+steps (list) and files (retrieve). Replies are Markdown slices of the real
+school documents with file_citation annotations that point at real files in
+school_documents, so citation links and /download behave as in production.
+
+Latency and failures are configurable:
+    --api-latency   per-request latency, e.g. "lognormal:0.15,0.5" (median s, sigma)
+    --run-latency   time for a run to finish, e.g. "uniform:2,8" or "fixed:3"
+    --failure-rate  fraction of requests answered with HTTP 500 (the SDK
+                    retries these, so only repeated failures reach the app)
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8765/v1
+Usage: python fake_openai_server.py [--port 8765] [options above]
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DOCS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'school_documents')
+
+
+class Latency:
+    """A latency distribution parsed from "fixed:S", "uniform:A,B" or "lognormal:MEDIAN,SIGMA"."""
+
+    def __init__(self, spec):
+        self.spec = spec
+        kind, _, params = spec.partition(':')
+        values = [float(v) for v in params.split(',')] if params else []
+        if kind == 'fixed':
+            self._sample = lambda: values[0]
+        elif kind == 'uniform':
+            self._sample = lambda: random.uniform(values[0], values[1])
+        elif kind == 'lognormal':
+            mu, sigma = math.log(values[0]), values[1]
+            self._sample = lambda: random.lognormvariate(mu, sigma)
+        else:
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self):
+        return max(self._sample(), 0.0)
+
+
+def _load_replies(count=40, size=900):
+    """Assistant-sized Markdown replies cut from the catalog and other .md documents."""
+    texts = []
+    if os.path.isdir(DOCS_DIR):
+        for name in sorted(os.listdir(DOCS_DIR)):
+            if name.endswith('.md'):
+                with open(os.path.join(DOCS_DIR, name), 'r', encoding='utf-8') as f:
+                    # Skip embedded base64 images
+                    texts.append(''.join(line for line in f if 'data:image' not in line))
+    source = '\n'.join(texts) or 'Talk to your counselor about course planning.'
+    step = max(len(source) // count, 1)
+    return [f"Here is what I found:\n\n{source[i * step: i * step + size]}\n\n- **Next step**: check with your counselor"
+            for i in range(count)]
+
+
+def _document_names():
+    if not os.path.isdir(DOCS_DIR):
+        return ['AP_Rule_Change.pdf']
+    names = sorted(n for n in os.listdir(DOCS_DIR) if n.endswith('.pdf'))
+    return names or ['AP_Rule_Change.pdf']
+
+
+class FakeAssistants:
+    """In-memory threads, messages and runs. Thread-safe."""
+
+    def __init__(self, run_latency, citations=2):
+        self.run_latency = run_latency
+        self.citations = citations
+        self.replies = _load_replies()
+        self.files = {f'file-fake{i:03d}': name for i, name in enumerate(_document_names())}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.threads = {}   # thread_id -> [message]
+        self.runs = {}      # run_id -> (run dict, finishes_at)
+        # Polling cost, for load_test.py: runs created without stream=True, their
+        # status checks, and how long after finishing each one was noticed
+        self.polled_runs = 0
+        self.status_checks = 0
+        self.notice_delays = []
+
+    def new_id(self, prefix):
+        return f'{prefix}_{next(self._ids):08d}'
+
+    # --- objects -----------------------------------------------------------
+
+    def message(self, thread_id, role, text, annotations=(), run_id=None):
+        return {
+            'id': self.new_id('msg'), 'object': 'thread.message', 'created_at': int(time.time()),
+            'thread_id': thread_id, 'role': role, 'status': 'completed', 'run_id': run_id,
+            'assistant_id': 'asst_fake' if role == 'assistant' else None,
+            'attachments': [], 'metadata': {},
+            'content': [{'type': 'text', 'text': {'value': text, 'annotations': list(annotations)}}],
+        }
+
+    def assistant_reply(self, thread_id, run_id):
+        text = random.choice(self.replies)
+        annotations = []
+        for idx, file_id in enumerate(random.sample(sorted(self.files), min(self.citations, len(self.files)))):
+            marker = f'【4:{idx}†source】'
+            start = len(text)
+            text += marker
+            annotations.append({'type': 'file_citation', 'text': marker, 'start_index': start,
+                                'end_index': start + len(marker), 'file_citation': {'file_id': file_id}})
+        return self.message(thread_id, 'assistant', text, annotations, run_id)
+
+    def run(self, thread_id, assistant_id, status='queued'):
+        now = int(time.time())
+        return {
+            'id': self.new_id('run'), 'object': 'thread.run', 'created_at': now, 'thread_id': thread_id,
+            'assistant_id': assistant_id, 'status': status, 'model': 'gpt-4o-fake', 'instructions': '',
+            'tools': [{'type': 'file_search'}], 'metadata': {}, 'usage': None,
+            'started_at': now, 'completed_at': None, 'last_error': None,
+        }
+
+    def complete(self, run):
+        run.update(status='completed', completed_at=int(time.time()),
+                   usage={'prompt_tokens': random.randint(800, 4000),
+                          'completion_tokens': random.randint(100, 600), 'total_tokens': 0})
+        run['usage']['total_tokens'] = run['usage']['prompt_tokens'] + run['usage']['completion_tokens']
+        with self._lock:
+            self.threads.setdefault(run['thread_id'], []).append(self.assistant_reply(run['thread_id'], run['id']))
+
+    def steps(self, run):
+        return [{
+            'id': self.new_id('step'), 'object': 'thread.run.step', 'run_id': run['id'],
+            'thread_id': run['thread_id'], 'assistant_id': run['assistant_id'], 'status': 'completed',
+            'type': 'tool_calls', 'created_at': run['created_at'],
+            'step_details': {'type': 'tool_calls', 'tool_calls': [
+                {'id': self.new_id('call'), 'type': 'file_search', 'file_search': {}}]},
+        }]
+
+
+def _page(items):
+    return {'object': 'list', 'data': items, 'has_more': False,
+            'first_id': items[0]['id'] if items else None, 'last_id': items[-1]['id'] if items else None}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeOpenAI/1.0'
+
+    # Set by serve()
+    state = None
+    api_latency = None
+    failure_rate = 0.0
+
+    def log_message(self, format, *args):
+        pass  # Quiet; the load test reports what matters
+
+    # --- plumbing ----------------------------------------------------------
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send_json({'error': {'message': message, 'type': 'fake_error', 'code': None}}, status)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}') if length else {}
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        body = self._body() if method == 'POST' else {}
+        time.sleep(self.api_latency.sample())
+        if random.random() < self.failure_rate:
+            return self._error(500, 'Injected failure')
+        for pattern, route_method, handler in ROUTES:
+            match = pattern.fullmatch(url.path)
+            if match and route_method == method:
+                return handler(self, body, parse_qs(url.query), *match.groups())
+        self._error(404, f'No fake route for {method} {url.path}')
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    # --- endpoints ---------------------------------------------------------
+
+    def create_thread(self, body, query):
+        thread_id = self.state.new_id('thread')
+        with self.state._lock:
+            self.state.threads[thread_id] = []
+        self._send_json({'id': thread_id, 'object': 'thread', 'created_at': int(time.time()), 'metadata': {}})
+
+    def delete_thread(self, body, query, thread_id):
+        with self.state._lock:
+            existed = self.state.threads.pop(thread_id, None) is not None
+        if not existed:
+            return self._error(404, f'No thread found with id {thread_id}')
+        self._send_json({'id': thread_id, 'object': 'thread.deleted', 'deleted': True})
+
+    def create_message(self, body, query, thread_id):
+        if thread_id not in self.state.threads:
+            return self._error(404, f'No thread found with id {thread_id}')
+        content = body.get('content')
+        text = content if isinstance(content, str) else json.dumps(content)
+        message = self.state.message(thread_id, body.get('role', 'user'), text)
+        with self.state._lock:
+            self.state.threads[thread_id].append(message)
+        self._send_json(message)
+
+    def list_messages(self, body, query, thread_id):
+        with self.state._lock:
+            messages = list(self.state.threads.get(thread_id, []))
+        if query.get('order', ['desc'])[0] == 'desc':
+            messages.reverse()
+        after = query.get('after', [None])[0]
+        if after:
+            ids = [m['id'] for m in messages]
+            messages = messages[ids.index(after) + 1:] if after in ids else []
+        limit = int(query.get('limit', ['20'])[0])
+        page = _page(messages[:limit])
+        page['has_more'] = len(messages) > limit
+        self._send_json(page)
+
+    def create_run(self, body, query, thread_id):
+        if thread_id not in self.state.threads:
+            return self._error(404, f'No thread found with id {thread_id}')
+        run = self.state.run(thread_id, body.get('assistant_id'))
+        duration = self.state.run_latency.sample()
+        with self.state._lock:
+            self.state.runs[run['id']] = (run, time.monotonic() + duration)
+        if body.get('stream'):
+            return self._stream_run(run, duration)
+        with self.state._lock:
+            self.state.polled_runs += 1
+        self._send_json(run)
+
+    def _stream_run(self, run, duration):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def emit(event, data):
+            chunk = f'event: {event}\ndata: {json.dumps(data) if not isinstance(data, str) else data}\n\n'.encode('utf-8')
+            self.wfile.write(f'{len(chunk):x}\r\n'.encode() + chunk + b'\r\n')
+            self.wfile.flush()
+
+        emit('thread.run.created', dict(run))
+        run['status'] = 'in_progress'
+        emit('thread.run.in_progress', dict(run))
+        # Time to first token is ~1/3 of the run; the rest is spread over the deltas
+        time.sleep(duration / 3)
+        self.state.complete(run)
+        reply = self.state.threads[run['thread_id']][-1]
+        text = reply['content'][0]['text']['value']
+        pieces = [text[i:i + 40] for i in range(0, len(text), 40)]
+        for idx, piece in enumerate(pieces):
+            emit('thread.message.delta', {'id': reply['id'], 'object': 'thread.message.delta',
+                                          'delta': {'content': [{'index': 0, 'type': 'text', 'text': {'value': piece}}]}})
+            time.sleep(duration * 2 / 3 / max(len(pieces), 1))
+        emit('thread.message.completed', reply)
+        emit('thread.run.completed', run)
+        emit('done', '[DONE]')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def retrieve_run(self, body, query, thread_id, run_id):
+        with self.state._lock:
+            entry = self.state.runs.get(run_id)
+            self.state.status_checks += 1
+        if entry is None:
+            return self._error(404, f'No run found with id {run_id}')
+        run, finishes_at = entry
+        if run['status'] in ('queued', 'in_progress'):
+            now = time.monotonic()
+            if now >= finishes_at:
+                with self.state._lock:
+                    self.state.notice_delays.append(now - finishes_at)
+                self.state.complete(run)
+            else:
+                run['status'] = 'in_progress'
+        self._send_json(run)
+
+    def list_steps(self, body, query, thread_id, run_id):
+        with self.state._lock:
+            entry = self.state.runs.get(run_id)
+        if entry is None:
+            return self._error(404, f'No run found with id {run_id}')
+        self._send_json(_page(self.state.steps(entry[0])))
+
+    def retrieve_file(self, body, query, file_id):
+        filename = self.state.files.get(file_id)
+        if filename is None:
+            return self._error(404, f'No such File object: {file_id}')
+        self._send_json({'id': file_id, 'object': 'file', 'bytes': 1024, 'created_at': int(time.time()),
+                         'filename': filename, 'purpose': 'assistants', 'status': 'processed'})
+
+
+ROUTES = [
+    (re.compile(r'/v1/threads'), 'POST', Handler.create_thread),
+    (re.compile(r'/v1/threads/([^/]+)'), 'DELETE', Handler.delete_thread),
+    (re.compile(r'/v1/threads/([^/]+)/messages'), 'POST', Handler.create_message),
+    (re.compile(r'/v1/threads/([^/]+)/messages'), 'GET', Handler.list_messages),
+    (re.compile(r'/v1/threads/([^/]+)/runs'), 'POST', Handler.create_run),
+    (re.compile(r'/v1/threads/([^/]+)/runs/([^/]+)'), 'GET', Handler.retrieve_run),
+    (re.compile(r'/v1/threads/([^/]+)/runs/([^/]+)/steps'), 'GET', Handler.list_steps),
+    (re.compile(r'/v1/files/([^/]+)'), 'GET', Handler.retrieve_file),
+]
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-stream (timeouts, SDK retries) are expected under load
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+def serve(port=8765, api_latency='lognormal:0.15,0.5', run_latency='lognormal:4,0.4',
+          failure_rate=0.0, host='127.0.0.1'):
+    """Start the fake API on a daemon thread and return the server (server.shutdown() to stop)."""
+    handler = type('ConfiguredHandler', (Handler,), {
+        'state': FakeAssistants(Latency(run_latency)),
+        'api_latency': Latency(api_latency),
+        'failure_rate': failure_rate,
+    })
+    server = FakeServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name='fake-openai', daemon=True).start()
+    return server
+
+
+def add_arguments(parser):
+    parser.add_argument('--api-latency', default='lognormal:0.15,0.5',
+                        help='Latency of each API request (fixed:S, uniform:A,B, lognormal:MEDIAN,SIGMA)')
+    parser.add_argument('--run-latency', default='lognormal:4,0.4',
+                        help='Time for a run to complete')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='Fraction of API requests that fail with HTTP 500')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake OpenAI Assistants API for load testing.')
+    parser.add_argument('--port', type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = serve(args.port, args.api_latency, args.run_latency, args.failure_rate)
+    print(f"Fake OpenAI API on http://127.0.0.1:{args.port}/v1 (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
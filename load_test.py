@@ -0,0 +1,254 @@
+"""
+Offline load test: simulated students against the app and a fake OpenAI API.
+
+Starts fake_openai_server.py, imports the Flask app from main.py pointed at
+it (OPENAI_BASE_URL) with a throwaway users.db, serves it on a local port and
+runs N students concurrently. Each student does signup, /, /bootstrap,
+several /chat (or /chat/stream) messages, /get_history and /download_chat. The report
+shows throughput and p50/p95/p99 latency per endpoint, plus runs.retrieve
+calls per /chat run and how late the poller noticed runs finishing. No real
+API calls.
+
+Usage:
+    python load_test.py --students 50 --chats 3
+    python load_test.py --stream --run-latency uniform:2,6 --failure-rate 0.02
+
+To test a real deployment setup (e.g. gunicorn with several workers), start
+`python fake_openai_server.py`, run the app with
+OPENAI_BASE_URL=http://127.0.0.1:8765/v1, then pass --url http://127.0.0.1:8000
+"""
+import argparse
+import contextlib
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import httpx
+
+import fake_openai_server
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# users table with every column the app reads (the older migrations only add some of them)
+USERS_SCHEMA = '''
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    class_of INTEGER NOT NULL,
+    thread_id TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    messages_today INTEGER DEFAULT 0,
+    last_message_date TEXT,
+    thread_created_at TIMESTAMP,
+    ip_address TEXT,
+    tutorial_completed INTEGER DEFAULT 0,
+    display_name TEXT,
+    current_grade INTEGER,
+    bio TEXT
+)
+'''
+TABLE_MIGRATIONS = [
+    'migration_add_message_log.py',
+    'migration_add_chat_history.py',
+    'migration_add_expired_threads.py',
+    'migration_add_run_metadata.py',
+    'migration_add_courses.py',
+]
+QUESTIONS = [
+    "What math class should I take after Algebra 1?",
+    "Which AP classes count for UC a-g?",
+    "How do I register for courses in Infinite Campus?",
+    "What electives are available for juniors?",
+    "Can I take AP Computer Science as a sophomore?",
+]
+
+
+class Results:
+    """Latencies and errors per endpoint, shared by all student threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, endpoint, seconds, ok):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return float('nan')
+    rank = max(int(round(q * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def timed(results, endpoint, fn, ok=lambda r: r.status_code < 400):
+    start = time.perf_counter()
+    try:
+        response = fn()
+    except httpx.HTTPError as e:
+        results.record(endpoint, time.perf_counter() - start, False)
+        print(f"{endpoint}: {e}", file=sys.stderr)
+        return None
+    results.record(endpoint, time.perf_counter() - start, ok(response))
+    return response
+
+
+def chat_ok(response):
+    # The app answers 200 with an apology when the assistant call failed
+    return response.status_code == 200 and 'Sorry, I encountered an error' not in response.text
+
+
+def run_student(base_url, index, args, results):
+    username = f"loadtest_{os.getpid()}_{index}"
+    password = 'loadtest-pw'
+    with httpx.Client(base_url=base_url, timeout=args.timeout) as client:
+        timed(results, 'POST /signup', lambda: client.post('/signup', data={
+            'username': username, 'password': password, 'confirm_password': password,
+            'class_of': random.choice(['2026', '2027', '2028', '2029'])}),
+            ok=lambda r: r.status_code == 302)
+        timed(results, 'GET /', lambda: client.get('/'))
+        timed(results, 'GET /bootstrap', lambda: client.get('/bootstrap'))
+
+        exported = []
+        endpoint = '/chat/stream' if args.stream else '/chat'
+        for _ in range(args.chats):
+            question = random.choice(QUESTIONS)
+            response = timed(results, f'POST {endpoint}',
+                             lambda: client.post(endpoint, json={'message': question}), ok=chat_ok)
+            if response is not None and response.status_code == 200:
+                exported += [{'role': 'user', 'content': question},
+                             {'role': 'assistant', 'content': response.text}]
+            time.sleep(random.uniform(0, args.think_time))
+
+        timed(results, 'GET /get_history', lambda: client.get('/get_history'))
+        if exported:
+            timed(results, 'POST /download_chat', lambda: client.post('/download_chat', json={'messages': exported}))
+
+
+def prepare_database(directory):
+    """Fresh users.db with the full schema, built by the repo's own migration scripts."""
+    path = os.path.join(directory, 'users.db')
+    conn = sqlite3.connect(path)
+    conn.execute(USERS_SCHEMA)
+    conn.commit()
+    conn.close()
+    for script in TABLE_MIGRATIONS:
+        subprocess.run([sys.executable, os.path.join(BASE_DIR, script)], cwd=directory,
+                       check=True, stdout=subprocess.DEVNULL)
+    return path
+
+
+def start_local_app(args, workdir):
+    """Import main.py against the fake API and serve it on a background thread."""
+    fake = fake_openai_server.serve(args.fake_port, args.api_latency, args.run_latency, args.failure_rate)
+    os.environ.update({
+        'OPENAI_BASE_URL': f'http://127.0.0.1:{args.fake_port}/v1',
+        'OPENAI_API_KEY': 'sk-loadtest',
+        'OPENAI_ASSISTANT_ID': 'asst_fake',
+        'RATE_LIMIT_PER_DAY': str(max(args.chats * 10, 100)),
+    })
+    if args.no_answer_cache:
+        os.environ['ANSWER_CACHE_SIZE'] = '0'
+    db_path = prepare_database(workdir)
+
+    import db
+    db.DB_PATH = db_path
+    import main
+    # Keep fake file IDs out of the real file_id_mapping.json
+    main.document_index.path = os.path.join(workdir, 'file_id_mapping.json')
+    main.document_index.load()
+
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', args.port, main.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, name='app', daemon=True).start()
+    return f'http://127.0.0.1:{args.port}', [server, fake]
+
+
+def report(results, elapsed):
+    print(f"\n{'endpoint':<22} {'count':>6} {'errors':>6} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for endpoint in sorted(results.latencies):
+        values = sorted(results.latencies[endpoint])
+        print(f"{endpoint:<22} {len(values):>6} {results.errors[endpoint]:>6} {len(values) / elapsed:>7.2f} "
+              f"{percentile(values, 0.50) * 1000:>8.0f} {percentile(values, 0.95) * 1000:>8.0f} "
+              f"{percentile(values, 0.99) * 1000:>8.0f} {values[-1] * 1000:>8.0f}")
+    total = sum(len(v) for v in results.latencies.values())
+    print(f"\n{total} requests in {elapsed:.1f}s ({total / elapsed:.2f} req/s), "
+          f"{sum(results.errors.values())} errors")
+
+
+def report_polling(state):
+    """Status checks per polled (/chat) run and how late the poller noticed runs finishing."""
+    if not state.polled_runs:
+        return
+    delays = sorted(state.notice_delays)
+    print(f"{state.polled_runs} polled runs, {state.status_checks / state.polled_runs:.1f} runs.retrieve calls per run, "
+          f"finish noticed p50 {percentile(delays, 0.50) * 1000:.0f} ms / p95 {percentile(delays, 0.95) * 1000:.0f} ms late")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline load test with a fake OpenAI API.')
+    parser.add_argument('--students', type=int, default=20)
+    parser.add_argument('--chats', type=int, default=3, help='Messages per student')
+    parser.add_argument('--stream', action='store_true', help='Use /chat/stream instead of /chat')
+    parser.add_argument('--ramp', type=float, default=5.0, help='Seconds over which students start')
+    parser.add_argument('--think-time', type=float, default=1.0, help='Max pause between messages')
+    parser.add_argument('--timeout', type=float, default=300.0)
+    parser.add_argument('--url', help='Test an already running app instead of starting one')
+    parser.add_argument('--port', type=int, default=5055, help='Port for the in-process app')
+    parser.add_argument('--fake-port', type=int, default=8765, help='Port for the fake OpenAI API')
+    parser.add_argument('--verbose', action='store_true', help="Show the app's own logging")
+    parser.add_argument('--no-answer-cache', action='store_true',
+                        help='Run the assistant for every message (the sample questions repeat a lot)')
+    fake_openai_server.add_arguments(parser)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='counselor-loadtest-')
+    servers = []
+    try:
+        if args.url:
+            base_url = args.url.rstrip('/')
+        else:
+            base_url, servers = start_local_app(args, workdir)
+        print(f"Load testing {base_url} with {args.students} students x {args.chats} messages")
+
+        results = Results()
+        students = []
+        start = time.perf_counter()
+        # The app prints a few lines per request; keep them out of the report unless asked
+        with contextlib.redirect_stdout(sys.stdout if args.verbose else open(os.devnull, 'w')):
+            for index in range(args.students):
+                thread = threading.Thread(target=run_student, args=(base_url, index, args, results), daemon=True)
+                thread.start()
+                students.append(thread)
+                time.sleep(args.ramp / max(args.students, 1))
+            for thread in students:
+                thread.join()
+        report(results, time.perf_counter() - start)
+        if not args.url:
+            report_polling(servers[1].RequestHandlerClass.state)
+    finally:
+        for server in servers:
+            server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,36 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, send_file, abort
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, send_file, abort, Response, stream_with_context
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from openai import OpenAI
 import os
+import mimetypes
 from dotenv import load_dotenv
-import markdown
-import re
+import json
 import time
 import secrets
 import sqlite3
-from datetime import datetime, date, timedelta
+import db
+import rate_limit
+import chat_history
+import rendering
+import pdf_export
+import background
+import thread_sweeper
+import run_metadata
+import metrics
+import search_index
+import pdf_slices
+import downloads
+import assets
+import course_catalog
+import prereq_graph
+from datetime import datetime, date
 from urllib.parse import quote
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib.enums import TA_LEFT, TA_RIGHT
-from io import BytesIO
-from html import unescape
+from html import escape
+from run_poller import RunPoller
+from doc_index import DocumentIndex
+from answer_cache import AnswerCache, SHARED_ANSWER_INSTRUCTIONS, grade_key
+from suggest import SuggestIndex
 
 load_dotenv()
 
@@ -29,77 +42,98 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+# Per-route request timing; phases are timed with metrics.span below
+metrics.install(app)
+
 client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
 ASSISTANT_ID = os.getenv('OPENAI_ASSISTANT_ID')
+run_poller = RunPoller(client)
 
 print(f"✓ Using Assistant: {ASSISTANT_ID}")
 
-# Database path
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-if os.path.exists('/home/VihaanAgrawal'):
-    DB_PATH = '/home/VihaanAgrawal/emerald-counselor-ai/users.db'
-else:
-    DB_PATH = os.path.join(BASE_DIR, 'users.db')
+# PDF documents directory
+PDF_DIR = os.path.join(os.path.dirname(__file__), 'school_documents')
 
-# Rate limit settings
-MESSAGES_PER_DAY = 20
+# file_id -> local filename index used for citation links
+document_index = DocumentIndex(docs_dir=PDF_DIR)
+document_index.load()
 
-def normalize_date(value):
-    """Normalize stored date/datetime values to YYYY-MM-DD for comparison."""
-    if not value:
-        return None
-    if isinstance(value, date):
-        return value.isoformat()
-    if isinstance(value, datetime):
-        return value.date().isoformat()
-    text = str(value)
-    try:
-        return datetime.fromisoformat(text).date().isoformat()
-    except ValueError:
-        # Fallback for non-ISO strings like "YYYY-MM-DD HH:MM:SS"
-        return text[:10] if len(text) >= 10 else text
+# Fingerprinted assets never change under the same name
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
 
-# PDF documents directory
-PDF_DIR = os.path.join(os.path.dirname(__file__), 'school_documents')
+# PDFs /download may serve, with ETags and gzip variants
+download_index = downloads.DownloadIndex(docs_dir=PDF_DIR)
+download_index.load()
+
+# Local BM25 passages are added to a run when the best one scores at least
+# LOCAL_CONTEXT_MIN_SCORE; from LOCAL_ANSWER_MIN_SCORE file_search is skipped entirely
+LOCAL_CONTEXT_MIN_SCORE = float(os.getenv('LOCAL_CONTEXT_MIN_SCORE', str(search_index.CONTEXT_MIN_SCORE)))
+LOCAL_ANSWER_MIN_SCORE = float(os.getenv('LOCAL_ANSWER_MIN_SCORE', str(search_index.ANSWER_MIN_SCORE)))
+LOCAL_CONTEXT_CHARS = 6000
+search_index.get_index()  # mmap it once here; forked workers share the mapping
+
+# Answers to repeated questions, per grade; cleared when the documents are re-ingested
+answers = AnswerCache()
+
+# Course/document title completions for the chat box (built on first use)
+suggestions = SuggestIndex(docs_dir=PDF_DIR)
 
 # User class for Flask-Login
 class User(UserMixin):
-    def __init__(self, id, username, class_of, thread_id, messages_today=0, last_message_date=None, tutorial_completed=0, display_name=None, current_grade=None, bio=None):
+    def __init__(self, id, username, class_of, thread_id, messages_today=0, last_message_date=None, tutorial_completed=0, display_name=None, current_grade=None, bio=None, thread_created_at=None):
         self.id = id
         self.username = username
         self.class_of = class_of
         self.thread_id = thread_id
+        self.thread_created_at = thread_created_at
         self.messages_today = messages_today
         self.last_message_date = last_message_date
         self.tutorial_completed = tutorial_completed
         self.display_name = display_name
         self.current_grade = current_grade
         self.bio = bio
+        self._context_str = None
+
+    @classmethod
+    def from_row(cls, row):
+        """Build a User from a full db.UserRow (profile, thread and quota fields included)"""
+        return cls(row.id, row.username, row.class_of, row.thread_id, row.messages_today,
+                   row.last_message_date, row.tutorial_completed, row.display_name or None,
+                   row.current_grade or None, row.bio or None, row.thread_created_at)
+
+    def context_string(self):
+        """The profile summary sent as [User Context: ...]; built once and reused"""
+        if self._context_str is None:
+            context_parts = [f"Username: {self.username}", f"Graduation Year: Class of {self.class_of}"]
+            if self.display_name and self.display_name != self.username:
+                context_parts.append(f"Display Name: {self.display_name}")
+            if self.current_grade:
+                context_parts.append(f"Current Grade: {self.current_grade}")
+            if self.bio:
+                context_parts.append(f"Bio/Interests: {self.bio}")
+            self._context_str = ", ".join(context_parts)
+        return self._context_str
+
+    def update_profile(self, display_name, current_grade, bio):
+        """Apply saved profile fields and drop the cached context string"""
+        self.display_name = display_name
+        self.current_grade = current_grade
+        self.bio = bio
+        self._context_str = None
 
+# Flask-Login calls this once per request and keeps the result as current_user,
+# so every route reads the users row a single time
 @login_manager.user_loader
 def load_user(user_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    try:
-        cursor.execute('SELECT id, username, class_of, thread_id, messages_today, last_message_date, tutorial_completed FROM users WHERE id = ?', (user_id,))
-    except sqlite3.OperationalError:
-        # Fallback for databases without tutorial_completed column
-        cursor.execute('SELECT id, username, class_of, thread_id, messages_today, last_message_date FROM users WHERE id = ?', (user_id,))
-    user_data = cursor.fetchone()
-    conn.close()
-
-    if user_data:
-        if len(user_data) >= 7:
-            return User(user_data[0], user_data[1], user_data[2], user_data[3], user_data[4] or 0, user_data[5], user_data[6] or 0)
-        else:
-            return User(user_data[0], user_data[1], user_data[2], user_data[3], user_data[4] or 0, user_data[5], 0)
+    with metrics.span('db.load_user'):
+        row = db.get_user(user_id)
+    if row:
+        return User.from_row(row)
     return None
 
 def process_citations(text):
     """Remove citation markers from text"""
-    citation_pattern = r'【\d+:\d+†[^】]+】'
-    text = re.sub(citation_pattern, '', text)
-    return text
+    return rendering.strip_citations(text)
 
 def extract_file_ids_from_message(message):
     """Extract file IDs from OpenAI message annotations"""
@@ -125,6 +159,11 @@ def extract_file_ids_from_message(message):
                                         file_id = file_path_obj['file_id']
                                         file_ids.add(file_id)
                                         print(f"Found file_id via file_path (dict): {file_id}")
+                            # file_search citations carry file_citation.file_id
+                            file_citation_obj = getattr(annotation, 'file_citation', None)
+                            if file_citation_obj and getattr(file_citation_obj, 'file_id', None):
+                                file_ids.add(file_citation_obj.file_id)
+                                print(f"Found file_id via file_citation: {file_citation_obj.file_id}")
                             # Try direct file_id attribute
                             if hasattr(annotation, 'file_id'):
                                 file_id = annotation.file_id
@@ -151,117 +190,52 @@ def extract_file_ids_from_message(message):
     return file_ids
 
 def get_filename_from_file_id(file_id):
-    """Get local filename from OpenAI file ID"""
-    try:
-        file_info = client.files.retrieve(file_id)
-        openai_filename = file_info.filename
-        # Map OpenAI filename to local filename
-        # OpenAI might have different naming, so we try to match
-        local_files = os.listdir(PDF_DIR)
-        for local_file in local_files:
-            if local_file.endswith('.pdf'):
-                # Simple matching - check if OpenAI filename matches or is similar
-                if openai_filename.lower() in local_file.lower() or local_file.lower() in openai_filename.lower():
-                    return local_file
-        # If no match found, return OpenAI filename
-        return openai_filename
-    except Exception as e:
-        print(f"Error getting filename for file_id {file_id}: {e}")
-        return None
-
-def check_and_update_rate_limit(user_id, username):
-    """Check if user has exceeded rate limit and update count"""
-    # Special user "Vihaan Agrawal" has unlimited messages
-    if username == "Vihaan Agrawal":
-        return True, 0  # Always allowed, return 0 for count (unlimited)
-    
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    # Get user's message count and last message date
-    cursor.execute('SELECT messages_today, last_message_date FROM users WHERE id = ?', (user_id,))
-    result = cursor.fetchone()
-
-    messages_today = result[0] or 0
-    last_message_date = result[1]
-    today = date.today().isoformat()
-    last_date = normalize_date(last_message_date)
-
-    # Reset count if it's a new day
-    if last_date != today:
-        messages_today = 0
-        cursor.execute('UPDATE users SET messages_today = ?, last_message_date = ? WHERE id = ?',
-                       (0, today, user_id))
-        conn.commit()
-
-    # Check if user has exceeded limit
-    if messages_today >= MESSAGES_PER_DAY:
-        conn.close()
-        return False, messages_today
-
-    # Increment message count
-    messages_today += 1
-    cursor.execute('UPDATE users SET messages_today = ?, last_message_date = ? WHERE id = ?',
-                   (messages_today, today, user_id))
-    conn.commit()
-    conn.close()
-
-    if current_user.is_authenticated and current_user.id == user_id:
-        current_user.messages_today = messages_today
-        current_user.last_message_date = today
-
-    return True, messages_today
-
-def get_rate_limit_status(user_id, username):
-    """Return remaining messages and ensure daily reset is persisted."""
-    if username == "Vihaan Agrawal":
-        return {'remaining': 'unlimited', 'is_unlimited': True}
-
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT messages_today, last_message_date FROM users WHERE id = ?', (user_id,))
-    result = cursor.fetchone()
-    today = date.today().isoformat()
-
-    messages_today = (result[0] if result else 0) or 0
-    last_message_date = result[1] if result else None
-    last_date = normalize_date(last_message_date)
-
-    if last_date != today:
-        messages_today = 0
-        cursor.execute('UPDATE users SET messages_today = ?, last_message_date = ? WHERE id = ?',
-                       (0, today, user_id))
-        conn.commit()
-
-    conn.close()
-    remaining = max(MESSAGES_PER_DAY - messages_today, 0)
-    return {'remaining': remaining, 'is_unlimited': False}
+    """Get local filename from OpenAI file ID (via file_id_mapping.json; API only on a miss)"""
+    return document_index.lookup(file_id, client=client)
+
+@app.context_processor
+def asset_helpers():
+    """asset_url('script.js') -> fingerprinted /assets/ URL after `python assets.py build`, else /static/"""
+    def asset_url(name):
+        hashed = assets.hashed_name(name)
+        if hashed:
+            return url_for('serve_asset', filename=hashed)
+        return url_for('static', filename=name)
+    return {'asset_url': asset_url}
+
+@app.route('/assets/<filename>')
+def serve_asset(filename):
+    """Fingerprinted build output: cached for a year, brotli/gzip when the browser takes it"""
+    filename = os.path.basename(filename)
+    path = os.path.join(assets.DIST_DIR, filename)
+    if filename == 'manifest.json' or not os.path.isfile(path):
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0]
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[candidate] and os.path.isfile(path + suffix):
+            path, encoding = path + suffix, candidate
+            break
+    response = send_file(path, mimetype=mimetype, max_age=ASSET_MAX_AGE, conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
 
 @app.route('/')
 @login_required
 def home():
-    # Calculate remaining messages (unlimited for "Vihaan Agrawal")
-    rate_status = get_rate_limit_status(current_user.id, current_user.username)
+    # Calculate remaining messages (unlimited for users listed in RATE_LIMIT_OVERRIDES)
+    rate_status = rate_limit.get_status(current_user)
     remaining = rate_status['remaining']
     is_unlimited = rate_status['is_unlimited']
 
-    # Get profile and tutorial info
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    try:
-        cursor.execute('SELECT tutorial_completed, display_name, current_grade, bio FROM users WHERE id = ?', (current_user.id,))
-        result = cursor.fetchone()
-        tutorial_completed = result[0] if result and result[0] is not None else 0
-        display_name = result[1] if result and result[1] else None
-        current_grade = result[2] if result and result[2] else None
-        bio = result[3] if result and result[3] else None
-    except sqlite3.OperationalError:
-        # Columns don't exist yet
-        tutorial_completed = 0
-        display_name = None
-        current_grade = None
-        bio = None
-    conn.close()
+    # Profile and tutorial info were loaded with the user
+    tutorial_completed = current_user.tutorial_completed
+    display_name = current_user.display_name
+    current_grade = current_user.current_grade
+    bio = current_user.bio
 
     return render_template('index.html',
                          username=current_user.username,
@@ -273,67 +247,90 @@ def home():
                          current_grade=current_grade,
                          bio=bio)
 
+def render_history_message(role, content):
+    """Render one stored thread message the way the chat window shows it"""
+    # Remove user context from user messages
+    if role == 'user' and '[User Context:' in content:
+        # Extract just the student question
+        parts = content.split('Student Question: ')
+        if len(parts) > 1:
+            content = parts[1]
+
+    # Convert markdown to HTML for assistant messages (citations are removed in the same pass)
+    if role == 'assistant':
+        return rendering.render_markdown(content)
+    # For user messages, convert newlines to <br>
+    return content.replace('\n', '<br>')
+
 @app.route('/get_history', methods=['GET'])
 @login_required
 def get_history():
-    """Load previous chat messages for this user"""
+    """Load previous chat messages for this user (newest page first; ?before=<cursor> for older)"""
     try:
-        thread_id = current_user.thread_id
-
-        if not thread_id:
-            # No previous conversation
-            return jsonify({'messages': []})
+        messages, next_cursor = history_page(request.args.get('before'))
+        return jsonify({'messages': messages, 'next_cursor': next_cursor})
 
-        # Get all messages from the thread
-        messages = client.beta.threads.messages.list(
-            thread_id=thread_id,
-            order='asc',  # Oldest first
-            limit=100  # Get last 100 messages
-        )
-
-        # Format messages for display
-        chat_history = []
-        for msg in messages.data:
-            role = msg.role  # 'user' or 'assistant'
-            content = msg.content[0].text.value
-
-            # Remove user context from user messages
-            if role == 'user' and '[User Context:' in content:
-                # Extract just the student question
-                parts = content.split('Student Question: ')
-                if len(parts) > 1:
-                    content = parts[1]
-
-            # Remove citations from assistant messages
-            if role == 'assistant':
-                content = process_citations(content)
-
-            # Convert markdown to HTML for assistant messages
-            if role == 'assistant':
-                content = markdown.markdown(
-                    content,
-                    extensions=['fenced_code', 'codehilite', 'nl2br', 'tables', 'sane_lists']
-                )
-            else:
-                # For user messages, convert newlines to <br>
-                content = content.replace('\n', '<br>')
+    except Exception as e:
+        print(f"Error loading history: {e}")
+        return jsonify({'messages': [], 'next_cursor': None})
 
-            chat_history.append({
-                'role': role,
-                'content': content
-            })
+def history_page(before=None):
+    """(messages, next_cursor) for one page of the current user's conversation"""
+    thread_id = current_user.thread_id
 
-        return jsonify({'messages': chat_history})
+    if not thread_id:
+        # No previous conversation
+        return [], None
 
+    try:
+        if not before and not chat_history.has_messages(thread_id):
+            # Conversation from before the local mirror existed: backfill it once
+            with metrics.span('openai.history.backfill'):
+                chat_history.sync_thread(client, current_user.id, thread_id, render_history_message)
+        else:
+            chat_history.schedule_sync(client, current_user.id, thread_id, render_history_message)
+        with metrics.span('db.history.read'):
+            return chat_history.get_page(thread_id, before)
+    except sqlite3.OperationalError as e:
+        # chat_messages table missing - read straight from OpenAI like before
+        print(f"Local history unavailable ({e}); run migration_add_chat_history.py")
+        messages = client.beta.threads.messages.list(thread_id=thread_id, order='asc', limit=100)
+        messages = [{'role': msg.role, 'content': render_history_message(msg.role, msg.content[0].text.value)}
+                    for msg in messages.data]
+        return messages, None
+
+def profile_fields():
+    """The profile as /profile and /bootstrap return it"""
+    return {
+        'display_name': current_user.display_name,
+        'current_grade': current_user.current_grade,
+        'bio': current_user.bio,
+        'username': current_user.username,
+        'class_of': current_user.class_of
+    }
+
+@app.route('/bootstrap', methods=['GET'])
+@login_required
+def bootstrap():
+    """Everything the chat page needs after it loads, in one response:
+    profile, message quota, tutorial state and the newest page of history"""
+    try:
+        messages, next_cursor = history_page()
     except Exception as e:
         print(f"Error loading history: {e}")
-        return jsonify({'messages': []})
+        messages, next_cursor = [], None
+    return jsonify({
+        'profile': profile_fields(),
+        'quota': rate_limit.get_status(current_user),
+        'tutorial': {'completed': current_user.tutorial_completed or 0},
+        'history': {'messages': messages, 'next_cursor': next_cursor},
+    })
 
 @app.route('/get_remaining_messages', methods=['GET'])
 @login_required
 def get_remaining_messages():
     """Get remaining messages for current user"""
-    rate_status = get_rate_limit_status(current_user.id, current_user.username)
+    rate_status = rate_limit.get_status(current_user)
     return jsonify(rate_status)
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -342,14 +339,10 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
 
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, username, password_hash, class_of, thread_id, messages_today, last_message_date FROM users WHERE username = ?', (username,))
-        user_data = cursor.fetchone()
-        conn.close()
+        user_data = db.get_password_hash(username)
 
-        if user_data and check_password_hash(user_data[2], password):
-            user = User(user_data[0], user_data[1], user_data[3], user_data[4], user_data[5] or 0, user_data[6])
+        if user_data and check_password_hash(user_data[1], password):
+            user = User.from_row(db.get_user(user_data[0]))
             login_user(user)
             return redirect(url_for('home'))
         else:
@@ -385,36 +378,16 @@ def signup():
         try:
             for attempt in range(1, 4):
                 try:
-                    conn = sqlite3.connect(DB_PATH, timeout=10.0)
-                    cursor = conn.cursor()
-                    cursor.execute('PRAGMA journal_mode=WAL')
-                    cursor.execute('PRAGMA busy_timeout=30000')
-                    cursor.execute(
-                        'INSERT INTO users (username, password_hash, class_of, messages_today, last_message_date, ip_address) VALUES (?, ?, ?, 0, ?, ?)',
-                        (username, password_hash, class_of, str(date.today()), ip_address)
-                    )
-                    user_id = cursor.lastrowid
-                    conn.commit()
+                    user_id = db.create_user(username, password_hash, class_of, str(date.today()), ip_address)
                     break
                 except sqlite3.OperationalError as e:
                     if "locked" in str(e).lower() and attempt < 3:
                         time.sleep(0.5 * attempt)
                         continue
                     raise
-                finally:
-                    if 'conn' in locals():
-                        conn.close()
-
-            # Get tutorial_completed status (default to 0 for new users)
-            conn = sqlite3.connect(DB_PATH, timeout=10.0)
-            cursor = conn.cursor()
-            cursor.execute('SELECT tutorial_completed FROM users WHERE id = ?', (user_id,))
-            result = cursor.fetchone()
-            conn.close()
-            tutorial_completed = result[0] if result and len(result) > 0 and result[0] is not None else 0
 
             # Auto-login the user after signup
-            user = User(user_id, username, class_of, None, 0, str(date.today()), tutorial_completed)
+            user = User.from_row(db.get_user(user_id))
             login_user(user)
             return redirect(url_for('home'))
         except sqlite3.IntegrityError:
@@ -439,14 +412,40 @@ def download_file(filename):
     # Security: prevent directory traversal
     filename = os.path.basename(filename)
     
-    # Check if file exists
-    file_path = os.path.join(PDF_DIR, filename)
-    
-    if not os.path.exists(file_path) or not filename.endswith('.pdf'):
+    # Only PDFs in the download index are served; it also carries the ETag and size
+    document = download_index.get(filename)
+    if document is None:
         abort(404)
     
-    # Send file
-    return send_file(file_path, as_attachment=True, download_name=filename)
+    # Citation links ask for just the cited pages: ?pages=3 or ?pages=3-4. When no slice can be
+    # cut (no PDF text store yet, a changed PDF, a one-page document) the whole PDF is sent instead
+    slice_path = None
+    pages = pdf_slices.parse_pages(request.args.get('pages'))
+    if pages:
+        with metrics.span('pdf.slice'):
+            try:
+                slice_path = pdf_slices.get_slice(filename, *pages, docs_dir=PDF_DIR)
+            except Exception as e:
+                print(f"Could not slice {filename} pages {pages}: {e}")
+    if slice_path:
+        # Slice names are derived from the source's content hash, so they make a strong ETag
+        response = send_file(slice_path, as_attachment=True, download_name=pdf_slices.slice_name(filename, *pages),
+                             etag=os.path.splitext(os.path.basename(slice_path))[0], max_age=downloads.MAX_AGE)
+    elif document.gzip_path and 'Range' not in request.headers and request.accept_encodings['gzip']:
+        # Precompressed copy; range requests get the plain file so resumed downloads line up
+        response = send_file(document.gzip_path, mimetype='application/pdf', as_attachment=True, download_name=filename,
+                             etag=f'{document.etag}-gzip', last_modified=document.mtime, max_age=downloads.MAX_AGE)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        # send_file answers If-None-Match/If-Modified-Since with 304 and Range with 206
+        response = send_file(document.path, as_attachment=True, download_name=filename,
+                             etag=document.etag, last_modified=document.mtime, max_age=downloads.MAX_AGE)
+    if document.gzip_path and not slice_path:
+        response.vary.add('Accept-Encoding')
+    # send_file marks responses with a max_age public; these are behind a login
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
 
 @app.route('/download_chat', methods=['POST'])
 @login_required
@@ -459,96 +458,314 @@ def download_chat():
         if not messages:
             return jsonify({'error': 'No messages selected'}), 400
         
-        # Create PDF in memory
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter,
-                                rightMargin=72, leftMargin=72,
-                                topMargin=72, bottomMargin=18)
-        
-        # Container for the 'Flowable' objects
-        elements = []
-        
-        # Define styles
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=16,
-            textColor='#1b5e20',
-            spaceAfter=12,
-        )
-        user_style = ParagraphStyle(
-            'UserMessage',
-            parent=styles['BodyText'],
-            fontSize=10,
-            leftIndent=20,
-            rightIndent=20,
-            textColor='#1976d2',
-            spaceAfter=12,
-            spaceBefore=6,
-        )
-        bot_style = ParagraphStyle(
-            'BotMessage',
-            parent=styles['BodyText'],
-            fontSize=10,
-            leftIndent=20,
-            rightIndent=20,
-            textColor='#1b5e20',
-            spaceAfter=12,
-            spaceBefore=6,
-        )
-        
-        # Add title
-        title = Paragraph(f"Chat Export - {current_user.username}<br/>Emerald High School Counselor Assistant", title_style)
-        elements.append(title)
-        elements.append(Spacer(1, 0.2*inch))
-        elements.append(Paragraph(f"Generated: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}", styles['Normal']))
-        elements.append(Spacer(1, 0.3*inch))
-        
-        # Add messages
-        for msg in messages:
-            role = msg.get('role', '')
-            content = msg.get('content', '')
-            
-            # Clean HTML tags and decode entities
-            content = re.sub(r'<[^>]+>', '', content)  # Remove HTML tags
-            content = unescape(content)  # Decode HTML entities
-            content = content.replace('\n', '<br/>')  # Preserve line breaks
-            
-            if role == 'user':
-                label = f"<b>You:</b><br/>{content}"
-                p = Paragraph(label, user_style)
-            else:
-                label = f"<b>AI Counselor:</b><br/>{content}"
-                p = Paragraph(label, bot_style)
-            
-            elements.append(p)
-            elements.append(Spacer(1, 0.2*inch))
-        
-        # Build PDF
-        doc.build(elements)
+        # Build the PDF straight into the buffer send_file streams from
+        with metrics.span('pdf.build'):
+            buffer = pdf_export.build_chat_pdf(messages, current_user.username, base_url=request.host_url)
         
-        # Get PDF data
-        buffer.seek(0)
-        pdf_data = buffer.getvalue()
-        buffer.close()
-        
-        # Create response
-        response = send_file(
-            BytesIO(pdf_data),
+        return send_file(
+            buffer,
             mimetype='application/pdf',
             as_attachment=True,
             download_name=f'chat_export_{datetime.now().strftime("%Y%m%d")}.pdf'
         )
         
-        return response
-        
     except Exception as e:
         print(f"Error generating PDF: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': 'Error generating PDF'}), 500
 
+@app.route('/courses', methods=['GET'])
+@login_required
+def list_courses():
+    """Course catalog lookup: ?q=<title or number>&department=&grade=&area=<a-g letter>&level=AP|Honors&limit=&full=1"""
+    grade = request.args.get('grade')
+    level = request.args.get('level')
+    if grade is not None and grade not in ('9', '10', '11', '12'):
+        return jsonify({'error': 'grade must be 9, 10, 11, or 12'}), 400
+    if level is not None:
+        level = {name.lower(): name for name in course_catalog.LEVELS}.get(level.lower())
+        if level is None:
+            return jsonify({'error': 'level must be AP or Honors'}), 400
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
+    try:
+        with metrics.span('db.courses.search'):
+            courses = course_catalog.search(q=request.args.get('q'), department=request.args.get('department'),
+                                            grade=int(grade) if grade else None, area=request.args.get('area'),
+                                            level=level, limit=limit, full=request.args.get('full') == '1')
+    except sqlite3.OperationalError as e:
+        print(f"Course catalog unavailable ({e}); run migration_add_courses.py and course_catalog.py build")
+        return jsonify({'error': 'Course catalog not available'}), 503
+    return jsonify({'courses': courses, 'count': len(courses)})
+
+@app.route('/courses/<course_number>', methods=['GET'])
+@login_required
+def get_course(course_number):
+    """Every catalog entry for one course number, with its full description"""
+    try:
+        with metrics.span('db.courses.lookup'):
+            courses = course_catalog.lookup(course_number.strip())
+    except sqlite3.OperationalError as e:
+        print(f"Course catalog unavailable ({e}); run migration_add_courses.py and course_catalog.py build")
+        return jsonify({'error': 'Course catalog not available'}), 503
+    if not courses:
+        return jsonify({'error': 'Course not found'}), 404
+    return jsonify({'courses': courses})
+
+@app.route('/suggest', methods=['GET'])
+@login_required
+def suggest_completions():
+    """Completions for the end of what the student is typing: ?q=can I take ap calc"""
+    with metrics.span('suggest'):
+        matched, found = suggestions.suggest(request.args.get('q', '')[-200:])
+    return jsonify({
+        'matched': matched,
+        'suggestions': [{'label': s.label, 'kind': s.kind, 'course_number': s.course_number, 'filename': s.filename}
+                        for s in found],
+    })
+
+@app.route('/plan/validate', methods=['POST'])
+@login_required
+def validate_plan():
+    """Check a course plan against catalog prerequisites, grade levels and the planning sheets.
+
+    Body: {"plan": {"9": ["Algebra 1", ...], ...}, "completed": [...]} or {"text": "9: Algebra 1, Biology; 10: ..."}
+    """
+    data = request.get_json(silent=True) or {}
+    graph = prereq_graph.get_graph()
+    if graph is None:
+        print("Course graph missing; run: python prereq_graph.py build")
+        return jsonify({'error': 'Course plan checking is not available'}), 503
+
+    if 'text' in data:
+        plan, completed = prereq_graph.parse_plan_text(str(data['text']))
+    else:
+        plan, completed = data.get('plan') or {}, data.get('completed') or []
+        # A bare string would otherwise be checked one character at a time
+        if not isinstance(plan, dict) or not all(isinstance(refs, list) for refs in plan.values()):
+            return jsonify({'error': 'plan must map grades to lists of courses'}), 400
+        if not isinstance(completed, list):
+            return jsonify({'error': 'completed must be a list of courses'}), 400
+        try:
+            plan = {int(grade): [str(ref) for ref in refs] for grade, refs in plan.items()}
+        except ValueError:
+            return jsonify({'error': 'plan must map grades to lists of courses'}), 400
+        completed = [str(ref) for ref in completed]
+    if not plan or any(grade not in prereq_graph.GRADES for grade in plan):
+        return jsonify({'error': 'List courses for grades 9-12, e.g. "9: Algebra 1, Biology; 10: Geometry"'}), 400
+
+    with metrics.span('plan.validate'):
+        result = graph.validate(plan, completed)
+    result['response'] = prereq_graph.render_result(result)
+    return jsonify(result)
+
+def limit_reached_response(rate_status):
+    """HTML shown when the daily message limit has been used up"""
+    return f'<p><strong>Daily message limit reached!</strong></p><p>You\'ve used all {rate_status["limit"]} messages for today. Your limit will reset tomorrow.</p><p>If you need more assistance, please contact your school counselor directly.</p>'
+
+def get_or_create_thread():
+    """Return the current user's thread ID, replacing it if the conversation expired"""
+    # thread_id and thread_created_at were loaded with the user
+    thread_id = current_user.thread_id
+    thread_created_at = current_user.thread_created_at
+    
+    # Check if thread exists and is older than 7 days (each conversation gets 7 days from creation)
+    should_create_new_thread = False
+    expired_thread_id = None
+    if thread_id:
+        if thread_created_at:
+            if thread_sweeper.is_expired(thread_created_at):
+                # This conversation expired after 7 days; thread_sweeper.py deletes it later
+                expired_thread_id = thread_id
+                should_create_new_thread = True
+            else:
+                # Thread is still valid (less than 7 days old) - reuse it to maintain memory
+                print(f"Reusing existing thread {thread_id} for {current_user.username} (memory preserved)")
+        else:
+            # Thread exists but no timestamp - initialize timestamp instead of deleting
+            # This handles threads created before the migration
+            now = datetime.now().isoformat()
+            db.update_user_fields(current_user.id, thread_created_at=now)
+            current_user.thread_created_at = now
+            print(f"Initialized timestamp for existing thread {thread_id} for {current_user.username}")
+    else:
+        should_create_new_thread = True
+    
+    # Create new thread/conversation if needed (each gets its own 7-day timer)
+    if should_create_new_thread:
+        thread = client.beta.threads.create()
+        thread_id = thread.id
+        now = datetime.now().isoformat()
+        
+        if not thread_sweeper.replace_thread(current_user.id, expired_thread_id, thread_id, now) and expired_thread_id:
+            # Queue table missing; fall back to deleting off the request path
+            background.submit(thread_sweeper.delete_thread_now, client, expired_thread_id)
+        
+        current_user.thread_id = thread_id
+        current_user.thread_created_at = now
+        if expired_thread_id:
+            print(f"Queued expired thread {expired_thread_id} for {current_user.username} (older than 7 days)")
+        print(f"Created new conversation thread for {current_user.username}: {thread_id} (expires in 7 days)")
+    
+    return thread_id
+
+def build_contextual_message(user_message, shared_grade=None):
+    """Prefix the student's question with their profile so the assistant can personalize.
+
+    Questions answered for the shared answer cache carry only the grade.
+    """
+    context_str = f"Current Grade: {shared_grade}" if shared_grade else current_user.context_string()
+    return f"""[User Context: {context_str}]
+
+Student Question: {user_message}"""
+
+def local_run_options(user_message):
+    """Extra runs.create arguments carrying the best local passages for this question.
+
+    Returns (kwargs, passages). The passages go into additional_instructions so
+    the assistant can often answer without a file_search call; when the best
+    match is strong enough (LOCAL_ANSWER_MIN_SCORE) file_search is turned off.
+    Weak matches (below LOCAL_CONTEXT_MIN_SCORE) are left out, so those runs cost
+    no more than before.
+    """
+    with metrics.span('search.local'):
+        passages = search_index.retrieve(user_message)
+    if not passages or passages[0].score < LOCAL_CONTEXT_MIN_SCORE:
+        return {}, []
+
+    excerpts, used = [], 0
+    for n, passage in enumerate(passages, start=1):
+        text = ' '.join(passage.text.split())[:LOCAL_CONTEXT_CHARS - used]
+        if not text:
+            break
+        excerpts.append(f"[{n}] {passage.label()}\n{text}")
+        used += len(text)
+    options = {'additional_instructions': (
+        "Excerpts from the school documents that match the student's question. "
+        "Use them when they answer it; search the files only for what they don't cover.\n\n"
+        + '\n\n'.join(excerpts))}
+    if passages[0].score >= LOCAL_ANSWER_MIN_SCORE:
+        options['tool_choice'] = 'none'
+    return options, passages[:len(excerpts)]
+
+def shared_answer_grade(user, user_message):
+    """The grade to run this question for without personalization (its answer gets cached), or None"""
+    grade = grade_key(user.current_grade, user.class_of)
+    return grade if grade and answers.accepts(user_message) else None
+
+def add_shared_answer_instructions(run_options):
+    """Ask for an answer that can be shown to any student in the grade"""
+    extra = run_options.get('additional_instructions')
+    run_options['additional_instructions'] = f"{SHARED_ANSWER_INSTRUCTIONS}\n\n{extra}" if extra else SHARED_ANSWER_INSTRUCTIONS
+
+def greet(user, html):
+    """Shared answers leave out the student's name; put the greeting back for this student"""
+    return f'<p>Hi {escape(user.display_name or user.username)}!</p>' + html
+
+def source_list_item(filename, label, href):
+    """One "Source Documents" entry: a download link for PDFs, plain text for sources /download can't serve"""
+    if not filename.lower().endswith('.pdf'):
+        return f'<li>📄 {escape(label)}</li>'
+    return f'<li><a href="{href}" class="pdf-download-link" data-filename="{escape(filename)}" style="color: #1976d2; text-decoration: underline;">📥 {escape(label)}</a></li>'
+
+def render_bot_response(message, local_sources=()):
+    """Turn a completed assistant message into the HTML shown in the chat window"""
+    bot_response_text = message.content[0].text.value
+
+    print(f"Assistant responded: {bot_response_text[:100]}...")
+
+    # Note: file_search doesn't tell us which specific files were used
+    # We can only show source links if we can extract specific file IDs from annotations
+    # For now, we won't show links when only file_search is used (since it searches all files)
+    with metrics.span('citations.extract'):
+        file_ids = extract_file_ids_from_message(message)
+
+    # Only show source links if we have specific file IDs from annotations
+    # (Not showing all files from vector store since file_search doesn't specify which were used)
+    download_links_html = ""
+    if file_ids:
+        download_links_html = '<div style="margin-top: 15px; padding: 10px; background-color: #e3f2fd; border-radius: 8px; border-left: 4px solid #2196f3;"><strong>📄 Source Documents:</strong><ul style="margin: 8px 0 0 0; padding-left: 20px;">'
+        for file_id in file_ids:
+            with metrics.span('citations.lookup'):
+                filename = get_filename_from_file_id(file_id)
+            print(f"Mapping file_id {file_id} to filename: {filename}")
+            if filename:
+                # Chunked sources (e.g. the course catalog) cite a specific section
+                section = document_index.section(file_id)
+                href = f"/download/{quote(filename)}"
+                # PDFs link to just the page that best matches the answer
+                with metrics.span('citations.page'):
+                    pages = None if section else pdf_slices.cited_pages(filename, bot_response_text)
+                if pages:
+                    section = pdf_slices.pages_label(*pages)
+                    href += f"?pages={pdf_slices.pages_arg(*pages)}"
+                # Section citations of Markdown sources are shown as labels: /download only serves PDFs
+                download_links_html += source_list_item(filename, f"{filename} › {section}" if section else filename, href)
+        download_links_html += '</ul></div>'
+    elif local_sources:
+        # No file_search citations: list the local passages the run was given instead
+        download_links_html = '<div style="margin-top: 15px; padding: 10px; background-color: #e3f2fd; border-radius: 8px; border-left: 4px solid #2196f3;"><strong>📄 Source Documents:</strong><ul style="margin: 8px 0 0 0; padding-left: 20px;">'
+        for source in dict.fromkeys(p.source for p in local_sources):
+            sections = [p.section for p in local_sources if p.source == source and p.section]
+            href = f"/download/{quote(source)}"
+            pages = pdf_slices.passage_pages([p for p in local_sources if p.source == source])
+            if pages:
+                sections = [pdf_slices.pages_label(*pages)]
+                href += f"?pages={pdf_slices.pages_arg(*pages)}"
+            # Markdown sources (the course catalog) are listed without a link
+            download_links_html += source_list_item(source, f"{source} › {sections[0]}" if sections else source, href)
+        download_links_html += '</ul></div>'
+    else:
+        print("No file IDs found in message annotations")
+
+    # Convert markdown to HTML (citation markers are stripped during conversion)
+    with metrics.span('markdown.render'):
+        bot_response = rendering.render_markdown(bot_response_text)
+
+    # Add download links if available
+    if download_links_html:
+        bot_response += download_links_html
+
+    return bot_response
+
+def replay_cached_answer(thread_id, user_id, user_message, contextual_message, cached, html):
+    """Add a question answered from the cache, and its answer, to the thread and the local history.
+
+    Runs in the background so the thread still holds the whole conversation
+    for follow-up questions.
+    """
+    user_msg = client.beta.threads.messages.create(thread_id=thread_id, role="user", content=contextual_message)
+    chat_history.record_message(user_id, thread_id, 'user', render_history_message('user', user_message),
+                                user_msg.id, getattr(user_msg, 'created_at', None))
+    bot_msg = client.beta.threads.messages.create(thread_id=thread_id, role="assistant", content=cached.text)
+    chat_history.record_message(user_id, thread_id, 'assistant', html,
+                                bot_msg.id, getattr(bot_msg, 'created_at', None))
+
+def cached_response(user_message):
+    """Cached HTML answer for this student's question, or None. Queues the thread update on a hit."""
+    grade = grade_key(current_user.current_grade, current_user.class_of)
+    with metrics.span('answer_cache.lookup'):
+        cached = answers.get(user_message, grade)
+    if cached is None:
+        return None
+    print(f"Answer cache hit for {current_user.username}")
+    html = greet(current_user, cached.html)
+    with metrics.span('thread.get_or_create'):
+        thread_id = get_or_create_thread()
+    background.submit(replay_cached_answer, thread_id, current_user.id, user_message,
+                      build_contextual_message(user_message, grade), cached, html)
+    return html
+
+def remaining_messages_note(rate_status):
+    """Footer warning shown under a reply when the student is nearly out of messages"""
+    remaining = rate_status['remaining']
+    if not rate_status['is_unlimited'] and remaining <= 3:
+        return f'<p style="margin-top: 15px; font-size: 12px; opacity: 0.7;"><em>💬 {remaining} messages remaining today</em></p>'
+    return ''
+
 @app.route('/chat', methods=['POST'])
 @login_required
 def chat():
@@ -558,223 +775,214 @@ def chat():
     print(f"\n[{current_user.username}] sent: {user_message}")
 
     # Check rate limit
-    allowed, count = check_and_update_rate_limit(current_user.id, current_user.username)
+    with metrics.span('db.rate_limit'):
+        allowed, rate_status = rate_limit.check_and_increment(current_user)
 
     if not allowed:
         return jsonify({
-            'response': f'<p><strong>Daily message limit reached!</strong></p><p>You\'ve used all {MESSAGES_PER_DAY} messages for today. Your limit will reset tomorrow.</p><p>If you need more assistance, please contact your school counselor directly.</p>',
+            'response': limit_reached_response(rate_status),
             'limit_reached': True
         })
 
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Get thread_id and thread_created_at for this user's conversation
-        cursor.execute('SELECT thread_id, thread_created_at FROM users WHERE id = ?', (current_user.id,))
-        result = cursor.fetchone()
-        thread_id = result[0] if result else None
-        thread_created_at = result[1] if result and result[1] else None
-        
-        # Check if thread exists and is older than 7 days (each conversation gets 7 days from creation)
-        should_create_new_thread = False
-        if thread_id:
-            if thread_created_at:
-                # Parse the timestamp and check if this conversation is older than 7 days
-                created_time = datetime.fromisoformat(thread_created_at)
-                if datetime.now() - created_time > timedelta(days=7):
-                    # Delete old thread from OpenAI (this conversation expired after 7 days)
-                    try:
-                        client.beta.threads.delete(thread_id=thread_id)
-                        print(f"Deleted expired thread {thread_id} for {current_user.username} (older than 7 days)")
-                    except Exception as e:
-                        print(f"Error deleting thread {thread_id}: {e}")
-                    should_create_new_thread = True
-                else:
-                    # Thread is still valid (less than 7 days old) - reuse it to maintain memory
-                    print(f"Reusing existing thread {thread_id} for {current_user.username} (memory preserved)")
-            else:
-                # Thread exists but no timestamp - initialize timestamp instead of deleting
-                # This handles threads created before the migration
-                now = datetime.now().isoformat()
-                cursor.execute('UPDATE users SET thread_created_at = ? WHERE id = ?', (now, current_user.id))
-                conn.commit()
-                print(f"Initialized timestamp for existing thread {thread_id} for {current_user.username}")
-        else:
-            should_create_new_thread = True
-        
-        # Create new thread/conversation if needed (each gets its own 7-day timer)
-        if should_create_new_thread:
-            thread = client.beta.threads.create()
-            thread_id = thread.id
-            now = datetime.now().isoformat()
-            
-            cursor.execute('UPDATE users SET thread_id = ?, thread_created_at = ? WHERE id = ?', 
-                         (thread_id, now, current_user.id))
-            conn.commit()
-            
-            current_user.thread_id = thread_id
-            print(f"Created new conversation thread for {current_user.username}: {thread_id} (expires in 7 days)")
-        
-        conn.close()
-
-        # Get user profile info for context
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        display_name = None
-        current_grade = None
-        bio = None
-        
-        try:
-            cursor.execute('SELECT display_name, current_grade, bio FROM users WHERE id = ?', (current_user.id,))
-            profile = cursor.fetchone()
-            if profile:
-                display_name = profile[0] if profile[0] else None
-                current_grade = profile[1] if profile[1] else None
-                bio = profile[2] if profile[2] else None
-        except sqlite3.OperationalError:
-            # Profile columns don't exist yet - use defaults
-            pass
-        
-        conn.close()
-        
-        # Build context string
-        context_parts = [f"Username: {current_user.username}", f"Graduation Year: Class of {current_user.class_of}"]
-        if display_name and display_name != current_user.username:
-            context_parts.append(f"Display Name: {display_name}")
-        if current_grade:
-            context_parts.append(f"Current Grade: {current_grade}")
-        if bio:
-            context_parts.append(f"Bio/Interests: {bio}")
-        
-        context_str = ", ".join(context_parts)
-        contextual_message = f"""[User Context: {context_str}]
+        bot_response = cached_response(user_message)
+        if bot_response is not None:
+            return jsonify({'response': bot_response + remaining_messages_note(rate_status)})
 
-Student Question: {user_message}"""
+        with metrics.span('thread.get_or_create'):
+            thread_id = get_or_create_thread()
+        shared_grade = shared_answer_grade(current_user, user_message)
+        contextual_message = build_contextual_message(user_message, shared_grade)
 
         # Add message with context
-        client.beta.threads.messages.create(
-            thread_id=thread_id,
-            role="user",
-            content=contextual_message
-        )
-
-        # Run assistant
-        run = client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=ASSISTANT_ID
-        )
-
-        # Wait for completion
-        while run.status in ['queued', 'in_progress']:
-            time.sleep(0.5)
-            run = client.beta.threads.runs.retrieve(
+        with metrics.span('openai.messages.create'):
+            user_msg = client.beta.threads.messages.create(
                 thread_id=thread_id,
-                run_id=run.id
+                role="user",
+                content=contextual_message
             )
+        with metrics.span('db.history.write'):
+            chat_history.record_message(current_user.id, thread_id, 'user',
+                                        render_history_message('user', user_message),
+                                        user_msg.id, getattr(user_msg, 'created_at', None))
 
-        # Check if file_search was used by examining run steps
-        file_search_used = False
-        try:
-            run_steps = client.beta.threads.runs.steps.list(
+        run_options, local_sources = local_run_options(user_message)
+        if shared_grade:
+            add_shared_answer_instructions(run_options)
+
+        # Run assistant
+        with metrics.span('openai.runs.create'):
+            run = client.beta.threads.runs.create(
                 thread_id=thread_id,
-                run_id=run.id
+                assistant_id=ASSISTANT_ID,
+                **run_options
             )
-            print(f"Checking {len(run_steps.data)} run steps for file_search calls...")
-            for step_idx, step in enumerate(run_steps.data):
-                print(f"Step {step_idx}: type={getattr(step, 'type', 'unknown')}")
-                if hasattr(step, 'step_details') and step.step_details:
-                    step_details = step.step_details
-                    print(f"  Step details type: {type(step_details)}")
-                    print(f"  Step details attributes: {dir(step_details)}")
-                    # Check for tool_calls in step_details
-                    if hasattr(step_details, 'tool_calls') and step_details.tool_calls:
-                        print(f"  Found {len(step_details.tool_calls)} tool calls")
-                        for tool_idx, tool_call in enumerate(step_details.tool_calls):
-                            # Debug: print tool_call structure
-                            tool_type = getattr(tool_call, 'type', None)
-                            print(f"    Tool call {tool_idx}: type={tool_type}, attributes: {[a for a in dir(tool_call) if not a.startswith('_')]}")
-                            # Check if this is a file_search call
-                            if tool_type == 'file_search':
-                                file_search_used = True
-                                print(f"    ✓ Found file_search tool call - documents were referenced")
-                                break
-                    else:
-                        print(f"  No tool_calls found in step_details")
-                    if file_search_used:
-                        break
-        except Exception as e:
-            print(f"Error checking run steps: {e}")
 
-        # Note: file_search doesn't tell us which specific files were used
-        # We can only show source links if we can extract specific file IDs from annotations
-        # For now, we won't show links when only file_search is used (since it searches all files)
-        file_ids = set()
+        # Wait for completion (shared poller wakes us as soon as the run finishes)
+        with metrics.span('openai.run.wait'):
+            run = run_poller.wait(thread_id, run.id)
 
         # Get response
-        messages = client.beta.threads.messages.list(
-            thread_id=thread_id,
-            order='desc',
-            limit=1
-        )
+        with metrics.span('openai.messages.list'):
+            messages = client.beta.threads.messages.list(
+                thread_id=thread_id,
+                order='desc',
+                limit=1
+            )
 
         message = messages.data[0]
-        bot_response_text = message.content[0].text.value
-        bot_response_text = process_citations(bot_response_text)
+        with metrics.span('render.response'):
+            bot_response = render_bot_response(message, local_sources)
+        if shared_grade:
+            if run.status == 'completed':
+                answers.put(user_message, shared_grade, message.content[0].text.value, bot_response)
+            bot_response = greet(current_user, bot_response)
+        with metrics.span('db.history.write'):
+            chat_history.record_message(current_user.id, thread_id, 'assistant', bot_response,
+                                        message.id, getattr(message, 'created_at', None))
+        # Steps, tool calls and usage are gathered after the response is sent
+        run_metadata.schedule(client, current_user.id, thread_id, run.id, run)
+        return jsonify({'response': bot_response + remaining_messages_note(rate_status)})
 
-        print(f"Assistant responded: {bot_response_text[:100]}...")
+    except Exception as e:
+        print(f"Error: {e}")
+        return jsonify({'response': 'Sorry, I encountered an error. Please try again.'})
 
-        # Extract file IDs from message annotations (these would be specific files if available)
-        file_ids_from_annotations = extract_file_ids_from_message(message)
-        file_ids.update(file_ids_from_annotations)
+def sse_event(event, payload):
+    """Format one Server-Sent Event frame"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
 
-        # Only show source links if we have specific file IDs from annotations
-        # (Not showing all files from vector store since file_search doesn't specify which were used)
-        download_links_html = ""
-        if file_ids:
-            download_links_html = '<div style="margin-top: 15px; padding: 10px; background-color: #e3f2fd; border-radius: 8px; border-left: 4px solid #2196f3;"><strong>📄 Source Documents:</strong><ul style="margin: 8px 0 0 0; padding-left: 20px;">'
-            for file_id in file_ids:
-                filename = get_filename_from_file_id(file_id)
-                print(f"Mapping file_id {file_id} to filename: {filename}")
-                if filename:
-                    # URL encode the filename
-                    encoded_filename = quote(filename)
-                    download_links_html += f'<li><a href="/download/{encoded_filename}" class="pdf-download-link" data-filename="{filename}" style="color: #1976d2; text-decoration: underline;">📥 {filename}</a></li>'
-            download_links_html += '</ul></div>'
-        else:
-            print("No file IDs found in message annotations")
+@app.route('/chat/stream', methods=['POST'])
+@login_required
+def chat_stream():
+    """Same as /chat, but forwards assistant text to the browser as it is generated"""
+    data = request.get_json()
+    user_message = data.get('message', '')
 
-        # Convert markdown to HTML
-        bot_response = markdown.markdown(
-            bot_response_text,
-            extensions=['fenced_code', 'codehilite', 'nl2br', 'tables', 'sane_lists']
-        )
+    print(f"\n[{current_user.username}] sent (stream): {user_message}")
 
-        # Add download links if available
-        if download_links_html:
-            bot_response += download_links_html
+    with metrics.span('db.rate_limit'):
+        allowed, rate_status = rate_limit.check_and_increment(current_user)
 
-        # Add remaining messages info
-        remaining = MESSAGES_PER_DAY - count
-        if remaining <= 3:
-            bot_response += f'<p style="margin-top: 15px; font-size: 12px; opacity: 0.7;"><em>💬 {remaining} messages remaining today</em></p>'
+    if not allowed:
+        payload = {'response': limit_reached_response(rate_status), 'limit_reached': True}
+        payload.update(rate_status)
+        return Response(sse_event('done', payload), mimetype='text/event-stream')
+
+    bot_response = cached_response(user_message)
+    if bot_response is not None:
+        payload = {'response': bot_response + remaining_messages_note(rate_status)}
+        payload.update(rate_status)
+        return Response(sse_event('done', payload), mimetype='text/event-stream')
+
+    user = current_user._get_current_object()
+    shared_grade = shared_answer_grade(user, user_message)
+
+    def generate():
+        # The view returns before the body streams, so time the stream phases here
+        started = time.perf_counter()
+        try:
+            with metrics.span('thread.get_or_create'):
+                thread_id = get_or_create_thread()
+            contextual_message = build_contextual_message(user_message, shared_grade)
+
+            with metrics.span('openai.messages.create'):
+                user_msg = client.beta.threads.messages.create(
+                    thread_id=thread_id,
+                    role="user",
+                    content=contextual_message
+                )
+            with metrics.span('db.history.write'):
+                chat_history.record_message(user.id, thread_id, 'user',
+                                            render_history_message('user', user_message),
+                                            user_msg.id, getattr(user_msg, 'created_at', None))
+
+            run_options, local_sources = local_run_options(user_message)
+            if shared_grade:
+                add_shared_answer_instructions(run_options)
+
+            # stream=True makes the run push events instead of us polling for status
+            with metrics.span('openai.runs.create'):
+                stream = client.beta.threads.runs.create(
+                    thread_id=thread_id,
+                    assistant_id=ASSISTANT_ID,
+                    stream=True,
+                    **run_options
+                )
 
-        return jsonify({'response': bot_response})
+            final_message = None
+            run = None
+            run_started = first_token = time.perf_counter()
+            with stream:
+                for event in stream:
+                    if event.event == 'thread.message.delta':
+                        if first_token == run_started:
+                            first_token = time.perf_counter()
+                            metrics.observe_phase('openai.run.first_token', first_token - run_started)
+                        for part in event.data.delta.content or []:
+                            if part.type == 'text' and part.text and part.text.value:
+                                yield sse_event('delta', {'text': part.text.value})
+                    elif event.event == 'thread.message.completed':
+                        final_message = event.data
+                    elif event.event in ('thread.run.created', 'thread.run.completed'):
+                        run = event.data
+                    elif event.event in ('thread.run.failed', 'thread.run.cancelled', 'thread.run.expired'):
+                        print(f"Run ended with {event.event}")
+                        break
+                    elif event.event == 'error':
+                        print(f"Stream error: {event.data}")
+                        break
+            metrics.observe_phase('openai.run.stream', time.perf_counter() - run_started)
+
+            if final_message is None:
+                yield sse_event('done', {'response': 'Sorry, I encountered an error. Please try again.'})
+                return
+
+            # Citations, source links and the remaining-messages data arrive in the final event
+            with metrics.span('render.response'):
+                bot_response = render_bot_response(final_message, local_sources)
+            if shared_grade:
+                if run is not None and run.status == 'completed':
+                    answers.put(user_message, shared_grade, final_message.content[0].text.value, bot_response)
+                bot_response = greet(user, bot_response)
+            with metrics.span('db.history.write'):
+                chat_history.record_message(user.id, thread_id, 'assistant', bot_response,
+                                            final_message.id, getattr(final_message, 'created_at', None))
+            if run is not None:
+                run_metadata.schedule(client, user.id, thread_id, run.id, run)
+            payload = {'response': bot_response + remaining_messages_note(rate_status)}
+            payload.update(rate_status)
+            metrics.observe_phase('stream.total', time.perf_counter() - started)
+            yield sse_event('done', payload)
 
-    except Exception as e:
-        print(f"Error: {e}")
-        return jsonify({'response': 'Sorry, I encountered an error. Please try again.'})
+        except Exception as e:
+            print(f"Error: {e}")
+            yield sse_event('done', {'response': 'Sorry, I encountered an error. Please try again.'})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text exposition of request and phase timings (this worker only)"""
+    # Optional shared secret so the numbers aren't public: METRICS_TOKEN in .env
+    token = os.getenv('METRICS_TOKEN')
+    if token:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip() or request.args.get('token', '')
+        if not secrets.compare_digest(supplied, token):
+            abort(403)
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/complete_tutorial', methods=['POST'])
 @login_required
 def complete_tutorial():
     """Mark tutorial as completed for the current user"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('UPDATE users SET tutorial_completed = 1 WHERE id = ?', (current_user.id,))
-        conn.commit()
-        conn.close()
+        db.update_user_fields(current_user.id, tutorial_completed=1)
+        current_user.tutorial_completed = 1
         return jsonify({'success': True})
     except sqlite3.OperationalError:
         # Column doesn't exist yet - silently fail
@@ -787,28 +995,7 @@ def complete_tutorial():
 def get_profile():
     """Get user profile information"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        try:
-            cursor.execute('SELECT display_name, current_grade, bio FROM users WHERE id = ?', (current_user.id,))
-            result = cursor.fetchone()
-            display_name = result[0] if result and result[0] else None
-            current_grade = result[1] if result and result[1] else None
-            bio = result[2] if result and result[2] else None
-        except sqlite3.OperationalError:
-            # Columns don't exist yet - return None for all
-            display_name = None
-            current_grade = None
-            bio = None
-        conn.close()
-        
-        return jsonify({
-            'display_name': display_name,
-            'current_grade': current_grade,
-            'bio': bio,
-            'username': current_user.username,
-            'class_of': current_user.class_of
-        })
+        return jsonify(profile_fields())
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -826,30 +1013,21 @@ def update_profile():
         if current_grade is not None and current_grade not in [9, 10, 11, 12]:
             return jsonify({'error': 'Current grade must be 9, 10, 11, or 12'}), 400
         
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
         try:
             # Update profile fields (set to NULL if empty string)
-            cursor.execute('''UPDATE users 
-                             SET display_name = ?, current_grade = ?, bio = ? 
-                             WHERE id = ?''',
-                         (display_name if display_name else None, 
-                          current_grade if current_grade else None,
-                          bio if bio else None,
-                          current_user.id))
-            conn.commit()
+            db.update_user_fields(current_user.id,
+                                  display_name=display_name if display_name else None,
+                                  current_grade=current_grade if current_grade else None,
+                                  bio=bio if bio else None)
         except sqlite3.OperationalError as e:
-            conn.close()
             if 'no such column' in str(e).lower():
                 return jsonify({'error': 'Profile fields not available. Please run the migration script: python migration_add_profile_fields.py'}), 500
             raise
-        conn.close()
         
         # Update current_user object
-        current_user.display_name = display_name if display_name else None
-        current_user.current_grade = current_grade if current_grade else None
-        current_user.bio = bio if bio else None
+        current_user.update_profile(display_name if display_name else None,
+                                    current_grade if current_grade else None,
+                                    bio if bio else None)
         
         return jsonify({'success': True})
     except Exception as e:
@@ -0,0 +1,163 @@
+"""
+Lightweight timing spans and histograms, exported in Prometheus text format.
+
+Wrap a phase of a request in `with metrics.span('openai.runs.create'):` and
+its duration lands in a fixed-bucket histogram labelled with the phase and
+the Flask route it ran under. install(app) also times every request as a
+whole. render_prometheus() emits the histograms (_bucket/_sum/_count) plus
+p50/p95/p99 estimated from the buckets, for the /metrics endpoint.
+
+Numbers are per process: each gunicorn worker keeps its own registry, so a
+scrape reports the worker that answered it.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+# Seconds; spans from sub-millisecond DB calls up to the 180 s run timeout
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 180.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Cumulative fixed-bucket histogram. Callers hold the registry lock."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile by linear interpolation inside its bucket."""
+        if not self.count:
+            return float('nan')
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    return lower  # +Inf bucket: best we can say is "above the top bound"
+                upper = self.buckets[i]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+class Registry:
+    """Histograms keyed by (metric name, sorted label pairs)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+        self._help = {}
+
+    def observe(self, name, value, help_text='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._series.get(key)
+            if hist is None:
+                hist = self._series[key] = Histogram()
+                self._help.setdefault(name, help_text)
+            hist.observe(value)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        lines = []
+        with self._lock:
+            names = sorted({name for name, _ in self._series})
+            for name in names:
+                series = sorted((labels, hist) for (n, labels), hist in self._series.items() if n == name)
+                lines.append(f'# HELP {name} {self._help.get(name, "")}')
+                lines.append(f'# TYPE {name} histogram')
+                for labels, hist in series:
+                    cumulative = 0
+                    for bound, n in zip(hist.buckets + (float('inf'),), hist.counts):
+                        cumulative += n
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'{name}_bucket{_labels(labels, le=le)} {cumulative}')
+                    lines.append(f'{name}_sum{_labels(labels)} {hist.sum:.6f}')
+                    lines.append(f'{name}_count{_labels(labels)} {hist.count}')
+
+                quantile_name = f'{name}_quantile'
+                lines.append(f'# HELP {quantile_name} p50/p95/p99 of {name}, estimated from the histogram buckets')
+                lines.append(f'# TYPE {quantile_name} gauge')
+                for labels, hist in series:
+                    for q in QUANTILES:
+                        lines.append(f'{quantile_name}{_labels(labels, quantile=str(q))} {hist.quantile(q):.6f}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs, **extra):
+    items = list(pairs) + list(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+registry = Registry()
+
+PHASE_METRIC = 'counselor_phase_seconds'
+REQUEST_METRIC = 'counselor_request_seconds'
+
+
+def current_route():
+    """URL rule of the request being handled, e.g. "/chat"; "none" outside a request."""
+    if not has_request_context():
+        return 'none'
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def observe_phase(phase, seconds, route=None):
+    registry.observe(PHASE_METRIC, seconds, 'Time spent in each phase of a request',
+                     phase=phase, route=route or current_route())
+
+
+@contextmanager
+def span(phase, route=None):
+    """Time the enclosed block as `phase` (recorded even if it raises)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_phase(phase, time.perf_counter() - start, route)
+
+
+def install(app):
+    """Time every request (until the view returns; streamed bodies are timed with spans)."""
+
+    @app.before_request
+    def _start_request_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request_time(response):
+        start = g.pop('_metrics_start', None)
+        if start is not None:
+            registry.observe(REQUEST_METRIC, time.perf_counter() - start,
+                             'Time from request start until the view returned',
+                             route=current_route(), method=request.method,
+                             status=str(response.status_code))
+        return response
+
+
+def render_prometheus():
+    return registry.render()
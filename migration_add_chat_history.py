@@ -0,0 +1,32 @@
+import sqlite3
+import os
+
+# Database path
+if os.path.exists('/home/VihaanAgrawal'):
+    DB_PATH = '/home/VihaanAgrawal/emerald-counselor-ai/users.db'
+else:
+    DB_PATH = 'users.db'
+
+conn = sqlite3.connect(DB_PATH)
+cursor = conn.cursor()
+
+try:
+    # Local copy of each conversation turn, already rendered to HTML
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS chat_messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        thread_id TEXT NOT NULL,
+        openai_message_id TEXT UNIQUE,
+        role TEXT NOT NULL,
+        content_html TEXT NOT NULL,
+        created_at INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_messages_thread ON chat_messages (thread_id, created_at, id)')
+    conn.commit()
+    print("Success: Created chat_messages table")
+except sqlite3.OperationalError as e:
+    print(f"Error: {e}")
+
+conn.close()
@@ -0,0 +1,45 @@
+import sqlite3
+import os
+
+# Database path
+if os.path.exists('/home/VihaanAgrawal'):
+    DB_PATH = '/home/VihaanAgrawal/emerald-counselor-ai/users.db'
+else:
+    DB_PATH = 'users.db'
+
+conn = sqlite3.connect(DB_PATH)
+cursor = conn.cursor()
+
+try:
+    # One row per course catalog entry; filled by `python course_catalog.py build`
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS courses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        course_number TEXT,
+        title TEXT NOT NULL,
+        department TEXT NOT NULL,
+        grade_min INTEGER,
+        grade_max INTEGER,
+        length TEXT,
+        prerequisites TEXT,
+        graduation TEXT,
+        college_prep TEXT,
+        uc_csu_area TEXT,
+        level TEXT,
+        weighted INTEGER DEFAULT 0,
+        school_site TEXT,
+        note TEXT,
+        description TEXT,
+        source TEXT
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_courses_number ON courses (course_number)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_courses_department ON courses (department, grade_min, grade_max)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_courses_area ON courses (uc_csu_area, level)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_courses_title ON courses (title COLLATE NOCASE)')
+    conn.commit()
+    print("Success: Created courses table")
+except sqlite3.OperationalError as e:
+    print(f"Error: {e}")
+
+conn.close()
@@ -0,0 +1,31 @@
+import sqlite3
+import os
+
+# Database path
+if os.path.exists('/home/VihaanAgrawal'):
+    DB_PATH = '/home/VihaanAgrawal/emerald-counselor-ai/users.db'
+else:
+    DB_PATH = 'users.db'
+
+conn = sqlite3.connect(DB_PATH)
+cursor = conn.cursor()
+
+try:
+    # Threads waiting to be deleted from OpenAI by thread_sweeper.py
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS expired_threads (
+        thread_id TEXT PRIMARY KEY,
+        user_id INTEGER,
+        expired_at INTEGER NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_expired_threads_expired_at ON expired_threads (expired_at)')
+    # Lets the sweeper find expired conversations without scanning every user
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_thread_created_at ON users (thread_created_at)')
+    conn.commit()
+    print("Success: Created expired_threads table and thread_created_at index")
+except sqlite3.OperationalError as e:
+    print(f"Error: {e}")
+
+conn.close()
@@ -0,0 +1,27 @@
+import sqlite3
+import os
+
+# Database path
+if os.path.exists('/home/VihaanAgrawal'):
+    DB_PATH = '/home/VihaanAgrawal/emerald-counselor-ai/users.db'
+else:
+    DB_PATH = 'users.db'
+
+conn = sqlite3.connect(DB_PATH)
+cursor = conn.cursor()
+
+try:
+    # One row per message, used by RATE_LIMIT_MODE=sliding
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS message_log (
+        user_id INTEGER NOT NULL,
+        sent_at REAL NOT NULL
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_message_log_user_sent ON message_log (user_id, sent_at)')
+    conn.commit()
+    print("Success: Created message_log table")
+except sqlite3.OperationalError as e:
+    print(f"Error: {e}")
+
+conn.close()
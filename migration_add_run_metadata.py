@@ -0,0 +1,39 @@
+import sqlite3
+import os
+
+# Database path
+if os.path.exists('/home/VihaanAgrawal'):
+    DB_PATH = '/home/VihaanAgrawal/emerald-counselor-ai/users.db'
+else:
+    DB_PATH = 'users.db'
+
+conn = sqlite3.connect(DB_PATH)
+cursor = conn.cursor()
+
+try:
+    # One row per assistant run: steps, tool calls and token usage
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS run_metadata (
+        run_id TEXT PRIMARY KEY,
+        user_id INTEGER,
+        thread_id TEXT,
+        status TEXT,
+        model TEXT,
+        step_count INTEGER,
+        tool_calls TEXT,
+        file_search_used INTEGER,
+        prompt_tokens INTEGER,
+        completion_tokens INTEGER,
+        total_tokens INTEGER,
+        created_at INTEGER,
+        completed_at INTEGER,
+        collected_at INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_run_metadata_user ON run_metadata (user_id, created_at)')
+    conn.commit()
+    print("Success: Created run_metadata table")
+except sqlite3.OperationalError as e:
+    print(f"Error: {e}")
+
+conn.close()
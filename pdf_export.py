@@ -0,0 +1,250 @@
+"""
+PDF export of selected chat messages.
+
+Styles are built once at import instead of on every request, and message
+HTML is converted to ReportLab paragraph markup in a single HTMLParser pass
+that keeps bold/italic, links, code, headings, lists and table rows rather
+than stripping every tag. The document is built straight into the buffer
+that is handed to send_file, with no intermediate copies.
+"""
+from datetime import datetime
+from html import escape
+from html.parser import HTMLParser
+from io import BytesIO
+from urllib.parse import urljoin
+
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+
+# Define styles (shared, read-only)
+_styles = getSampleStyleSheet()
+NORMAL_STYLE = _styles['Normal']
+TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=_styles['Heading1'],
+    fontSize=16,
+    textColor='#1b5e20',
+    spaceAfter=12,
+)
+USER_STYLE = ParagraphStyle(
+    'UserMessage',
+    parent=_styles['BodyText'],
+    fontSize=10,
+    leftIndent=20,
+    rightIndent=20,
+    textColor='#1976d2',
+    spaceAfter=12,
+    spaceBefore=6,
+)
+BOT_STYLE = ParagraphStyle(
+    'BotMessage',
+    parent=_styles['BodyText'],
+    fontSize=10,
+    leftIndent=20,
+    rightIndent=20,
+    textColor='#1b5e20',
+    spaceAfter=12,
+    spaceBefore=6,
+)
+
+BREAK = '<br/>'
+INLINE_TAGS = {'b': 'b', 'strong': 'b', 'i': 'i', 'em': 'i', 'u': 'u'}
+HEADING_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+
+
+class _MarkupConverter(HTMLParser):
+    """Chat HTML -> ReportLab paragraph markup, in one pass."""
+
+    def __init__(self, base_url=None):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.out = []
+        self.open_tags = []      # closing markup for tags we opened, innermost last
+        self.lists = []          # [tag, item_count] per nesting level
+        self.in_pre = 0
+        self.first_cell = True
+
+    # --- helpers -----------------------------------------------------------
+
+    def _ends_with_break(self):
+        return not self.out or self.out[-1] == BREAK
+
+    def _newline(self):
+        if not self._ends_with_break():
+            self.out.append(BREAK)
+
+    def _block(self):
+        if self.out:
+            self._newline()
+            if len(self.out) < 2 or self.out[-2] != BREAK:
+                self.out.append(BREAK)
+
+    def _open(self, markup, closer):
+        self.out.append(markup)
+        self.open_tags.append(closer)
+
+    def _close(self, closer):
+        if closer in self.open_tags:
+            # Close anything still open inside it so the markup stays well-formed
+            while self.open_tags:
+                tag = self.open_tags.pop()
+                self.out.append(tag)
+                if tag == closer:
+                    break
+
+    def _resolve_href(self, href):
+        """Absolute URL for a link, or None for in-page anchors we can't follow in a PDF."""
+        if not href or href.startswith('#'):
+            return None
+        if self.base_url:
+            href = urljoin(self.base_url, href)
+        if href.split(':', 1)[0].lower() in ('http', 'https', 'mailto'):
+            return href
+        return None
+
+    # --- HTMLParser hooks --------------------------------------------------
+
+    def handle_starttag(self, tag, attrs):
+        if tag in INLINE_TAGS:
+            name = INLINE_TAGS[tag]
+            self._open(f'<{name}>', f'</{name}>')
+        elif tag == 'a':
+            href = self._resolve_href(dict(attrs).get('href'))
+            if href:
+                self._open(f'<a href="{escape(href, quote=True)}" color="#1976d2">', '</a>')
+        elif tag == 'code' and not self.in_pre:
+            self._open('<font face="Courier">', '</font>')
+        elif tag == 'pre':
+            self._block()
+            self.in_pre += 1
+            self._open('<font face="Courier">', '</font>')
+        elif tag in HEADING_TAGS:
+            self._block()
+            self._open('<b>', '</b>')
+        elif tag in ('p', 'div', 'table'):
+            self._block()
+        elif tag == 'br':
+            self.out.append(BREAK)
+        elif tag in ('ul', 'ol'):
+            if not self.lists:
+                self._block()
+            self.lists.append([tag, 0])
+        elif tag == 'li':
+            self._newline()
+            level = self.lists[-1] if self.lists else ['ul', 0]
+            level[1] += 1
+            indent = '&nbsp;' * 4 * max(len(self.lists) - 1, 0)
+            bullet = f'{level[1]}.' if level[0] == 'ol' else '•'
+            self.out.append(f'{indent}{bullet} ')
+        elif tag == 'tr':
+            self._newline()
+            self.first_cell = True
+        elif tag in ('td', 'th'):
+            if not self.first_cell:
+                self.out.append(' | ')
+            self.first_cell = False
+            if tag == 'th':
+                self._open('<b>', '</b>')
+
+    def handle_endtag(self, tag):
+        if tag in INLINE_TAGS:
+            self._close(f'</{INLINE_TAGS[tag]}>')
+        elif tag == 'a':
+            self._close('</a>')
+        elif tag == 'code' and not self.in_pre:
+            self._close('</font>')
+        elif tag == 'pre':
+            self._close('</font>')
+            self.in_pre = max(self.in_pre - 1, 0)
+            self._block()
+        elif tag in HEADING_TAGS:
+            self._close('</b>')
+            self._newline()
+        elif tag == 'th':
+            self._close('</b>')
+        elif tag in ('ul', 'ol'):
+            if self.lists:
+                self.lists.pop()
+            if not self.lists:
+                self._block()
+        elif tag in ('p', 'div', 'table'):
+            self._block()
+
+    def handle_data(self, data):
+        if self.in_pre:
+            self.out.append(escape(data, quote=False).replace('\n', BREAK))
+            return
+        text = ' '.join(data.split())
+        if not text:
+            # Whitespace between block tags; keep a single space inside running text
+            if data and not self._ends_with_break() and not self.out[-1].endswith(' '):
+                self.out.append(' ')
+            return
+        if data[:1].isspace() and not self._ends_with_break():
+            text = ' ' + text
+        if data[-1:].isspace():
+            text += ' '
+        self.out.append(escape(text, quote=False))
+
+    def markup(self):
+        self.close()
+        while self.open_tags:
+            self.out.append(self.open_tags.pop())
+        while self.out and self.out[-1] == BREAK:
+            self.out.pop()
+        return ''.join(self.out)
+
+
+def html_to_markup(html, base_url=None):
+    """Convert message HTML from the chat window into ReportLab paragraph markup."""
+    converter = _MarkupConverter(base_url)
+    converter.feed(html or '')
+    return converter.markup()
+
+
+def _plain_text(html):
+    """Fallback when the converted markup is rejected by ReportLab."""
+    converter = _MarkupConverter()
+    converter.feed(html or '')
+    text = ''.join(part for part in converter.out if not part.startswith('<') or part == BREAK)
+    return text
+
+
+def _message_paragraph(label, html, style, base_url):
+    body = html_to_markup(html, base_url)
+    try:
+        return Paragraph(f"<b>{label}</b><br/>{body}", style)
+    except ValueError as e:
+        print(f"Falling back to plain text for PDF message: {e}")
+        return Paragraph(f"<b>{label}</b><br/>{_plain_text(html)}", style)
+
+
+def build_chat_pdf(messages, username, base_url=None, buffer=None):
+    """Render messages ([{role, content}]) into buffer (a new BytesIO by default), rewound for reading.
+
+    base_url turns relative links such as /download/<file> into absolute ones.
+    """
+    buffer = buffer or BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter,
+                            rightMargin=72, leftMargin=72,
+                            topMargin=72, bottomMargin=18)
+
+    elements = [
+        Paragraph(f"Chat Export - {escape(username)}<br/>Emerald High School Counselor Assistant", TITLE_STYLE),
+        Spacer(1, 0.2*inch),
+        Paragraph(f"Generated: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}", NORMAL_STYLE),
+        Spacer(1, 0.3*inch),
+    ]
+
+    for msg in messages:
+        if msg.get('role', '') == 'user':
+            elements.append(_message_paragraph('You:', msg.get('content', ''), USER_STYLE, base_url))
+        else:
+            elements.append(_message_paragraph('AI Counselor:', msg.get('content', ''), BOT_STYLE, base_url))
+        elements.append(Spacer(1, 0.2*inch))
+
+    doc.build(elements)
+    buffer.seek(0)
+    return buffer
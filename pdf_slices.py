@@ -0,0 +1,158 @@
+"""
+Single-page and page-range PDFs for citation links.
+
+Several school_documents are 2-3 MB slide decks, and a student on a phone
+who follows a citation only needs the page it came from. Slices are cut
+with pypdf and cached in pdf_slices/ under the content hash of the source
+PDF (from the pdf_text.py store), so a re-uploaded document never serves
+an old slice. `build()` precomputes every single-page slice at ingest time;
+page ranges are cut on first request and cached the same way.
+
+The cited page is found by searching the answer text against the pages of
+the cited PDF in the local search index.
+
+Usage:
+    python pdf_slices.py build
+"""
+import logging
+import os
+import re
+import sys
+import threading
+
+import pdf_text
+import search_index
+from doc_index import DOCS_DIR
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SLICE_DIR = os.path.join(BASE_DIR, 'pdf_slices')
+
+# Wider ranges are close enough to the whole document to just send it
+MAX_RANGE_PAGES = 5
+# Answers are long; only the start is needed to find the page
+MAX_QUERY_CHARS = 2000
+_PAGE_SECTION = re.compile(r'^Page (\d+)$')
+_PAGES_ARG = re.compile(r'^(\d+)(?:-(\d+))?$')
+
+_lock = threading.Lock()
+
+
+def parse_pages(value):
+    """(first, last) from "3" or "3-5"; None when the value isn't a valid range."""
+    match = _PAGES_ARG.match(value or '')
+    if not match:
+        return None
+    first = int(match.group(1))
+    last = int(match.group(2) or first)
+    if first < 1 or last < first or last - first >= MAX_RANGE_PAGES:
+        return None
+    return first, last
+
+
+def pages_arg(first, last):
+    return str(first) if first == last else f'{first}-{last}'
+
+
+def pages_label(first, last):
+    return f'Page {first}' if first == last else f'Pages {first}-{last}'
+
+
+def slice_name(filename, first, last):
+    """Download name shown to the student, e.g. "AP_Rule_Change (p. 2).pdf"."""
+    stem = os.path.splitext(filename)[0].strip()
+    label = f'p. {first}' if first == last else f'pp. {first}-{last}'
+    return f'{stem} ({label}).pdf'
+
+
+def _cut(source_path, first, last, out_path):
+    from pypdf import PdfReader, PdfWriter
+    # Slide decks exported from PowerPoint log harmless "Object N 0 not defined" warnings for every page
+    logging.getLogger('pypdf').setLevel(logging.ERROR)
+    writer = PdfWriter()
+    writer.append(PdfReader(source_path), pages=(first - 1, last))
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        writer.write(f)
+    os.replace(tmp_path, out_path)
+
+
+def get_slice(filename, first, last, docs_dir=DOCS_DIR, slice_dir=SLICE_DIR):
+    """Path of a cached slice of pages first..last (1-based), cutting it if needed.
+
+    None when the file isn't a stored PDF, has a single page (the slice would be
+    the whole file) or the pages are out of range.
+    """
+    store = pdf_text.get_store()
+    source_path = os.path.join(docs_dir, filename)
+    if store is None or not filename.lower().endswith('.pdf') or not os.path.exists(source_path):
+        return None
+    sha256 = store.sha256_for(source_path)
+    pages = store.documents.get(sha256)
+    if pages is None or pages[1] < 2 or last > pages[1]:
+        return None
+    out_path = os.path.join(slice_dir, f'{sha256[:16]}-{first}-{last}.pdf')
+    if not os.path.exists(out_path):
+        with _lock:
+            if not os.path.exists(out_path):
+                os.makedirs(slice_dir, exist_ok=True)
+                _cut(source_path, first, last, out_path)
+    return out_path
+
+
+def cited_pages(filename, answer_text):
+    """(first, last) page of a PDF that best matches the answer, or None."""
+    index = search_index.get_index()
+    if index is None or not filename.lower().endswith('.pdf'):
+        return None
+    for passage in index.search(answer_text[:MAX_QUERY_CHARS], k=1, source=filename):
+        match = _PAGE_SECTION.match(passage.section)
+        if match:
+            page = int(match.group(1))
+            return page, page
+    return None
+
+
+def passage_pages(passages):
+    """(first, last) covering the 'Page N' passages of one PDF; just the first page if they are far apart."""
+    numbers = sorted(int(m.group(1)) for m in (_PAGE_SECTION.match(p.section) for p in passages) if m)
+    if not numbers:
+        return None
+    if numbers[-1] - numbers[0] >= MAX_RANGE_PAGES:
+        return numbers[0], numbers[0]
+    return numbers[0], numbers[-1]
+
+
+def build(docs_dir=DOCS_DIR, slice_dir=SLICE_DIR):
+    """Cut every single-page slice and drop slices of PDF versions that are gone. Returns the slice count."""
+    store = pdf_text.get_store()
+    if store is None:
+        print("No PDF text store; run: python pdf_text.py build")
+        return 0
+    os.makedirs(slice_dir, exist_ok=True)
+    current = {sha256[:16] for sha256, _, _ in store.files.values()}
+    for name in os.listdir(slice_dir):
+        if name.split('-')[0] not in current:
+            os.remove(os.path.join(slice_dir, name))
+    count, size, seen = 0, 0, set()
+    for filename, (sha256, _, _) in sorted(store.files.items()):
+        if sha256 in seen:
+            continue
+        seen.add(sha256)
+        for page in range(1, store.page_count(filename) + 1):
+            path = get_slice(filename, page, page, docs_dir, slice_dir)
+            if path:
+                count += 1
+                size += os.path.getsize(path)
+    print(f"{count} page slices ({size / 1024 / 1024:.1f} MB) -> {slice_dir}")
+    return count
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != 'build':
+        print('Usage: python pdf_slices.py build')
+        sys.exit(1)
+    build()
+
+
+if __name__ == '__main__':
+    main()
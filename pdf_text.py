@@ -0,0 +1,226 @@
+"""
+Per-page text of every PDF in school_documents, extracted once.
+
+pypdf needs seconds to get through decks like "Academic Information Night
+with ROP", and the search index, the prerequisite graph and anything that
+previews a page all want the same text. Extraction now happens once per
+PDF version: pages are stored under the SHA-256 of the file's contents in
+pdf_text.bin, so a rebuild only runs pypdf on new or changed PDFs and a
+renamed file costs nothing. Like search_index.bin the store is one binary
+file read through an mmap, so a page lookup is a slice of the mapping.
+
+Usage:
+    python pdf_text.py build
+    python pdf_text.py show "AP_Rule_Change.pdf" 2
+"""
+import array
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+
+from doc_index import DOCS_DIR
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STORE_PATH = os.path.join(BASE_DIR, 'pdf_text.bin')
+
+MAGIC = b'PDFTEXT1'
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extract_pages(path):
+    """Whitespace-normalized text of each page of a PDF, straight from pypdf; [] if it can't be read."""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        print(f"pypdf not installed; skipping {os.path.basename(path)}")
+        return []
+    try:
+        return [' '.join((page.extract_text() or '').split()) for page in PdfReader(path).pages]
+    except Exception as e:
+        print(f"Could not read {os.path.basename(path)}: {e}")
+        return []
+
+
+class PdfTextStore:
+    """Read-only view of pdf_text.bin over an mmap."""
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a PDF text store")
+        header_len = struct.unpack_from('<I', self._mmap, len(MAGIC))[0]
+        start = len(MAGIC) + 4
+        header = json.loads(self._mmap[start:start + header_len])
+        self.documents = header['documents']   # sha256 -> [first page id, page count]
+        self.files = header['files']           # filename -> [sha256, size, mtime]
+
+        offset = start + header_len
+        offset += -offset % 4
+        self._spans = memoryview(self._mmap)[offset:offset + 8 * header['pages']].cast('I')
+        self._text_start = offset + 8 * header['pages']
+
+    def _page(self, page_id):
+        offset, length = self._spans[2 * page_id], self._spans[2 * page_id + 1]
+        start = self._text_start + offset
+        return self._mmap[start:start + length].decode('utf-8')
+
+    def pages_for_hash(self, sha256):
+        """Page texts of the PDF with this content hash, or None if it was never extracted."""
+        entry = self.documents.get(sha256)
+        if entry is None:
+            return None
+        first, count = entry
+        return [self._page(first + i) for i in range(count)]
+
+    def page_count(self, filename):
+        entry = self.files.get(filename)
+        return self.documents[entry[0]][1] if entry else 0
+
+    def page(self, filename, number):
+        """Text of page `number` (1-based) of a stored PDF, or None."""
+        entry = self.files.get(filename)
+        if entry is None:
+            return None
+        first, count = self.documents[entry[0]]
+        return self._page(first + number - 1) if 1 <= number <= count else None
+
+    def pages(self, filename):
+        entry = self.files.get(filename)
+        return self.pages_for_hash(entry[0]) if entry else []
+
+    def sha256_for(self, path):
+        """Content hash of a PDF, skipping the read when size and mtime match what was stored."""
+        stat = os.stat(path)
+        entry = self.files.get(os.path.basename(path))
+        if entry and entry[1] == stat.st_size and entry[2] == int(stat.st_mtime):
+            return entry[0]
+        return file_sha256(path)
+
+
+def _open(path):
+    try:
+        return PdfTextStore(path)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable PDF text store: {e}")
+        return None
+
+
+def build(docs_dir=DOCS_DIR, path=STORE_PATH):
+    """Extract new or changed PDFs and rewrite the store atomically. Returns the number of pages stored.
+
+    Layout (little-endian):
+        MAGIC | uint32 header length | JSON header
+        uint32 spans[2 * pages]           (offset, length) into the text blob, 4-byte aligned
+        UTF-8 text blob
+    """
+    previous = _open(path)
+    files, texts, extracted, reused = {}, {}, 0, 0
+    for name in sorted(os.listdir(docs_dir)):
+        if not name.lower().endswith('.pdf'):
+            continue
+        pdf_path = os.path.join(docs_dir, name)
+        stat = os.stat(pdf_path)
+        sha256 = previous.sha256_for(pdf_path) if previous else file_sha256(pdf_path)
+        files[name] = [sha256, stat.st_size, int(stat.st_mtime)]
+        if sha256 in texts:
+            continue
+        pages = previous.pages_for_hash(sha256) if previous else None
+        if pages is None:
+            print(f"Extracting text from {name}")
+            pages = extract_pages(pdf_path)
+            extracted += 1
+        else:
+            reused += 1
+        texts[sha256] = pages
+
+    documents = {}
+    spans = array.array('I')
+    text_blob = bytearray()
+    for sha256, pages in texts.items():
+        documents[sha256] = [len(spans) // 2, len(pages)]
+        for text in pages:
+            encoded = text.encode('utf-8')
+            spans.extend((len(text_blob), len(encoded)))
+            text_blob.extend(encoded)
+
+    header = json.dumps({'pages': len(spans) // 2, 'documents': documents, 'files': files},
+                        separators=(',', ':')).encode('utf-8')
+    if sys.byteorder != 'little':
+        spans.byteswap()
+    out = bytearray(MAGIC)
+    out.extend(struct.pack('<I', len(header)))
+    out.extend(header)
+    out.extend(b'\0' * (-len(out) % 4))
+    out.extend(spans.tobytes())
+    out.extend(text_blob)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(out)
+    os.replace(tmp_path, path)
+    print(f"Stored {len(spans) // 2} pages from {len(files)} PDFs ({extracted} extracted, {reused} unchanged, "
+          f"{len(out) / 1024:.0f} KB) -> {path}")
+    return len(spans) // 2
+
+
+_store = None
+_store_mtime = None
+_lock = threading.Lock()
+
+
+def get_store(path=STORE_PATH):
+    """The shared store, reopened when the file is rebuilt; None when it hasn't been built."""
+    global _store, _store_mtime
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+    with _lock:
+        if _store is None or mtime != _store_mtime:
+            _store = _open(path)
+            _store_mtime = mtime
+        return _store
+
+
+def pdf_pages(path):
+    """Page texts of a PDF: from the store when this version was extracted, else from pypdf."""
+    store = get_store()
+    if store is not None:
+        pages = store.pages_for_hash(store.sha256_for(path))
+        if pages is not None:
+            return pages
+    return extract_pages(path)
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('build', 'show'):
+        print('Usage: python pdf_text.py build | show "file.pdf" [page]')
+        sys.exit(1)
+    if sys.argv[1] == 'build':
+        build()
+        return
+    store = PdfTextStore()
+    filename = sys.argv[2]
+    numbers = [int(sys.argv[3])] if len(sys.argv) > 3 else range(1, store.page_count(filename) + 1)
+    for number in numbers:
+        print(f"--- {filename} › Page {number}")
+        print(store.page(filename, number))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,397 @@
+"""
+Prerequisite graph for checking four-year course plans.
+
+"Can I take AP Chemistry junior year if I do Chemistry as a sophomore?" has a
+definite answer in the catalog, but every such check used to be a slow and
+not always consistent assistant run. At build time this reads the course
+catalog (course_catalog.py's parser) and the four Course Request Planning
+Sheets and writes course_graph.json:
+
+- each course's prerequisite groups from its "Essential Skills" text: every
+  group must be met by at least one of its courses, taken in an earlier year
+  (or the same year for "concurrent enrollment")
+- the transitive closure of the graph, so a later course in a sequence
+  counts as having met every earlier one ("Algebra 2 or higher")
+- which courses each grade's planning sheet offers
+
+CourseGraph.validate() then checks a whole plan with set lookups and no API calls.
+
+Usage:
+    python prereq_graph.py build
+    python prereq_graph.py check "9: Algebra 1, Biology; 10: Geometry, Chemistry"
+"""
+import json
+import os
+import re
+import sys
+import threading
+from html import escape
+
+import course_catalog
+import pdf_text
+from doc_index import DOCS_DIR, documents_fingerprint
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GRAPH_PATH = os.path.join(BASE_DIR, 'course_graph.json')
+
+GRADES = (9, 10, 11, 12)
+SHEET_GRADES = {'freshman': 9, 'sophomore': 10, 'junior': 11, 'senior': 12}
+_SHEET_ENTRY = re.compile(r'[❏■]\s*(\d{6})S?\s+(.+?)(?=\s*[❏■]|$)')
+
+# Abbreviations used in the Essential Skills text
+WORD_ALIASES = {'alg': 'algebra', 'adv': 'advanced', 'asl': 'american sign language', 'pre-calculus': 'precalculus',
+                'ii': '2', 'i': '1', 'iii': '3', 'iv': '4'}
+# A harder variant ("Advanced Algebra 2") meets the requirements of the plain course ("Algebra 2"), not the reverse
+VARIANT_PREFIXES = ('advanced ', 'honors ')
+VARIANT_SUFFIXES = (' advanced', ' intensive', ' honors')
+_QUALIFIER = re.compile(r'\s*\((?:hp|h|p|pltw|ngss)\)', re.IGNORECASE)
+_ACRONYM = re.compile(r'\(([A-Z]{2,4})\)')
+NOT_ACRONYMS = {'AP', 'HP', 'PLTW', 'ROP', 'NGSS'}
+# Clauses that describe or recommend rather than require
+_SOFT_CLAUSE = re.compile(r'recommend|advised|generally|typically|no prerequisite|readiness test|placement')
+# "Successful completion of Biology, successful completion of Algebra 1": each part starts a new requirement
+_REQUIREMENT_START = re.compile(r'^\s*(successful|completion|complete|mastery|concurrent|current|a passing|passing)')
+_OR_ABOVE = re.compile(r'\bor (?:better|higher|above)\b')
+
+
+# --- name matching ----------------------------------------------------------
+
+def normalize_name(text):
+    text = _QUALIFIER.sub('', text.lower().replace('“', '"').replace('”', '"').replace('’', "'"))
+    words = re.findall(r"[a-z0-9][a-z0-9'/-]*", text)
+    return ' '.join(WORD_ALIASES.get(word, word) for word in words)
+
+
+def course_aliases(title):
+    """Names a course can be referred to by in prerequisite text and plans."""
+    base = re.sub(r'\([^)]*\)', ' ', title)
+    names = {normalize_name(base), normalize_name(title)}
+    names.update(acronym.lower() for acronym in _ACRONYM.findall(title) if acronym not in NOT_ACRONYMS)
+    for name in list(names):
+        if name.startswith('chinese mandarin'):
+            names.add(name[len('chinese '):])
+        if name.endswith(' 1') and name.startswith('algebra'):
+            names.add('algebra')
+    return {name for name in names if name}
+
+
+def _alias_pattern(aliases):
+    ordered = sorted(aliases, key=len, reverse=True)
+    return re.compile(r'(?<![a-z0-9])(' + '|'.join(re.escape(a) for a in ordered) + r')(?![a-z0-9])')
+
+
+def parse_requirements(text, pattern, aliases, self_number=None):
+    """[{'any': [numbers], 'concurrent': bool, 'text': clause}] from an Essential Skills line."""
+    if not text:
+        return []
+    text = re.sub(r'\([^)]*\)', ' ', text)          # "(Advanced Algebra 2 recommended)"
+    text = re.sub(r'\[[^\]]*\]\([^)]*\)', ' ', text)  # form links
+    groups = []
+    for clause in re.split(r'[;.&]|\band\b|\bplus\b', _OR_ABOVE.sub('', text.lower())):
+        if _SOFT_CLAUSE.search(clause):
+            continue
+        concurrent = 'concurrent' in clause or 'current enrollment' in clause
+        # "CSE, CSP, ES or IED" is one choice; "Biology, successful completion of Algebra 1" is two
+        parts = []
+        for piece in clause.split(','):
+            if parts and not _REQUIREMENT_START.match(piece):
+                parts[-1] += ',' + piece
+            else:
+                parts.append(piece)
+        for part in parts:
+            numbers = []
+            for match in pattern.finditer(normalize_name(part)):
+                number = aliases[match.group(1)]
+                if number != self_number and number not in numbers:
+                    numbers.append(number)
+            if numbers:
+                groups.append({'any': numbers, 'concurrent': concurrent, 'text': ' '.join(part.split())})
+    return groups
+
+
+# --- building ---------------------------------------------------------------
+
+def planning_sheets(docs_dir=DOCS_DIR):
+    """{grade: {course number: title}} from the Course Request Planning Sheet PDFs."""
+    offered = {}
+    for name in sorted(os.listdir(docs_dir)):
+        lowered = name.lower()
+        if 'planning sheet' not in lowered or not lowered.endswith('.pdf'):
+            continue
+        grade = next((g for word, g in SHEET_GRADES.items() if word in lowered), None)
+        if grade is None:
+            continue
+        text = ' '.join(pdf_text.pdf_pages(os.path.join(docs_dir, name)))
+        offered.setdefault(grade, {}).update(
+            (number, title.strip(' +*')) for number, title in _SHEET_ENTRY.findall(text))
+    return offered
+
+
+def _closure(courses):
+    """Ancestors of every course, in topological order; edges that would close a cycle are dropped."""
+    order, state, ancestors = [], {}, {}
+
+    def visit(number, path):
+        state[number] = 'visiting'
+        found = set()
+        for group in courses[number]['requires']:
+            for prereq in list(group['any']):
+                if state.get(prereq) == 'visiting':
+                    print(f"Dropping cyclic prerequisite {prereq} of {number} ({' -> '.join(path)})")
+                    group['any'].remove(prereq)
+                    continue
+                if prereq not in state:
+                    visit(prereq, path + [prereq])
+                found.add(prereq)
+                found |= ancestors[prereq]
+        state[number] = 'done'
+        ancestors[number] = found
+        order.append(number)
+
+    for number in courses:
+        if number not in state:
+            visit(number, [number])
+    for course in courses.values():
+        course['requires'] = [group for group in course['requires'] if group['any']]
+    return ancestors
+
+
+def build(docs_dir=DOCS_DIR, path=GRAPH_PATH):
+    catalog_path = course_catalog.find_catalog(docs_dir)
+    if catalog_path is None:
+        print(f"No course catalog found in {docs_dir}")
+        return None
+    entries = course_catalog.parse_catalog(catalog_path)
+
+    courses, aliases = {}, {}
+    for entry in entries:
+        if not entry['course_number']:
+            continue
+        numbers = entry['course_number'].split(', ')
+        number = numbers[0]
+        if number in courses:
+            continue  # Same course listed in a second department
+        courses[number] = {'title': entry['title'], 'grade_min': entry['grade_min'],
+                           'grade_max': entry['grade_max'], 'prerequisites': entry['prerequisites'],
+                           'numbers': numbers}
+        for alias in course_aliases(entry['title']):
+            aliases.setdefault(alias, number)
+
+    offered = planning_sheets(docs_dir)
+    number_index = {n: number for number, course in courses.items() for n in course['numbers']}
+    for grade_courses in offered.values():
+        for sheet_number, title in grade_courses.items():
+            # Long "titles" are a sheet heading run into the last entry of a section
+            if sheet_number in number_index and len(title.split()) <= 8:
+                for alias in course_aliases(title):
+                    aliases.setdefault(alias, number_index[sheet_number])
+
+    pattern = _alias_pattern(aliases)
+    for number, course in courses.items():
+        course['requires'] = parse_requirements(course.pop('prerequisites'), pattern, aliases, number)
+
+    # Harder variants meet the plain course's requirements ("English 1 Advanced" -> "English 1")
+    by_name = {normalize_name(re.sub(r'\([^)]*\)', ' ', c['title'])): n for n, c in courses.items()}
+    for number, course in courses.items():
+        name = normalize_name(re.sub(r'\([^)]*\)', ' ', course['title']))
+        course['equivalent_to'] = sorted(
+            by_name[base] for base in
+            [name[len(p):] for p in VARIANT_PREFIXES if name.startswith(p)] +
+            [name[:-len(s)] for s in VARIANT_SUFFIXES if name.endswith(s)]
+            if base in by_name and by_name[base] != number)
+
+    ancestors = _closure(courses)
+    for number, course in courses.items():
+        # Only in that direction: plain Algebra 2 doesn't meet a requirement for Advanced Algebra 2
+        meets = {number} | ancestors[number]
+        for equivalent in course['equivalent_to']:
+            meets |= {equivalent} | ancestors[equivalent]
+        course['meets'] = sorted(meets)
+
+    graph = {
+        'documents_fingerprint': documents_fingerprint(docs_dir),
+        'courses': courses,
+        'aliases': aliases,
+        'numbers': number_index,
+        'offered': {str(grade): sorted(number_index.get(n, n) for n in sheet) for grade, sheet in offered.items()},
+    }
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(graph, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+    edges = sum(len(group['any']) for course in courses.values() for group in course['requires'])
+    print(f"Course graph: {len(courses)} courses, {edges} prerequisite edges, "
+          f"planning sheets for grades {sorted(offered)} -> {path}")
+    return graph
+
+
+# --- validation -------------------------------------------------------------
+
+class CourseGraph:
+    def __init__(self, data):
+        self.courses = data['courses']
+        self.aliases = data['aliases']
+        self.numbers = data['numbers']
+        self.offered = {int(grade): set(numbers) for grade, numbers in data['offered'].items()}
+        self.meets = {number: set(course['meets']) for number, course in self.courses.items()}
+
+    def resolve(self, ref):
+        """Course number for a number or a name ("797081", "Algebra II", "alg 2"), else None."""
+        ref = ref.strip()
+        digits = re.sub(r'\D', '', ref)
+        if len(digits) == 6 and digits in self.numbers:
+            return self.numbers[digits]
+        name = normalize_name(ref)
+        if name in self.aliases:
+            return self.aliases[name]
+        # Unambiguous prefix: "AP Calculus BC" typed as "ap calc bc" is too loose, "ap calculus b" is fine
+        matches = {number for alias, number in self.aliases.items() if alias.startswith(name)}
+        return matches.pop() if len(matches) == 1 else None
+
+    def title(self, number):
+        return self.courses[number]['title']
+
+    def validate(self, plan, completed=()):
+        """Check a plan {grade: [course refs]} plus courses completed before 9th grade.
+
+        Returns {'valid', 'issues', 'plan'}; issues are errors (unknown course,
+        missing prerequisite, wrong grade level) or warnings (not on that
+        grade's planning sheet, repeated course).
+        """
+        issues, resolved = [], {}
+
+        def issue(severity, kind, grade, ref, message, **extra):
+            issues.append(dict(severity=severity, kind=kind, grade=grade, course=ref, message=message, **extra))
+
+        met_before = set()
+        for ref in completed:
+            number = self.resolve(ref)
+            if number is None:
+                issue('error', 'unknown_course', None, ref, f'"{ref}" is not in the course catalog')
+            else:
+                met_before |= self.meets[number]
+
+        for grade in sorted(plan):
+            for ref in plan[grade]:
+                number = self.resolve(ref)
+                if number is None:
+                    issue('error', 'unknown_course', grade, ref, f'"{ref}" is not in the course catalog')
+                else:
+                    resolved.setdefault(grade, []).append(number)
+
+        seen = {}
+        for grade in sorted(resolved):
+            met_this_year = met_before.union(*(self.meets[n] for n in resolved[grade]))
+            for number in resolved[grade]:
+                course = self.courses[number]
+                title = course['title']
+                if course['grade_min'] and not course['grade_min'] <= grade <= course['grade_max']:
+                    allowed = (f"grade {course['grade_min']}" if course['grade_min'] == course['grade_max']
+                               else f"grades {course['grade_min']}-{course['grade_max']}")
+                    issue('error', 'grade_level', grade, title, f"{title} is for {allowed}, not grade {grade}")
+                for group in course['requires']:
+                    available = met_this_year if group['concurrent'] else met_before
+                    if not available.intersection(group['any']):
+                        options = ' or '.join(self.title(n) for n in group['any'])
+                        when = 'before or during' if group['concurrent'] else 'before'
+                        issue('error', 'missing_prerequisite', grade, title,
+                              f"{title} needs {options} {when} grade {grade}",
+                              missing=group['any'])
+                offered = self.offered.get(grade)
+                if offered and number not in offered:
+                    issue('warning', 'not_offered', grade, title,
+                          f"{title} is not on the grade {grade} course request sheet")
+                if number in seen and seen[number] != grade:
+                    issue('warning', 'repeated', grade, title, f"{title} is also planned for grade {seen[number]}")
+                seen.setdefault(number, grade)
+            met_before = met_this_year
+
+        return {
+            'valid': not any(i['severity'] == 'error' for i in issues),
+            'issues': issues,
+            'plan': {str(grade): [{'course_number': n, 'title': self.title(n)} for n in numbers]
+                     for grade, numbers in sorted(resolved.items())},
+        }
+
+
+_graph = None
+_graph_mtime = None
+_lock = threading.Lock()
+
+
+def get_graph(path=GRAPH_PATH):
+    """The shared CourseGraph, reloaded when course_graph.json is rebuilt; None if it hasn't been built."""
+    global _graph, _graph_mtime
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+    with _lock:
+        if _graph is None or mtime != _graph_mtime:
+            with open(path, 'r', encoding='utf-8') as f:
+                _graph = CourseGraph(json.load(f))
+            _graph_mtime = mtime
+        return _graph
+
+
+def parse_plan_text(text):
+    """("9: Algebra 1, Biology; 10: Geometry", ...) -> ({9: [...], 10: [...]}, completed).
+
+    Years are separated by newlines or semicolons. "done:", "completed:" or
+    "8:" list courses finished before high school.
+    """
+    plan, completed = {}, []
+    for line in re.split(r'[\n;]', text):
+        label, sep, rest = line.partition(':')
+        if not sep:
+            continue
+        label = label.strip().lower()
+        refs = [ref.strip() for ref in rest.split(',') if ref.strip()]
+        digits = re.sub(r'\D', '', label)
+        if label in ('done', 'completed', 'before', 'middle school') or digits == '8':
+            completed += refs
+        elif digits and int(digits) in GRADES:
+            plan.setdefault(int(digits), []).extend(refs)
+    return plan, completed
+
+
+def render_result(result):
+    """HTML summary of validate() output for the chat window."""
+    if result['valid'] and not result['issues']:
+        html = '<p><strong>✅ Your plan meets every prerequisite in the course catalog.</strong></p>'
+    elif result['valid']:
+        html = '<p><strong>✅ No prerequisite problems found</strong>, with a few things to check:</p>'
+    else:
+        html = '<p><strong>⚠️ Some courses in this plan need attention:</strong></p>'
+    if result['issues']:
+        html += '<ul>' + ''.join(
+            f"<li>{'❌' if i['severity'] == 'error' else 'ℹ️'} {escape(i['message'])}</li>" for i in result['issues']
+        ) + '</ul>'
+    if result['plan']:
+        html += '<p>' + '<br>'.join(
+            f"<strong>Grade {grade}:</strong> {escape(', '.join(c['title'] for c in courses))}"
+            for grade, courses in result['plan'].items()) + '</p>'
+    html += ('<p style="font-size: 12px; opacity: 0.7;"><em>Checked against the catalog\'s listed '
+             'prerequisites; teacher recommendations, applications and placement tests are not included.</em></p>')
+    return html
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('build', 'check'):
+        print('Usage: python prereq_graph.py build | check "9: Algebra 1, Biology; 10: Geometry"')
+        sys.exit(1)
+    if sys.argv[1] == 'build':
+        build()
+        return
+    graph = get_graph()
+    if graph is None:
+        print("Run `python prereq_graph.py build` first")
+        sys.exit(1)
+    result = graph.validate(*parse_plan_text(' '.join(sys.argv[2:])))
+    print('valid' if result['valid'] else 'NOT valid')
+    for i in result['issues']:
+        print(f"  [{i['severity']}] {i['message']}")
+
+
+if __name__ == '__main__':
+    main()
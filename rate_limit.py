@@ -0,0 +1,177 @@
+"""
+Per-user message rate limiting.
+
+The check-and-increment is a single SQL statement, so two gunicorn workers
+handling the same student can never both slip past the limit, and reading
+the remaining count never writes to users.db.
+
+Configuration (environment / .env):
+    RATE_LIMIT_MODE          "daily" (default) resets at midnight,
+                             "sliding" counts messages in the last N hours
+    RATE_LIMIT_PER_DAY       default limit per user (20)
+    RATE_LIMIT_WINDOW_HOURS  window length for sliding mode (24)
+    RATE_LIMIT_OVERRIDES     JSON object of username -> limit or "unlimited",
+                             e.g. {"counselor": "unlimited", "teacher": 100};
+                             no overrides when unset
+"""
+import json
+import os
+import sqlite3
+import time
+from datetime import date, datetime
+
+import db
+
+MODE = os.getenv('RATE_LIMIT_MODE', 'daily').strip().lower()
+DEFAULT_LIMIT = int(os.getenv('RATE_LIMIT_PER_DAY', '20'))
+WINDOW_HOURS = float(os.getenv('RATE_LIMIT_WINDOW_HOURS', '24'))
+
+DEFAULT_OVERRIDES = {}
+
+# UPDATE ... RETURNING needs SQLite 3.35+
+HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+def load_overrides():
+    """Parse RATE_LIMIT_OVERRIDES into {username: int limit or None for unlimited}."""
+    raw = os.getenv('RATE_LIMIT_OVERRIDES')
+    try:
+        overrides = json.loads(raw) if raw else DEFAULT_OVERRIDES
+    except ValueError as e:
+        print(f"Ignoring invalid RATE_LIMIT_OVERRIDES ({e}); no overrides")
+        overrides = DEFAULT_OVERRIDES
+
+    limits = {}
+    for username, value in overrides.items():
+        if value is None or str(value).lower() == 'unlimited':
+            limits[username] = None
+        else:
+            limits[username] = int(value)
+    return limits
+
+
+OVERRIDES = load_overrides()
+
+
+def limit_for(username):
+    """Message limit for a user, or None when they are unlimited."""
+    return OVERRIDES.get(username, DEFAULT_LIMIT)
+
+
+def normalize_date(value):
+    """Normalize stored date/datetime values to YYYY-MM-DD for comparison."""
+    if not value:
+        return None
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    text = str(value)
+    try:
+        return datetime.fromisoformat(text).date().isoformat()
+    except ValueError:
+        # Fallback for non-ISO strings like "YYYY-MM-DD HH:MM:SS"
+        return text[:10] if len(text) >= 10 else text
+
+
+def _status(limit, used):
+    if limit is None:
+        return {'remaining': 'unlimited', 'is_unlimited': True, 'limit': None}
+    return {'remaining': max(limit - used, 0), 'is_unlimited': False, 'limit': limit}
+
+
+# --- daily mode -------------------------------------------------------------
+
+# last_message_date may hold "YYYY-MM-DD" or a full timestamp, so compare the date part.
+# The WHERE clause only matches when the user is allowed, so "no row updated" means denied.
+_DAILY_INCREMENT = '''
+    UPDATE users
+    SET messages_today = CASE WHEN substr(last_message_date, 1, 10) = :today
+                              THEN COALESCE(messages_today, 0) + 1 ELSE 1 END,
+        last_message_date = :today
+    WHERE id = :user_id
+      AND (substr(last_message_date, 1, 10) IS NOT :today OR COALESCE(messages_today, 0) < :limit)
+'''
+
+
+def _daily_check_and_increment(user, limit, today):
+    params = {'today': today, 'user_id': user.id, 'limit': limit}
+    if HAS_RETURNING:
+        row = db.query_one(_DAILY_INCREMENT + ' RETURNING messages_today', params)
+        used = row[0] if row else None
+    else:
+        with db.transaction() as conn:
+            updated = conn.execute(_DAILY_INCREMENT, params).rowcount
+            used = conn.execute('SELECT messages_today FROM users WHERE id = ?', (user.id,)).fetchone()[0] if updated else None
+    return used
+
+
+def _daily_used(user, today):
+    if normalize_date(user.last_message_date) != today:
+        return 0
+    return user.messages_today or 0
+
+
+# --- sliding-window mode ----------------------------------------------------
+
+# INSERT ... SELECT ... WHERE count < limit is one statement, so the count and
+# the insert happen under the same write lock
+_SLIDING_INSERT = '''
+    INSERT INTO message_log (user_id, sent_at)
+    SELECT :user_id, :now
+    WHERE (SELECT COUNT(*) FROM message_log WHERE user_id = :user_id AND sent_at > :cutoff) < :limit
+'''
+
+
+def _sliding_used(user_id, cutoff):
+    return db.query_one('SELECT COUNT(*) FROM message_log WHERE user_id = ? AND sent_at > ?',
+                        (user_id, cutoff))[0]
+
+
+def _sliding_check_and_increment(user, limit, now):
+    cutoff = now - WINDOW_HOURS * 3600
+    with db.transaction() as conn:
+        inserted = conn.execute(_SLIDING_INSERT, {'user_id': user.id, 'now': now,
+                                                  'cutoff': cutoff, 'limit': limit}).rowcount
+        if inserted:
+            # Prune this user's expired entries in the same write transaction
+            conn.execute('DELETE FROM message_log WHERE user_id = ? AND sent_at <= ?', (user.id, cutoff))
+    return _sliding_used(user.id, cutoff) if inserted else None
+
+
+# --- public API -------------------------------------------------------------
+
+def check_and_increment(user):
+    """Count one message against the user's limit.
+
+    Returns (allowed, status) where status is the same dict get_status returns.
+    """
+    limit = limit_for(user.username)
+    if limit is None:
+        return True, _status(None, 0)
+
+    if MODE == 'sliding':
+        used = _sliding_check_and_increment(user, limit, time.time())
+    else:
+        today = date.today().isoformat()
+        used = _daily_check_and_increment(user, limit, today)
+        if used is not None:
+            user.messages_today = used
+            user.last_message_date = today
+
+    if used is None:
+        return False, _status(limit, limit)
+    return True, _status(limit, used)
+
+
+def get_status(user):
+    """Remaining messages for a user. Never writes to the database."""
+    limit = limit_for(user.username)
+    if limit is None:
+        return _status(None, 0)
+
+    if MODE == 'sliding':
+        used = _sliding_used(user.id, time.time() - WINDOW_HOURS * 3600)
+    else:
+        used = _daily_used(user, date.today().isoformat())
+    return _status(limit, used)
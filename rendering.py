@@ -0,0 +1,105 @@
+"""
+Markdown rendering for assistant replies.
+
+markdown.markdown() builds a new Markdown object and its whole extension
+pipeline on every call. Here each thread keeps one preconfigured instance
+and calls reset() between documents. The 【4:0†source】 citation markers
+are stripped by a preprocessor inside that same conversion, and finished
+HTML is kept in a bounded LRU cache keyed by a hash of the source text, so
+re-rendering history or a repeated answer is a dictionary lookup.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+import markdown
+from markdown.preprocessors import Preprocessor
+
+MARKDOWN_EXTENSIONS = ['fenced_code', 'codehilite', 'nl2br', 'tables', 'sane_lists']
+CITATION_PATTERN = re.compile(r'【\d+:\d+†[^】]+】')
+CACHE_SIZE = 2048
+
+
+def strip_citations(text):
+    """Remove citation markers from text"""
+    return CITATION_PATTERN.sub('', text)
+
+
+class CitationStripper(Preprocessor):
+    """Drop file_search citation markers before the Markdown block parser runs."""
+
+    def run(self, lines):
+        return [CITATION_PATTERN.sub('', line) if '】' in line else line for line in lines]
+
+
+class CitationExtension(markdown.Extension):
+    def extendMarkdown(self, md):
+        # Priority above normalize_whitespace (30) so markers never reach the parser
+        md.preprocessors.register(CitationStripper(md), 'strip_citations', 35)
+
+
+class HtmlCache:
+    """Thread-safe LRU of content hash -> rendered HTML."""
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            html = self._data.get(key)
+            if html is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return html
+
+    def put(self, key, html):
+        with self._lock:
+            self._data[key] = html
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_local = threading.local()
+html_cache = HtmlCache()
+
+
+def _get_markdown():
+    md = getattr(_local, 'md', None)
+    if md is None:
+        md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS + [CitationExtension()])
+        _local.md = md
+    return md
+
+
+def render_uncached(text):
+    """Convert assistant Markdown (citations included) to HTML without the cache."""
+    md = _get_markdown()
+    try:
+        return md.convert(text)
+    finally:
+        md.reset()
+
+
+def render_markdown(text):
+    """Convert assistant Markdown to HTML, stripping citation markers in the same pass."""
+    key = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+    html = html_cache.get(key)
+    if html is None:
+        html = render_uncached(text)
+        html_cache.put(key, html)
+    return html
@@ -0,0 +1,60 @@
+"""
+Run metadata (steps, tool calls, token usage) for later analysis.
+
+/chat used to list run steps and print every attribute of every tool call
+before answering the student. That work now happens on the background pool
+after the response has been sent, and the result is stored in the
+run_metadata table instead of stdout.
+"""
+import json
+import sqlite3
+import time
+
+import background
+import db
+
+
+def _tool_calls(steps):
+    """Flatten the tool calls of every step into small JSON-friendly dicts."""
+    calls = []
+    for step in steps:
+        details = getattr(step, 'step_details', None)
+        for tool_call in getattr(details, 'tool_calls', None) or []:
+            call = {'step_id': step.id, 'type': getattr(tool_call, 'type', None)}
+            file_search = getattr(tool_call, 'file_search', None)
+            results = getattr(file_search, 'results', None) if file_search else None
+            if results:
+                call['file_ids'] = [r.file_id for r in results if getattr(r, 'file_id', None)]
+            calls.append(call)
+    return calls
+
+
+def collect(client, user_id, thread_id, run_id, run=None):
+    """Fetch the run's steps (and the run itself if not given) and store a summary row."""
+    if run is None or getattr(run, 'usage', None) is None:
+        run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+    steps = list(client.beta.threads.runs.steps.list(thread_id=thread_id, run_id=run_id).data)
+
+    tool_calls = _tool_calls(steps)
+    usage = getattr(run, 'usage', None)
+    try:
+        db.execute(
+            '''INSERT OR REPLACE INTO run_metadata
+               (run_id, user_id, thread_id, status, model, step_count, tool_calls, file_search_used,
+                prompt_tokens, completion_tokens, total_tokens, created_at, completed_at, collected_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            (run_id, user_id, thread_id, getattr(run, 'status', None), getattr(run, 'model', None),
+             len(steps), json.dumps(tool_calls),
+             int(any(call['type'] == 'file_search' for call in tool_calls)),
+             getattr(usage, 'prompt_tokens', None), getattr(usage, 'completion_tokens', None),
+             getattr(usage, 'total_tokens', None), getattr(run, 'created_at', None),
+             getattr(run, 'completed_at', None), int(time.time()))
+        )
+    except sqlite3.OperationalError as e:
+        # Table missing (migration not run) or database busy; metadata is best effort
+        print(f"Error recording run metadata for {run_id}: {e}")
+
+
+def schedule(client, user_id, thread_id, run_id, run=None):
+    """Collect run metadata on the background pool."""
+    background.submit(collect, client, user_id, thread_id, run_id, run)
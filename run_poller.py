@@ -0,0 +1,148 @@
+"""
+Shared run-completion poller.
+
+Instead of every /chat request sleeping 0.5s between its own
+runs.retrieve calls, requests register their run here and block on an
+Event. One background thread per worker process checks all in-flight runs
+and wakes each waiting request as soon as its run leaves the queued /
+in_progress states. Status checks are most of the app's outbound API
+calls, so a run is checked every 0.5s only while it is younger than the
+median run this worker has seen; after that the gap grows to MAX_INTERVAL,
+trading up to that much extra wait on the slower half of runs for far
+fewer calls.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+PENDING_STATUSES = ('queued', 'in_progress', 'cancelling')
+
+# Adaptive schedule: no run finishes within a second, then the old fixed
+# 0.5s gap until the run is as old as the median recent run, then a gap
+# that grows for runs taking longer.
+FIRST_CHECK_DELAY = 1.0
+MIN_INTERVAL = 0.5
+MAX_INTERVAL = 2.0
+BACKOFF_FACTOR = 1.5
+# Median until enough runs have finished to measure one (typical runs take 5-15 s)
+DEFAULT_SLOW_RUN_SECONDS = 5.0
+RECENT_RUNS = 200
+MIN_RECENT_RUNS = 20
+
+# Checks that fall due within this window are sent together in one batch
+BATCH_WINDOW = 0.1
+MAX_CONCURRENT_CHECKS = 8
+
+
+class RunTimeoutError(Exception):
+    """Raised when a run does not finish within the requested timeout."""
+
+
+class _PendingRun:
+    def __init__(self, thread_id, run_id):
+        self.thread_id = thread_id
+        self.run_id = run_id
+        self.interval = MIN_INTERVAL
+        self.started = time.monotonic()
+        self.next_check = self.started + FIRST_CHECK_DELAY
+        self.done = threading.Event()
+        self.run = None
+        self.error = None
+
+
+class RunPoller:
+    """Waits for Assistants API runs to complete using one shared polling thread."""
+
+    def __init__(self, client):
+        self.client = client
+        self._pending = {}
+        self._lock = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._executor = None
+        self._durations = deque(maxlen=RECENT_RUNS)
+
+    def wait(self, thread_id, run_id, timeout=180):
+        """Block until the run finishes and return the final run object."""
+        entry = _PendingRun(thread_id, run_id)
+        with self._lock:
+            self._ensure_thread()
+            self._pending[run_id] = entry
+            self._lock.notify()
+
+        if not entry.done.wait(timeout):
+            with self._lock:
+                self._pending.pop(run_id, None)
+            raise RunTimeoutError(f"Run {run_id} did not finish within {timeout}s")
+
+        if entry.error is not None:
+            raise entry.error
+        return entry.run
+
+    def in_flight(self):
+        """Number of runs currently being watched by this process."""
+        with self._lock:
+            return len(self._pending)
+
+    def _slow_run_seconds_locked(self):
+        """Age after which a run is checked less often: the median of recent run times."""
+        if len(self._durations) < MIN_RECENT_RUNS:
+            return DEFAULT_SLOW_RUN_SECONDS
+        return sorted(self._durations)[len(self._durations) // 2]
+
+    def _ensure_thread(self):
+        # gunicorn forks workers after import, so each process starts its own thread
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CHECKS,
+                                            thread_name_prefix='run-poller-check')
+        self._thread = threading.Thread(target=self._loop, name='run-poller', daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._lock.wait()
+                now = time.monotonic()
+                next_due = min(entry.next_check for entry in self._pending.values())
+                if next_due > now:
+                    # Sleep until the next check is due (or a new run registers)
+                    self._lock.wait(next_due - now)
+                    continue
+                due = [entry for entry in self._pending.values()
+                       if entry.next_check <= now + BATCH_WINDOW]
+
+            # One batch: check every due run concurrently so the tick costs one round trip
+            results = list(self._executor.map(self._check, due))
+
+            with self._lock:
+                now = time.monotonic()
+                slow_after = self._slow_run_seconds_locked()
+                for entry, finished in zip(due, results):
+                    if finished:
+                        self._pending.pop(entry.run_id, None)
+                        if entry.error is None:
+                            self._durations.append(now - entry.started)
+                        entry.done.set()
+                    else:
+                        if now - entry.started >= slow_after:
+                            entry.interval = min(entry.interval * BACKOFF_FACTOR, MAX_INTERVAL)
+                        entry.next_check = now + entry.interval
+
+    def _check(self, entry):
+        """Fetch one run's status. Returns True once the waiter can be released."""
+        try:
+            run = self.client.beta.threads.runs.retrieve(
+                thread_id=entry.thread_id,
+                run_id=entry.run_id
+            )
+        except Exception as e:
+            print(f"Error checking run {entry.run_id}: {e}")
+            entry.error = e
+            return True
+        entry.run = run
+        return run.status not in PENDING_STATUSES
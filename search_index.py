@@ -0,0 +1,273 @@
+"""
+Local BM25 search over school_documents.
+
+Passages are the section files from doc_chunker.py for Markdown and one
+passage per page for PDFs (text from the pdf_text.py store). The index is one
+binary file, search_index.bin, that is mmap'ed at startup: the vocabulary
+and passage titles live in a small JSON header and everything else
+(document lengths, postings, passage text) is read straight out of the
+mapping, so a worker pays almost nothing to load it and shares the pages
+with every other worker through the OS cache.
+
+/chat uses retrieve() to put the best passages into the run's
+additional_instructions when they clear CONTEXT_MIN_SCORE, so the assistant
+often has what it needs without a file_search round trip.
+
+Usage:
+    python search_index.py build
+    python search_index.py search "algebra 2 prerequisites"
+"""
+import array
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+from collections import Counter, defaultdict
+from typing import NamedTuple
+
+import doc_chunker
+import pdf_text
+from doc_index import DOCS_DIR, documents_fingerprint
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+INDEX_PATH = os.path.join(BASE_DIR, 'search_index.bin')
+
+MAGIC = b'BM25IDX1'
+K1 = 1.2
+B = 0.75
+MAX_PASSAGE_CHARS = 4000
+# Calibrated with bench_search.py on the 2026-27 documents: off-topic questions
+# ("tell me a joke", "I'm stressed about school") top out near 9, and from about
+# 12.5 the best passage answers the question by itself
+CONTEXT_MIN_SCORE = 9.0
+ANSWER_MIN_SCORE = 12.5
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+(?:[.-][a-z0-9]+)*')
+STOPWORDS = frozenset('''
+a an and are as at be but by can do does for from has have how i if in into is it its me my of on or
+our should so that the their then there these this to was we what when where which who will with you your
+'''.split())
+
+
+def tokenize(text):
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class Passage(NamedTuple):
+    source: str      # filename in school_documents
+    section: str     # "Mathematics › Algebra I", "Page 3", ...
+    text: str
+    score: float = 0.0
+
+    def label(self):
+        return f"{self.source} › {self.section}" if self.section else self.source
+
+
+# --- building ---------------------------------------------------------------
+
+def _markdown_passages(path):
+    source = os.path.basename(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        chunks = doc_chunker.chunk_markdown(f.read(), source)
+    for chunk in chunks:
+        section = chunk.section + (f' › {chunk.course}' if chunk.course else '')
+        text = chunk.render()
+        # Overlong sections are split so a passage stays a useful size for the prompt
+        for start in range(0, len(text), MAX_PASSAGE_CHARS):
+            yield Passage(source, section, text[start:start + MAX_PASSAGE_CHARS])
+
+
+def _pdf_passages(path):
+    source = os.path.basename(path)
+    for number, text in enumerate(pdf_text.pdf_pages(path), start=1):
+        if text:
+            yield Passage(source, f'Page {number}', text[:MAX_PASSAGE_CHARS])
+
+
+def collect_passages(docs_dir=DOCS_DIR):
+    passages = []
+    for name in sorted(os.listdir(docs_dir)):
+        path = os.path.join(docs_dir, name)
+        if name.lower().endswith('.md'):
+            passages.extend(_markdown_passages(path))
+        elif name.lower().endswith('.pdf'):
+            passages.extend(_pdf_passages(path))
+    return passages
+
+
+def _pad4(buffer):
+    buffer.extend(b'\0' * (-len(buffer) % 4))
+
+
+def build(docs_dir=DOCS_DIR, path=INDEX_PATH):
+    """Build the index from the documents and write it atomically to path.
+
+    Layout (little-endian, every array 4-byte aligned):
+        MAGIC | uint32 header length | JSON header
+        uint32 doc_lengths[N]
+        uint32 postings[2 * P]            (passage id, term frequency) grouped by term
+        uint32 text_spans[2 * N]          (offset, length) into the text blob
+        UTF-8 text blob
+    """
+    passages = collect_passages(docs_dir)
+    postings = defaultdict(list)
+    doc_lengths = array.array('I')
+    for passage_id, passage in enumerate(passages):
+        tokens = tokenize(passage.text)
+        doc_lengths.append(len(tokens))
+        for term, count in Counter(tokens).items():
+            postings[term].append((passage_id, count))
+
+    vocab = {}
+    flat = array.array('I')
+    for term in sorted(postings):
+        vocab[term] = [len(flat) // 2, len(postings[term])]
+        for passage_id, count in postings[term]:
+            flat.extend((passage_id, count))
+
+    text_blob = bytearray()
+    spans = array.array('I')
+    for passage in passages:
+        encoded = passage.text.encode('utf-8')
+        spans.extend((len(text_blob), len(encoded)))
+        text_blob.extend(encoded)
+
+    header = json.dumps({
+        'documents_fingerprint': documents_fingerprint(docs_dir),
+        'count': len(passages),
+        'avgdl': (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0,
+        'postings': len(flat) // 2,
+        'titles': [[p.source, p.section] for p in passages],
+        'vocab': vocab,
+    }, separators=(',', ':')).encode('utf-8')
+
+    for arr in (doc_lengths, flat, spans):
+        if sys.byteorder != 'little':
+            arr.byteswap()
+    out = bytearray(MAGIC)
+    out.extend(struct.pack('<I', len(header)))
+    out.extend(header)
+    _pad4(out)
+    out.extend(doc_lengths.tobytes())
+    out.extend(flat.tobytes())
+    out.extend(spans.tobytes())
+    out.extend(text_blob)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(out)
+    os.replace(tmp_path, path)
+    print(f"Indexed {len(passages)} passages, {len(vocab)} terms ({len(out) / 1024:.0f} KB) -> {path}")
+    return len(passages)
+
+
+# --- searching --------------------------------------------------------------
+
+class SearchIndex:
+    """Read-only view of search_index.bin over an mmap."""
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a search index")
+        header_len = struct.unpack_from('<I', self._mmap, len(MAGIC))[0]
+        start = len(MAGIC) + 4
+        header = json.loads(self._mmap[start:start + header_len])
+        self.fingerprint = header['documents_fingerprint']
+        self.count = header['count']
+        self.avgdl = header['avgdl'] or 1.0
+        self.titles = header['titles']
+        self.vocab = header['vocab']
+
+        offset = start + header_len
+        offset += -offset % 4
+        view = memoryview(self._mmap)
+        self._doc_lengths = view[offset:offset + 4 * self.count].cast('I')
+        offset += 4 * self.count
+        self._postings = view[offset:offset + 8 * header['postings']].cast('I')
+        offset += 8 * header['postings']
+        self._spans = view[offset:offset + 8 * self.count].cast('I')
+        self._text_start = offset + 8 * self.count
+
+    def is_stale(self, docs_dir=DOCS_DIR):
+        return self.fingerprint != documents_fingerprint(docs_dir)
+
+    def text(self, passage_id):
+        offset, length = self._spans[2 * passage_id], self._spans[2 * passage_id + 1]
+        start = self._text_start + offset
+        return self._mmap[start:start + length].decode('utf-8')
+
+    def search(self, query, k=5, source=None):
+        """Top-k Passages by BM25 score, optionally only from one document."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            entry = self.vocab.get(term)
+            if not entry:
+                continue
+            first, df = entry
+            idf = math.log(1 + (self.count - df + 0.5) / (df + 0.5))
+            postings = self._postings[2 * first:2 * (first + df)]
+            for i in range(0, 2 * df, 2):
+                passage_id, tf = postings[i], postings[i + 1]
+                if source is not None and self.titles[passage_id][0] != source:
+                    continue
+                norm = K1 * (1 - B + B * self._doc_lengths[passage_id] / self.avgdl)
+                scores[passage_id] += idf * tf * (K1 + 1) / (tf + norm)
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [Passage(self.titles[pid][0], self.titles[pid][1], self.text(pid), score)
+                for pid, score in top]
+
+
+_index = None
+_index_mtime = None
+_lock = threading.Lock()
+
+
+def get_index(path=INDEX_PATH):
+    """The shared index, reopened when the file is rebuilt; None when it hasn't been built."""
+    global _index, _index_mtime
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+    with _lock:
+        if _index is None or mtime != _index_mtime:
+            try:
+                _index = SearchIndex(path)
+            except (OSError, ValueError) as e:
+                print(f"Error loading search index: {e}")
+                _index = None
+            _index_mtime = mtime
+            if _index is not None and _index.is_stale():
+                print("Search index is older than school_documents; run: python search_index.py build")
+        return _index
+
+
+def retrieve(query, k=4, min_score=1.0):
+    """Best passages for a question, or [] when there is no index or nothing relevant."""
+    index = get_index()
+    if index is None:
+        return []
+    return [p for p in index.search(query, k) if p.score >= min_score]
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('build', 'search'):
+        print('Usage: python search_index.py build | search "query"')
+        sys.exit(1)
+    if sys.argv[1] == 'build':
+        build()
+        return
+    for passage in SearchIndex().search(' '.join(sys.argv[2:]), k=5):
+        print(f"{passage.score:6.2f}  {passage.label()}")
+        print(f"        {' '.join(passage.text.split())[:160]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+const pageLoader = document.getElementById('pageLoader');
+window.addEventListener('load', () => {
+    if (pageLoader) {
+        pageLoader.classList.add('hidden');
+        setTimeout(() => pageLoader.remove(), 500);
+    }
+    document.body.classList.remove('is-loading');
+});
+
+// Profile modal functionality
+const profileIcon = document.getElementById('profileIcon');
+const profileModalOverlay = document.getElementById('profileModalOverlay');
+const profileForm = document.getElementById('profileForm');
+
+// Profile as last loaded (script.js fills it from /bootstrap on page load)
+let profileData = null;
+
+// Fill the profile form
+function applyProfile(data) {
+    profileData = data;
+    if (data.display_name) {
+        document.getElementById('profileDisplayName').value = data.display_name;
+    }
+    if (data.current_grade) {
+        document.getElementById('profileCurrentGrade').value = data.current_grade;
+    }
+    if (data.bio) {
+        document.getElementById('profileBio').value = data.bio;
+    }
+}
+
+// Load profile data
+async function loadProfile() {
+    try {
+        const response = await fetch('/profile');
+        applyProfile(await response.json());
+    } catch (error) {
+        console.error('Error loading profile:', error);
+    }
+}
+
+// Open profile modal (no request when the profile came with the page data)
+function openProfileModal() {
+    if (profileData) {
+        applyProfile(profileData);
+    } else {
+        loadProfile();
+    }
+    profileModalOverlay.classList.add('active');
+}
+
+if (profileIcon) {
+    profileIcon.addEventListener('click', openProfileModal);
+}
+
+// Mobile menu functionality
+const mobileMenuToggle = document.getElementById('mobileMenuToggle');
+const mobileMenu = document.getElementById('mobileMenu');
+const mobileProfileBtn = document.getElementById('mobileProfileBtn');
+const mobileDownloadBtn = document.getElementById('mobileDownloadBtn');
+const mobileReplayTutorialBtn = document.getElementById('mobileReplayTutorialBtn');
+
+if (mobileMenuToggle && mobileMenu) {
+    mobileMenuToggle.addEventListener('click', (e) => {
+        e.stopPropagation();
+        mobileMenu.classList.toggle('active');
+    });
+
+    // Close menu when clicking outside
+    document.addEventListener('click', (e) => {
+        if (mobileMenu.classList.contains('active') && 
+            !mobileMenu.contains(e.target) && 
+            !mobileMenuToggle.contains(e.target)) {
+            mobileMenu.classList.remove('active');
+        }
+    });
+}
+
+if (mobileProfileBtn) {
+    mobileProfileBtn.addEventListener('click', () => {
+        mobileMenu.classList.remove('active');
+        openProfileModal();
+    });
+}
+
+
+if (mobileDownloadBtn) {
+    mobileDownloadBtn.addEventListener('click', () => {
+        mobileMenu.classList.remove('active');
+        const downloadBtn = document.getElementById('downloadChatBtnBottom');
+        if (downloadBtn) downloadBtn.click();
+    });
+}
+
+if (mobileReplayTutorialBtn) {
+    mobileReplayTutorialBtn.addEventListener('click', () => {
+        mobileMenu.classList.remove('active');
+        if (typeof tutorialStart === 'function') {
+            tutorialStart();
+        }
+    });
+}
+
+
+// Close profile modal
+function closeProfileModal() {
+    profileModalOverlay.classList.remove('active');
+}
+
+// Close on overlay click
+profileModalOverlay.addEventListener('click', (e) => {
+    if (e.target === profileModalOverlay) {
+        closeProfileModal();
+    }
+});
+
+// Handle form submission
+profileForm.addEventListener('submit', async (e) => {
+    e.preventDefault();
+
+    const displayNameValue = document.getElementById('profileDisplayName').value;
+    const currentGradeValue = document.getElementById('profileCurrentGrade').value;
+    const bioValue = document.getElementById('profileBio').value;
+    const isTutorialProfileStep = typeof tutorialProfileStepRequired === 'function' && tutorialProfileStepRequired();
+
+    if (isTutorialProfileStep) {
+        if (!displayNameValue.trim() || !currentGradeValue || !bioValue.trim()) {
+            alert('Please fill out every profile field to continue the tutorial. You can edit or clear them later.');
+            return;
+        }
+    }
+
+    const formData = {
+        display_name: displayNameValue,
+        current_grade: currentGradeValue ? parseInt(currentGradeValue) : null,
+        bio: bioValue
+    };
+
+    try {
+        const response = await fetch('/profile', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(formData)
+        });
+
+        const data = await response.json();
+
+        if (data.success) {
+            profileData = Object.assign({}, profileData, formData);
+            if (isTutorialProfileStep && typeof tutorialProfileStepCompleted === 'function') {
+                tutorialProfileStepCompleted({
+                    display_name: displayNameValue,
+                    current_grade: currentGradeValue,
+                    bio: bioValue
+                });
+                alert('Profile saved! Continue the tutorial.');
+                closeProfileModal();
+            } else {
+                alert('Profile updated successfully!');
+                closeProfileModal();
+                location.reload();
+            }
+        } else {
+            alert('Error updating profile: ' + (data.error || 'Unknown error'));
+        }
+    } catch (error) {
+        console.error('Error updating profile:', error);
+        alert('Error updating profile. Please try again.');
+    }
+});
+
+window.closeProfileModal = closeProfileModal;
@@ -0,0 +1,8 @@
+const pageLoader = document.getElementById('pageLoader');
+window.addEventListener('load', () => {
+    if (pageLoader) {
+        pageLoader.classList.add('hidden');
+        setTimeout(() => pageLoader.remove(), 500);
+    }
+    document.body.classList.remove('is-loading');
+});
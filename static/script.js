@@ -3,8 +3,11 @@ const chatMessages = document.getElementById('chatMessages');
 const userInput = document.getElementById('userInput');
 const sendButton = document.getElementById('sendButton');
 
-// Function to add a message to the chat
-function addMessage(message, isUser) {
+// Cursor for the next (older) page of history, or null when everything is loaded
+let historyCursor = null;
+
+// Function to build a message element
+function createMessageElement(message, isUser) {
     const messageDiv = document.createElement('div');
     messageDiv.className = `message ${isUser ? 'user-message' : 'bot-message'}`;
     
@@ -13,6 +16,12 @@ function addMessage(message, isUser) {
     contentDiv.innerHTML = message;
     
     messageDiv.appendChild(contentDiv);
+    return messageDiv;
+}
+
+// Function to add a message to the chat
+function addMessage(message, isUser) {
+    const messageDiv = createMessageElement(message, isUser);
     chatMessages.appendChild(messageDiv);
     
     // Add checkbox if in selection mode
@@ -53,35 +62,38 @@ function addCheckboxToMessage(messageDiv) {
     messageDiv.insertBefore(checkbox, messageDiv.firstChild);
 }
 
+// Function to show remaining messages ({remaining, is_unlimited}) in the header
+function applyMessageCounter(data) {
+    const userInfo = document.querySelector('.user-info');
+    if (userInfo) {
+        const parts = userInfo.textContent.split('•');
+        if (parts.length > 0) {
+            if (data.is_unlimited) {
+                userInfo.textContent = `${parts[0].trim()} • ∞ Unlimited messages`;
+            } else {
+                userInfo.textContent = `${parts[0].trim()} • 💬 ${data.remaining} messages left today`;
+            }
+        }
+    }
+
+    if (!data.is_unlimited && typeof data.remaining === 'number') {
+        if (data.remaining <= 0) {
+            sendButton.disabled = true;
+            userInput.disabled = true;
+            userInput.placeholder = "Daily message limit reached. Try again tomorrow!";
+        } else {
+            sendButton.disabled = false;
+            userInput.disabled = false;
+            userInput.placeholder = "Type your question here... (Shift+Enter for new line)";
+        }
+    }
+}
+
 // Function to update remaining messages counter
 function updateMessageCounter() {
     fetch('/get_remaining_messages')
         .then(response => response.json())
-        .then(data => {
-            const userInfo = document.querySelector('.user-info');
-            if (userInfo) {
-                const parts = userInfo.textContent.split('•');
-                if (parts.length > 0) {
-                    if (data.is_unlimited) {
-                        userInfo.textContent = `${parts[0].trim()} • ∞ Unlimited messages`;
-                    } else {
-                        userInfo.textContent = `${parts[0].trim()} • 💬 ${data.remaining} messages left today`;
-                    }
-                }
-            }
-
-            if (!data.is_unlimited && typeof data.remaining === 'number') {
-                if (data.remaining <= 0) {
-                    sendButton.disabled = true;
-                    userInput.disabled = true;
-                    userInput.placeholder = "Daily message limit reached. Try again tomorrow!";
-                } else {
-                    sendButton.disabled = false;
-                    userInput.disabled = false;
-                    userInput.placeholder = "Type your question here... (Shift+Enter for new line)";
-                }
-            }
-        })
+        .then(data => applyMessageCounter(data))
         .catch(error => console.error('Error updating counter:', error));
 }
 
@@ -89,26 +101,173 @@ function updateMessageCounter() {
 async function loadHistory() {
     try {
         const response = await fetch('/get_history');
-        const data = await response.json();
+        showHistory(await response.json());
+    } catch (error) {
+        console.error('Error loading history:', error);
+    }
+}
+
+// Show the newest page of history ({messages, next_cursor})
+function showHistory(data) {
+    if (data.messages && data.messages.length > 0) {
+        // Clear welcome message
+        chatMessages.innerHTML = '';
+        
+        // Add all previous messages
+        data.messages.forEach(msg => {
+            const isUser = msg.role === 'user';
+            addMessage(msg.content, isUser);
+        });
         
-        if (data.messages && data.messages.length > 0) {
-            // Clear welcome message
-            chatMessages.innerHTML = '';
-            
-            // Add all previous messages
-            data.messages.forEach(msg => {
-                const isUser = msg.role === 'user';
-                addMessage(msg.content, isUser);
+        // Re-add checkboxes if in selection mode
+        if (typeof selectionMode !== 'undefined' && selectionMode && typeof addCheckboxesToMessages !== 'undefined') {
+            setTimeout(() => addCheckboxesToMessages(), 100);
+        }
+
+        historyCursor = data.next_cursor || null;
+        updateLoadEarlierButton();
+    }
+}
+
+// Profile, quota and the first page of history in one request instead of one each
+async function loadBootstrap() {
+    try {
+        const response = await fetch('/bootstrap');
+        if (!response.ok) {
+            throw new Error(`Bootstrap request failed with status ${response.status}`);
+        }
+        const data = await response.json();
+        showHistory(data.history);
+        applyMessageCounter(data.quota);
+        if (typeof applyProfile === 'function') {
+            applyProfile(data.profile);
+        }
+    } catch (error) {
+        console.error('Error loading page data:', error);
+        loadHistory();
+        updateMessageCounter();
+    }
+}
+
+// Show a "Load earlier messages" button above the history while older pages exist
+function updateLoadEarlierButton() {
+    let button = document.getElementById('loadEarlierBtn');
+    if (!historyCursor) {
+        if (button) {
+            button.remove();
+        }
+        return;
+    }
+    if (!button) {
+        button = document.createElement('button');
+        button.id = 'loadEarlierBtn';
+        button.className = 'load-earlier-btn';
+        button.textContent = 'Load earlier messages';
+        button.addEventListener('click', loadEarlierHistory);
+    }
+    chatMessages.insertBefore(button, chatMessages.firstChild);
+}
+
+// Function to prepend the next page of older messages
+async function loadEarlierHistory() {
+    if (!historyCursor) {
+        return;
+    }
+    try {
+        const response = await fetch(`/get_history?before=${encodeURIComponent(historyCursor)}`);
+        const data = await response.json();
+        const button = document.getElementById('loadEarlierBtn');
+        const anchor = button ? button.nextSibling : chatMessages.firstChild;
+        const previousHeight = chatMessages.scrollHeight;
+
+        (data.messages || []).forEach(msg => {
+            chatMessages.insertBefore(createMessageElement(msg.content, msg.role === 'user'), anchor);
+        });
+
+        // Keep the student's place instead of jumping to the top
+        chatMessages.scrollTop += chatMessages.scrollHeight - previousHeight;
+
+        if (typeof selectionMode !== 'undefined' && selectionMode && typeof addCheckboxesToMessages !== 'undefined') {
+            addCheckboxesToMessages();
+        }
+
+        historyCursor = data.next_cursor || null;
+        updateLoadEarlierButton();
+    } catch (error) {
+        console.error('Error loading earlier history:', error);
+    }
+}
+
+// Read a text/event-stream response and call onEvent(name, data) for each event
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let eventName = 'message';
+            let data = '';
+            frame.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) {
+                    eventName = line.slice(7);
+                } else if (line.startsWith('data: ')) {
+                    data += line.slice(6);
+                }
             });
-            
-            // Re-add checkboxes if in selection mode
-            if (typeof selectionMode !== 'undefined' && selectionMode && typeof addCheckboxesToMessages !== 'undefined') {
-                setTimeout(() => addCheckboxesToMessages(), 100);
+            if (data) {
+                onEvent(eventName, JSON.parse(data));
             }
         }
+    }
+}
+
+// Show the bot reply and lock the input if the daily limit was hit
+function finishBotMessage(contentDiv, data) {
+    contentDiv.innerHTML = data.response;
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+
+    if (typeof data.remaining !== 'undefined') {
+        applyMessageCounter(data);
+    } else {
+        updateMessageCounter();
+    }
+
+    // Check if limit reached
+    if (data.limit_reached) {
+        sendButton.disabled = true;
+        userInput.disabled = true;
+        userInput.placeholder = "Daily message limit reached. Try again tomorrow!";
+    }
+}
+
+// "/plan 9: Algebra 1, Biology; 10: Geometry" is checked locally against the catalog, without the assistant
+async function checkCoursePlan(planText, botContent) {
+    try {
+        const response = await fetch('/plan/validate', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ text: planText })
+        });
+        const data = await response.json();
+        botContent.innerHTML = data.response || data.error;
     } catch (error) {
-        console.error('Error loading history:', error);
+        console.error('Error:', error);
+        botContent.innerHTML = 'Sorry, something went wrong. Please try again.';
     }
+    chatMessages.scrollTop = chatMessages.scrollHeight;
 }
 
 // Function to send message
@@ -129,39 +288,48 @@ async function sendMessage() {
     
     // Show "thinking" message
     addMessage('Thinking...', false);
+    const botContent = chatMessages.lastChild.querySelector('.message-content');
+
+    if (message.toLowerCase().startsWith('/plan')) {
+        await checkCoursePlan(message.slice(5), botContent);
+        return;
+    }
     
     try {
-        // Send to backend
-        const response = await fetch('/chat', {
+        // Stream the reply so the student sees text as soon as the assistant starts writing
+        const response = await fetch('/chat/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({ message: message })
         });
-        
-        const data = await response.json();
-        
-        // Remove "thinking" message
-        chatMessages.removeChild(chatMessages.lastChild);
-        
-        // Add bot response
-        addMessage(data.response, false);
-        
-        // Update message counter
-        updateMessageCounter();
-        
-        // Check if limit reached
-        if (data.limit_reached) {
-            sendButton.disabled = true;
-            userInput.disabled = true;
-            userInput.placeholder = "Daily message limit reached. Try again tomorrow!";
+
+        if (!response.ok || !response.body) {
+            throw new Error(`Stream request failed with status ${response.status}`);
+        }
+
+        let streamedText = '';
+        let finished = false;
+        await readEventStream(response, (eventName, data) => {
+            if (eventName === 'delta') {
+                // Plain text while streaming; the final event replaces it with formatted HTML
+                streamedText += data.text;
+                botContent.textContent = streamedText.replace(/【\d+:\d+†[^】]+】/g, '');
+                chatMessages.scrollTop = chatMessages.scrollHeight;
+            } else if (eventName === 'done') {
+                finished = true;
+                finishBotMessage(botContent, data);
+            }
+        });
+
+        if (!finished) {
+            throw new Error('Stream ended without a final event');
         }
         
     } catch (error) {
         console.error('Error:', error);
-        chatMessages.removeChild(chatMessages.lastChild);
-        addMessage('Sorry, something went wrong. Please try again.', false);
+        botContent.innerHTML = 'Sorry, something went wrong. Please try again.';
     }
 }
 
@@ -184,8 +352,7 @@ userInput.addEventListener('keydown', (event) => {
 
 // Load chat history when page loads
 window.addEventListener('DOMContentLoaded', () => {
-    loadHistory();
-    updateMessageCounter();
+    loadBootstrap();
     
     // Handle PDF download links with confirmation (using event delegation for dynamically added content)
     document.addEventListener('click', function(e) {
@@ -0,0 +1,36 @@
+const pageLoader = document.getElementById('pageLoader');
+window.addEventListener('load', () => {
+    if (pageLoader) {
+        pageLoader.classList.add('hidden');
+        setTimeout(() => pageLoader.remove(), 500);
+    }
+    document.body.classList.remove('is-loading');
+});
+
+// Check if passwords match
+const passwordInput = document.getElementById('password');
+const confirmPasswordInput = document.getElementById('confirm_password');
+const passwordMismatch = document.getElementById('passwordMismatch');
+const form = document.querySelector('form');
+
+function checkPasswords() {
+    if (confirmPasswordInput.value && passwordInput.value !== confirmPasswordInput.value) {
+        passwordMismatch.style.display = 'block';
+        confirmPasswordInput.setCustomValidity('Passwords do not match');
+    } else {
+        passwordMismatch.style.display = 'none';
+        confirmPasswordInput.setCustomValidity('');
+    }
+}
+
+passwordInput.addEventListener('input', checkPasswords);
+confirmPasswordInput.addEventListener('input', checkPasswords);
+
+// Prevent form submission if passwords don't match
+form.addEventListener('submit', function(e) {
+    if (passwordInput.value !== confirmPasswordInput.value) {
+        e.preventDefault();
+        passwordMismatch.style.display = 'block';
+        confirmPasswordInput.focus();
+    }
+});
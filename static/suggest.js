@@ -0,0 +1,115 @@
+// Course and document title completions for the chat box (GET /suggest)
+document.addEventListener('DOMContentLoaded', () => {
+    const input = document.getElementById('userInput');
+    const chatInput = document.querySelector('.chat-input');
+    if (!input || !chatInput) return;
+
+    const DEBOUNCE_MS = 120;
+    const list = document.createElement('ul');
+    list.id = 'suggestList';
+    list.className = 'suggest-list';
+    list.setAttribute('role', 'listbox');
+    list.hidden = true;
+    chatInput.appendChild(list);
+
+    let items = [];
+    let matched = '';
+    let active = -1;
+    let timer = null;
+    let controller = null;
+
+    function close() {
+        list.hidden = true;
+        list.innerHTML = '';
+        items = [];
+        active = -1;
+    }
+
+    function highlight(index) {
+        active = index;
+        Array.from(list.children).forEach((li, i) => li.classList.toggle('active', i === index));
+    }
+
+    function render() {
+        list.innerHTML = '';
+        items.forEach((item, i) => {
+            const li = document.createElement('li');
+            li.setAttribute('role', 'option');
+            li.textContent = item.label;
+            const kind = document.createElement('span');
+            kind.className = 'suggest-kind';
+            kind.textContent = item.kind === 'course' ? (item.course_number || 'course') : 'document';
+            li.appendChild(kind);
+            // mousedown so the textarea keeps focus
+            li.addEventListener('mousedown', (event) => {
+                event.preventDefault();
+                accept(i);
+            });
+            list.appendChild(li);
+        });
+        list.hidden = items.length === 0;
+    }
+
+    function accept(index) {
+        const item = items[index];
+        if (!item) return;
+        // Replace the words the server matched ("ap calc") with the full title
+        const words = Array.from(input.value.matchAll(/[A-Za-z0-9]+/g));
+        const count = matched.split(' ').length;
+        const start = words.length >= count ? words[words.length - count].index : input.value.length;
+        input.value = input.value.slice(0, start) + item.label + ' ';
+        input.setSelectionRange(input.value.length, input.value.length);
+        close();
+        input.focus();
+    }
+
+    async function fetchSuggestions() {
+        const text = input.value;
+        if (text.trim().length < 3 || text.startsWith('/')) {
+            close();
+            return;
+        }
+        if (controller) controller.abort();
+        controller = new AbortController();
+        try {
+            const response = await fetch('/suggest?q=' + encodeURIComponent(text.slice(-200)), {
+                signal: controller.signal
+            });
+            if (!response.ok) return;
+            const data = await response.json();
+            // The box may have changed while the request was in flight
+            if (input.value !== text) return;
+            matched = data.matched;
+            items = data.suggestions || [];
+            active = -1;
+            render();
+        } catch (error) {
+            if (error.name !== 'AbortError') close();
+        }
+    }
+
+    input.addEventListener('input', () => {
+        clearTimeout(timer);
+        timer = setTimeout(fetchSuggestions, DEBOUNCE_MS);
+    });
+
+    // Capture phase so an accepted Enter never reaches script.js's send handler
+    input.addEventListener('keydown', (event) => {
+        if (list.hidden) return;
+        if (event.key === 'ArrowDown' || event.key === 'ArrowUp') {
+            event.preventDefault();
+            const step = event.key === 'ArrowDown' ? 1 : -1;
+            highlight((active + step + items.length) % items.length);
+        } else if (event.key === 'Tab' || (event.key === 'Enter' && !event.shiftKey && active >= 0)) {
+            event.preventDefault();
+            event.stopImmediatePropagation();
+            accept(active >= 0 ? active : 0);
+        } else if (event.key === 'Escape') {
+            close();
+        } else if (event.key === 'Enter') {
+            close();
+        }
+    }, true);
+
+    input.addEventListener('blur', close);
+});
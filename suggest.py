@@ -0,0 +1,134 @@
+"""
+Course-name and document-title completions for the chat box.
+
+/suggest runs on every keystroke, so lookups must stay far below 10 ms.
+Every course title from the catalog and every school_documents filename is
+inserted into a prefix trie once per worker, starting at each word, so
+"calc" completes to "AP Calculus AB" as well as "Calculus". Each trie node
+keeps its best few completions precomputed, so a lookup is one walk down
+the trie. The index is rebuilt when a file in school_documents changes.
+"""
+import os
+import re
+import threading
+from typing import NamedTuple, Optional
+
+import course_catalog
+from doc_index import DOCS_DIR, documents_fingerprint
+
+MAX_SUGGESTIONS = 8
+# Completions are tried for the last few words the student typed ("can I take ap calc" -> "ap calc")
+MAX_TAIL_WORDS = 4
+MIN_PREFIX_CHARS = 3
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+class Suggestion(NamedTuple):
+    label: str
+    kind: str                      # 'course' or 'document'
+    course_number: Optional[str] = None
+    filename: Optional[str] = None
+
+
+class _Node:
+    __slots__ = ('children', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.top = []   # [(rank, entry index)] best first, at most MAX_SUGGESTIONS
+
+
+def _words(text):
+    return _WORD.findall(text.lower())
+
+
+class PrefixTrie:
+    """Character trie over the words of each label; completions ranked at insert time."""
+
+    def __init__(self):
+        self.root = _Node()
+        self.entries = []
+
+    def add(self, entry, text):
+        index = len(self.entries)
+        self.entries.append(entry)
+        words = _words(text)
+        for start in range(len(words)):
+            # Matches at the start of the label rank first, then shorter labels
+            rank = (start > 0, len(text), text.lower())
+            node = self.root
+            for char in ' '.join(words[start:]):
+                node = node.children.setdefault(char, _Node())
+                self._offer(node, rank, index)
+
+    @staticmethod
+    def _offer(node, rank, index):
+        for position, (existing_rank, existing) in enumerate(node.top):
+            if existing == index:
+                if rank >= existing_rank:
+                    return
+                del node.top[position]
+                break
+        node.top.append((rank, index))
+        node.top.sort()
+        del node.top[MAX_SUGGESTIONS:]
+
+    def complete(self, prefix, limit=MAX_SUGGESTIONS):
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return [self.entries[index] for _, index in node.top[:limit]]
+
+
+def build_trie(docs_dir=DOCS_DIR):
+    trie = PrefixTrie()
+    seen = set()
+    catalog_path = course_catalog.find_catalog(docs_dir)
+    if catalog_path:
+        for course in course_catalog.parse_catalog(catalog_path):
+            if course['title'].lower() not in seen:
+                seen.add(course['title'].lower())
+                number = course['course_number'].split(', ')[0] if course['course_number'] else None
+                trie.add(Suggestion(course['title'], 'course', course_number=number), course['title'])
+    if os.path.isdir(docs_dir):
+        for filename in sorted(os.listdir(docs_dir)):
+            title = ' '.join(os.path.splitext(filename)[0].replace('_', ' ').split())
+            if title and not filename.startswith('.'):
+                trie.add(Suggestion(title, 'document', filename=filename), title)
+    return trie
+
+
+class SuggestIndex:
+    """The trie for one school_documents folder, rebuilt when the folder changes."""
+
+    def __init__(self, docs_dir=DOCS_DIR):
+        self.docs_dir = docs_dir
+        self._lock = threading.Lock()
+        self._trie = None
+        self._fingerprint = None
+
+    def trie(self):
+        # Names, sizes and mtimes of ~15 files: a few microseconds, and catches in-place edits
+        fingerprint = documents_fingerprint(self.docs_dir)
+        with self._lock:
+            if self._trie is None or fingerprint != self._fingerprint:
+                self._trie = build_trie(self.docs_dir)
+                self._fingerprint = fingerprint
+            return self._trie
+
+    def suggest(self, text, limit=MAX_SUGGESTIONS):
+        """(matched tail of text, [Suggestion]) for the longest trailing phrase with completions."""
+        words = _words(text)
+        if not words or text[-1:].isspace():
+            return '', []
+        trie = self.trie()
+        for count in range(min(MAX_TAIL_WORDS, len(words)), 0, -1):
+            prefix = ' '.join(words[-count:])
+            if len(prefix) < MIN_PREFIX_CHARS:
+                continue
+            found = trie.complete(prefix, limit)
+            if found:
+                return prefix, found
+        return '', []
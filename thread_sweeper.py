@@ -0,0 +1,178 @@
+"""
+Background cleanup of expired conversation threads.
+
+Each conversation lives for 7 days. /chat used to delete the old OpenAI
+thread inline before creating a new one, which put an extra API round trip
+on the student's first message of the week. Now /chat only swaps in a new
+thread ID and queues the old one in expired_threads; this sweeper deletes
+queued threads in batches with a bounded number of concurrent API calls.
+It also retires threads of students who have not come back, found with an
+indexed range query on users.thread_created_at.
+
+Run from a console or the PythonAnywhere Tasks tab:
+    python3.10 thread_sweeper.py                  # one pass
+    python3.10 thread_sweeper.py --loop 3600      # keep running, once an hour
+"""
+import argparse
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import chat_history
+import db
+
+THREAD_MAX_AGE = timedelta(days=7)
+BATCH_SIZE = 50
+CONCURRENCY = 4
+MAX_ATTEMPTS = 5
+
+
+def is_expired(thread_created_at, now=None):
+    """True when a conversation started at thread_created_at (ISO string) is past its 7 days."""
+    if not thread_created_at:
+        return False
+    now = now or datetime.now()
+    return now - datetime.fromisoformat(thread_created_at) > THREAD_MAX_AGE
+
+
+def queue_thread(conn, thread_id, user_id):
+    """Add a thread to the deletion queue (inside the caller's transaction)."""
+    conn.execute(
+        'INSERT OR IGNORE INTO expired_threads (thread_id, user_id, expired_at) VALUES (?, ?, ?)',
+        (thread_id, user_id, int(time.time()))
+    )
+
+
+def replace_thread(user_id, old_thread_id, new_thread_id, created_at):
+    """Point the user at a new thread and queue the old one, atomically.
+
+    Returns False when the queue table is missing, so the caller can clean
+    up the old thread another way.
+    """
+    try:
+        with db.transaction() as conn:
+            if old_thread_id:
+                queue_thread(conn, old_thread_id, user_id)
+            conn.execute('UPDATE users SET thread_id = ?, thread_created_at = ? WHERE id = ?',
+                         (new_thread_id, created_at, user_id))
+        return True
+    except sqlite3.OperationalError as e:
+        print(f"Error queueing expired thread {old_thread_id}: {e}")
+        db.update_user_fields(user_id, thread_id=new_thread_id, thread_created_at=created_at)
+        return False
+
+
+def retire_expired_users(now=None, batch_size=BATCH_SIZE):
+    """Move expired threads of inactive users into the queue. Returns how many were retired.
+
+    The next /chat from these users starts a fresh thread. The thread_id guard
+    in the UPDATE leaves alone any user whose thread /chat swapped meanwhile.
+    """
+    cutoff = ((now or datetime.now()) - THREAD_MAX_AGE).isoformat()
+    retired = 0
+    while True:
+        # Uses idx_users_thread_created_at; ISO timestamps sort as text
+        rows = db.query_all(
+            '''SELECT id, thread_id FROM users
+               WHERE thread_created_at < ? AND thread_id IS NOT NULL
+               ORDER BY thread_created_at LIMIT ?''',
+            (cutoff, batch_size)
+        )
+        if not rows:
+            return retired
+        with db.transaction() as conn:
+            for user_id, thread_id in rows:
+                queue_thread(conn, thread_id, user_id)
+                conn.execute(
+                    'UPDATE users SET thread_id = NULL, thread_created_at = NULL WHERE id = ? AND thread_id = ?',
+                    (user_id, thread_id)
+                )
+        retired += len(rows)
+        if len(rows) < batch_size:
+            return retired
+
+
+def _delete_one(client, thread_id):
+    """Delete one thread from OpenAI. Returns (thread_id, error or None)."""
+    from openai import NotFoundError
+    try:
+        client.beta.threads.delete(thread_id=thread_id)
+    except NotFoundError:
+        pass  # Already gone
+    except Exception as e:
+        return thread_id, e
+    return thread_id, None
+
+
+def delete_thread_now(client, thread_id):
+    """Delete a single thread right away (used when the queue table is missing)."""
+    _, error = _delete_one(client, thread_id)
+    if error is not None:
+        print(f"Error deleting thread {thread_id}: {error}")
+        return False
+    chat_history.delete_thread(thread_id)
+    return True
+
+
+def delete_queued_threads(client, batch_size=BATCH_SIZE, concurrency=CONCURRENCY):
+    """Delete queued threads from OpenAI and drop their local history. Returns (deleted, failed)."""
+    deleted = failed = 0
+    skip_ids = set()  # failed during this pass; retried next run
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='sweeper') as pool:
+        while True:
+            rows = db.query_all(
+                'SELECT thread_id FROM expired_threads WHERE attempts < ? ORDER BY expired_at LIMIT ?',
+                (MAX_ATTEMPTS, batch_size + len(skip_ids))
+            )
+            batch = [row[0] for row in rows if row[0] not in skip_ids][:batch_size]
+            if not batch:
+                return deleted, failed
+
+            for thread_id, error in pool.map(lambda t: _delete_one(client, t), batch):
+                if error is None:
+                    chat_history.delete_thread(thread_id)
+                    db.execute('DELETE FROM expired_threads WHERE thread_id = ?', (thread_id,))
+                    deleted += 1
+                else:
+                    print(f"Error deleting thread {thread_id}: {error}")
+                    db.execute('UPDATE expired_threads SET attempts = attempts + 1 WHERE thread_id = ?', (thread_id,))
+                    skip_ids.add(thread_id)
+                    failed += 1
+
+
+def sweep(client, batch_size=BATCH_SIZE, concurrency=CONCURRENCY):
+    """One full pass: retire expired threads, then delete everything queued."""
+    retired = retire_expired_users(batch_size=batch_size)
+    deleted, failed = delete_queued_threads(client, batch_size, concurrency)
+    print(f"Thread sweep: {retired} retired, {deleted} deleted, {failed} failed")
+    return retired, deleted, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Delete expired conversation threads.')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY,
+                        help='Maximum parallel delete calls to OpenAI')
+    parser.add_argument('--loop', type=int, metavar='SECONDS',
+                        help='Keep running, sweeping every SECONDS')
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from openai import OpenAI
+    load_dotenv()
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    while True:
+        try:
+            sweep(client, args.batch_size, args.concurrency)
+        except sqlite3.OperationalError as e:
+            print(f"Thread sweep failed: {e} (has migration_add_expired_threads.py been run?)")
+        if not args.loop:
+            break
+        time.sleep(args.loop)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,60 @@
+"""
+Sync school_documents into the assistant's vector store.
+
+Only new or changed files are uploaded: ingest_manifest.json records the
+SHA-256, size and mtime of every file that has been ingested, together with
+its OpenAI file ID and the vector store / assistant it belongs to. Large
+Markdown sources are first split into section-sized files (doc_chunker.py),
+so only the sections that actually changed are re-uploaded. Changed
+files are uploaded concurrently and attached in a single file batch. Files
+that were deleted or replaced are removed from the vector store. The
+existing assistant is updated in place rather than recreated. The PDF text
+store (pdf_text.py), the local BM25 index (search_index.py), the cited-page
+PDF slices (pdf_slices.py), the gzip download variants (downloads.py), the
+courses table (course_catalog.py) and the prerequisite graph
+(prereq_graph.py) are rebuilt at the end so they match the uploaded
+documents.
+
+Usage:
+    python update_assistant_documents.py             # incremental sync
+    python update_assistant_documents.py --dry-run   # show what would change
+    python update_assistant_documents.py --full      # new vector store, upload everything
+    python update_assistant_documents.py --model gpt-4o-mini   # also switch the assistant's model
+"""
 from openai import OpenAI
-from openai import APIConnectionError, APIError, RateLimitError
+from openai import APIConnectionError, InternalServerError, NotFoundError, RateLimitError
+import argparse
+import hashlib
+import json
 import os
+import sqlite3
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from assistant_instructions import NEW_INSTRUCTIONS as SHARED_INSTRUCTIONS
+from doc_index import DocumentIndex
+from doc_chunker import needs_chunking, prune_chunk_dirs, write_chunks
+import pdf_slices
+import pdf_text
+import search_index
+import course_catalog
+import downloads
+import prereq_graph
 
 load_dotenv()
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 ASSISTANT_ID = os.getenv("OPENAI_ASSISTANT_ID")
 
 DOCS_DIR = "school_documents"
+CHUNKS_DIR = "school_documents_chunks"
 ALLOWED_EXTENSIONS = {".pdf", ".md"}
+MANIFEST_PATH = "ingest_manifest.json"
+UPLOAD_CONCURRENCY = 5
+MAX_BATCH_FILES = 500  # file_batches limit per request
+VECTOR_STORE_NAME = "Emerald High School Docs"
+# Model for a newly created assistant when neither --model nor the manifest names one (see fix_cost.py)
+DEFAULT_MODEL = "gpt-4o-mini"
 
 def get_vector_stores_client():
     """Support both beta and non-beta SDKs."""
@@ -45,81 +88,333 @@ def collect_files():
         raise FileNotFoundError(f"Missing folder: {DOCS_DIR}")
 
     file_paths = []
+    chunked_sources = []
     for filename in os.listdir(DOCS_DIR):
         ext = os.path.splitext(filename)[1].lower()
         if ext in ALLOWED_EXTENSIONS:
-            file_paths.append(os.path.join(DOCS_DIR, filename))
+            path = os.path.join(DOCS_DIR, filename)
+            if needs_chunking(path):
+                # Upload large Markdown as section-sized files instead of one monolith
+                chunk_paths = write_chunks(path, CHUNKS_DIR)
+                print(f"Split {filename} into {len(chunk_paths)} sections")
+                file_paths.extend(chunk_paths)
+                chunked_sources.append(filename)
+            else:
+                file_paths.append(path)
+    prune_chunk_dirs(CHUNKS_DIR, chunked_sources)
 
     if not file_paths:
         raise ValueError(f"No files found in {DOCS_DIR} with extensions: {ALLOWED_EXTENSIONS}")
 
     return sorted(file_paths)
 
-def main():
-    print("Creating new assistant with new documents...")
-    file_paths = collect_files()
-    print(f"Found {len(file_paths)} files to upload.")
-    sys.stdout.flush()
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as stream:
+        for block in iter(lambda: stream.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
-    vector_stores_client = get_vector_stores_client()
-    if not vector_stores_client:
-        raise AttributeError("OpenAI SDK does not support vector stores. Update openai package.")
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {"vector_store_id": None, "assistant_id": None, "files": {}}
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    manifest.setdefault("files", {})
+    return manifest
 
-    # Create a new vector store for the updated docs
-    vector_store = vector_stores_client.create(
-        name="Emerald High School Docs"
-    )
+def save_manifest(manifest):
+    tmp_path = f"{MANIFEST_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
 
-    # Upload files with retries to avoid transient connection issues
-    for idx, path in enumerate(file_paths, start=1):
+def scan_documents(file_paths, known):
+    """filename -> {sha256, size, mtime, path}; reuses the stored hash when size and mtime match."""
+    current = {}
+    for path in file_paths:
         filename = os.path.basename(path)
-        size_mb = os.path.getsize(path) / (1024 * 1024)
-        for attempt in range(1, 4):
-            try:
-                print(f"[{idx}/{len(file_paths)}] Uploading {filename} ({size_mb:.1f} MB)...")
-                sys.stdout.flush()
-                with open(path, "rb") as stream:
-                    vector_stores_client.file_batches.upload_and_poll(
-                        vector_store_id=vector_store.id,
-                        files=[stream]
-                    )
-                print(f"[{idx}/{len(file_paths)}] Uploaded {filename}")
-                sys.stdout.flush()
-                break
-            except (APIConnectionError, APIError, RateLimitError) as e:
-                if attempt == 3:
-                    raise
-                wait = 2 ** attempt
-                print(f"Retry {attempt}/3 for {filename} in {wait}s (error: {e})")
-                sys.stdout.flush()
-                time.sleep(wait)
+        stat = os.stat(path)
+        entry = {"size": stat.st_size, "mtime": int(stat.st_mtime), "path": path}
+        previous = known.get(filename)
+        if previous and previous.get("size") == entry["size"] and previous.get("mtime") == entry["mtime"]:
+            entry["sha256"] = previous["sha256"]
+        else:
+            entry["sha256"] = file_sha256(path)
+        current[filename] = entry
+    return current
 
-    # Create a brand-new assistant using the shared 2026-2027 instructions
+def with_retries(label, fn):
+    """Call fn(), retrying transient API errors with exponential backoff.
+
+    Other API errors (404, 400, ...) won't go away on retry and are raised at once.
+    """
+    for attempt in range(1, 4):
+        try:
+            return fn()
+        except (APIConnectionError, RateLimitError, InternalServerError) as e:
+            if attempt == 3:
+                raise
+            wait = 2 ** attempt
+            print(f"Retry {attempt}/3 for {label} in {wait}s (error: {e})")
+            sys.stdout.flush()
+            time.sleep(wait)
+
+def assistant_vector_store_id(assistant):
+    file_search = getattr(assistant.tool_resources, "file_search", None) if assistant and assistant.tool_resources else None
+    ids = file_search.vector_store_ids if file_search else []
+    return ids[0] if ids else None
+
+def adopt_existing_files(vector_stores_client, vector_store_id, manifest, current):
+    """First run against an existing vector store: adopt files whose name and size already match.
+
+    Saves re-uploading everything just because no manifest exists yet.
+    """
+    adopted = 0
+    for file_obj in vector_stores_client.files.list(vector_store_id=vector_store_id, limit=100):
+        try:
+            detail = client.files.retrieve(file_obj.id)
+        except NotFoundError:
+            continue
+        local = current.get(detail.filename)
+        if local and detail.filename not in manifest["files"] and detail.bytes == local["size"]:
+            manifest["files"][detail.filename] = {
+                "sha256": local["sha256"], "size": local["size"], "mtime": local["mtime"], "file_id": file_obj.id,
+            }
+            adopted += 1
+        else:
+            # Deleted locally, changed size, or a duplicate upload; track it so it is removed below
+            manifest["files"][f"(stale) {detail.filename} {file_obj.id}"] = {"sha256": None, "file_id": file_obj.id}
+    return adopted
+
+def upload_file(filename, path, idx, total):
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    print(f"[{idx}/{total}] Uploading {filename} ({size_mb:.1f} MB)...")
+    sys.stdout.flush()
+
+    def create():
+        with open(path, "rb") as stream:
+            return client.files.create(file=stream, purpose="assistants")
+
+    uploaded = with_retries(filename, create)
+    print(f"[{idx}/{total}] Uploaded {filename} -> {uploaded.id}")
+    sys.stdout.flush()
+    return filename, uploaded.id
+
+def batch_failures(vector_stores_client, vector_store_id, batch_id):
+    """file_id -> reason for every file in a finished batch that didn't complete."""
+    failures = {}
+    for vs_file in vector_stores_client.file_batches.list_files(batch_id, vector_store_id=vector_store_id, limit=100):
+        if vs_file.status != "completed":
+            error = vs_file.last_error
+            failures[vs_file.id] = f"{vs_file.status}" + (f" ({error.code}: {error.message})" if error else "")
+    return failures
+
+def remove_file(vector_stores_client, vector_store_id, label, file_id):
+    print(f"Removing {label} ({file_id})")
+    try:
+        with_retries(label, lambda: vector_stores_client.files.delete(file_id=file_id, vector_store_id=vector_store_id))
+    except NotFoundError:
+        pass
     try:
-        existing = client.beta.assistants.retrieve(ASSISTANT_ID) if ASSISTANT_ID else None
-        name = existing.name if existing else "Emerald HS Counselor"
-        model = existing.model if existing else "gpt-4-turbo"
-    except Exception:
-        name = "Emerald HS Counselor"
-        model = "gpt-4-turbo"
+        with_retries(label, lambda: client.files.delete(file_id))
+    except NotFoundError:
+        pass
+
+def sync_assistant(vector_store_id, assistant_id, model=None, previous_model=None):
+    """Point the existing assistant at the vector store (creating one only if needed).
+
+    model changes the existing assistant's model when given. A new assistant
+    uses model, else the model of the assistant it replaces, else DEFAULT_MODEL.
+    """
+    existing = None
+    if assistant_id:
+        try:
+            existing = client.beta.assistants.retrieve(assistant_id)
+        except NotFoundError:
+            print(f"Assistant {assistant_id} not found; creating a new one")
 
+    tool_resources = {"file_search": {"vector_store_ids": [vector_store_id]}}
+    if existing:
+        assistant = client.beta.assistants.update(
+            existing.id,
+            instructions=SHARED_INSTRUCTIONS,
+            tools=[{"type": "file_search"}],
+            tool_resources=tool_resources,
+            **({"model": model} if model else {})
+        )
+        print(f"Assistant updated: {assistant.id} ({assistant.model})")
+        return assistant
+
+    # Create a brand-new assistant using the shared 2026-2027 instructions
     assistant = client.beta.assistants.create(
-        name=name,
+        name="Emerald HS Counselor",
         instructions=SHARED_INSTRUCTIONS,
-        model=model,
+        model=model or previous_model or DEFAULT_MODEL,
         tools=[{"type": "file_search"}],
-        tool_resources={
-            "file_search": {
-                "vector_store_ids": [vector_store.id]
-            }
-        }
+        tool_resources=tool_resources
     )
-
     update_env_assistant_id(assistant.id)
-
-    print(f"Assistant created: {assistant.id}")
-    print(f"Vector store attached: {vector_store.id}")
+    print(f"Assistant created: {assistant.id} ({assistant.model})")
     print(".env updated with assistant ID")
+    return assistant
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync school_documents into the assistant's vector store.")
+    parser.add_argument("--full", action="store_true", help="Create a new vector store and upload every file")
+    parser.add_argument("--dry-run", action="store_true", help="Print the plan without calling the API for changes")
+    parser.add_argument("--concurrency", type=int, default=UPLOAD_CONCURRENCY, help="Parallel uploads")
+    parser.add_argument("--model", default=os.getenv("OPENAI_ASSISTANT_MODEL"),
+                        help="Assistant model (default: $OPENAI_ASSISTANT_MODEL, else keep the current one)")
+    args = parser.parse_args()
+
+    file_paths = collect_files()
+    manifest = load_manifest()
+    assistant_id = manifest.get("assistant_id") or ASSISTANT_ID
+    if args.full:
+        manifest = {"vector_store_id": None, "assistant_id": assistant_id,
+                    "assistant_model": manifest.get("assistant_model"), "files": {}}
+
+    current = scan_documents(file_paths, manifest["files"])
+    print(f"Found {len(current)} documents in {DOCS_DIR}.")
+    sys.stdout.flush()
+
+    vector_stores_client = get_vector_stores_client()
+    if not vector_stores_client:
+        raise AttributeError("OpenAI SDK does not support vector stores. Update openai package.")
+
+    # Reuse the vector store from the manifest, or the one the assistant already uses
+    vector_store_id = manifest.get("vector_store_id")
+    if not vector_store_id and assistant_id and not args.full:
+        try:
+            vector_store_id = assistant_vector_store_id(client.beta.assistants.retrieve(assistant_id))
+        except NotFoundError:
+            vector_store_id = None
+        if vector_store_id:
+            adopted = adopt_existing_files(vector_stores_client, vector_store_id, manifest, current)
+            print(f"Adopted {adopted} files already in vector store {vector_store_id}")
+    if vector_store_id:
+        try:
+            vector_stores_client.retrieve(vector_store_id)
+        except NotFoundError:
+            print(f"Vector store {vector_store_id} no longer exists; starting a new one")
+            vector_store_id = None
+            manifest["files"] = {}
+
+    known = manifest["files"]
+    to_upload = sorted(name for name, entry in current.items()
+                       if name not in known or known[name].get("sha256") != entry["sha256"])
+    to_remove = sorted(name for name in known
+                       if name not in current or name in to_upload)
+
+    deleted = [name for name in to_remove if name not in current]
+    print(f"{len(to_upload)} new or changed, {len(deleted)} deleted, {len(current) - len(to_upload)} unchanged")
+    for name in to_upload:
+        print(f"  upload: {name}")
+    for name in to_remove:
+        print(f"  remove: {name}")
+    if args.dry_run:
+        return
+
+    if not vector_store_id:
+        vector_store_id = vector_stores_client.create(name=VECTOR_STORE_NAME).id
+        print(f"Created vector store {vector_store_id}")
+    manifest["vector_store_id"] = vector_store_id
+
+    # Upload all new/changed files concurrently, then attach them in one batch
+    uploaded = {}
+    failed_ids, failed = {}, set()
+    if to_upload:
+        with ThreadPoolExecutor(max_workers=max(args.concurrency, 1)) as pool:
+            futures = {name: pool.submit(upload_file, name, current[name]["path"], idx, len(to_upload))
+                       for idx, name in enumerate(to_upload, start=1)}
+            for name, future in futures.items():
+                # One failed upload must not strand the others: they are attached below as usual
+                try:
+                    filename, file_id = future.result()
+                except Exception as e:
+                    print(f"Upload failed for {name}: {e}")
+                    failed.add(name)
+                    continue
+                uploaded[filename] = file_id
+
+        file_ids = list(uploaded.values())
+        attached = set()
+        try:
+            for start in range(0, len(file_ids), MAX_BATCH_FILES):
+                batch_ids = file_ids[start:start + MAX_BATCH_FILES]
+                batch = with_retries("file batch", lambda: vector_stores_client.file_batches.create_and_poll(
+                    vector_store_id=vector_store_id,
+                    file_ids=batch_ids
+                ))
+                attached.update(batch_ids)
+                print(f"File batch {batch.id}: {batch.status} ({batch.file_counts.completed} completed, "
+                      f"{batch.file_counts.failed} failed)")
+                if batch.file_counts.completed < len(batch_ids):
+                    failed_ids.update(batch_failures(vector_stores_client, vector_store_id, batch.id))
+        except Exception:
+            # None of this run's uploads are in the manifest yet; remove them all so no file is orphaned
+            for filename, file_id in uploaded.items():
+                if file_id in attached:
+                    remove_file(vector_stores_client, vector_store_id, filename, file_id)
+                else:
+                    try:
+                        with_retries(filename, lambda: client.files.delete(file_id))
+                    except NotFoundError:
+                        pass
+            raise
+
+        # Files the vector store couldn't process stay out of the manifest so the next run uploads them again
+        for filename, file_id in list(uploaded.items()):
+            if file_id in failed_ids:
+                print(f"Not recording {filename}: {failed_ids[file_id]}")
+                remove_file(vector_stores_client, vector_store_id, filename, file_id)
+                del uploaded[filename]
+                failed.add(filename)
+
+    # Drop deleted files and the old versions of replaced ones (kept when the replacement failed)
+    for name in to_remove:
+        if name in failed:
+            continue
+        file_id = known[name].get("file_id")
+        if file_id:
+            remove_file(vector_stores_client, vector_store_id, name, file_id)
+        known.pop(name, None)
+
+    for filename, file_id in uploaded.items():
+        entry = current[filename]
+        known[filename] = {"sha256": entry["sha256"], "size": entry["size"], "mtime": entry["mtime"], "file_id": file_id}
+    # Files whose content is unchanged but were touched keep their hash; refresh mtime so they aren't re-hashed
+    # (not failed replacements: their kept entry must still look changed on the next run)
+    for filename, entry in current.items():
+        if filename in known and filename not in failed:
+            known[filename].update(size=entry["size"], mtime=entry["mtime"])
+
+    assistant = sync_assistant(vector_store_id, assistant_id, args.model, manifest.get("assistant_model"))
+    manifest["assistant_id"] = assistant.id
+    manifest["assistant_model"] = assistant.model
+    save_manifest(manifest)
+
+    # Record file_id -> local filename so citation links need no API calls (no listing needed)
+    DocumentIndex().replace_all({entry["file_id"]: filename for filename, entry in known.items()})
+
+    print(f"Vector store attached: {vector_store_id}")
+    print(f"{MANIFEST_PATH} and file_id_mapping.json updated")
+
+    # Local passages added to each run come from the same documents
+    pdf_text.build()
+    search_index.build()
+    pdf_slices.build()
+    downloads.build()
+    try:
+        course_catalog.build()
+    except sqlite3.OperationalError as e:
+        print(f"Skipping course catalog table ({e}); run migration_add_courses.py")
+    prereq_graph.build()
+
+    if failed:
+        print(f"{len(failed)} files failed and kept their previous version; run again to retry: {', '.join(sorted(failed))}")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()